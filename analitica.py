@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""
+Estadísticas de los trades cerrados mantenidas de forma incremental.
+
+Cada cierre suma su resultado a unos agregados por día de cierre y grupo:
+total, lado, símbolo, hora de entrada (UTC) y tramos de los campos de entrada
+que guarda cada trade (RSI, ADX, vol_ratio, efficiency ratio, alineación H1,
+contexto de EMAs...). TradeStore los actualiza en la misma transacción que el
+cierre, así un informe diario, semanal o de cualquier rango solo suma unas
+pocas filas por día, sin recorrer el histórico de trades.
+
+Por grupo se guardan: trades, ganadoras (pnl > 0), cierres TP / SL, pnl total,
+suma de ganancias y de pérdidas; de ahí salen el acierto, la esperanza (pnl
+medio por trade) y el factor de beneficio.
+
+    python analitica.py --desde 2024-05-01 --dimension rsi --dimension hora
+"""
+import argparse
+import bisect
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+from estrategia import pnl_pct
+
+# Dimensión -> (campo del trade, límites de los tramos)
+TRAMOS = {
+    'rsi': ('rsi_entry', (30, 40, 50, 60, 70, 80)),
+    'adx': ('adx_entry', (15, 20, 25, 30, 40, 50)),
+    'vol_ratio': ('vol_ratio_entry', (0.5, 1, 1.5, 2, 3)),
+    'efficiency_ratio': ('efficiency_ratio_entry', (0.1, 0.2, 0.3, 0.5)),
+    'vol_pct_change': ('vol_pct_change_entry', (-50, 0, 50, 100, 200)),
+}
+# Dimensión -> campo categórico (booleanos y zona del SHORT)
+CATEGORIAS = {
+    'h1_alineado': 'h1_trend_aligned_entry',
+    'ema_100': 'ema_100_context',
+    'ema_200': 'ema_200_context',
+    'ema_8_bajo_24': 'ema_8_below_24_entry',
+    'zona_short': 'short_entry_zone',
+}
+DIMENSIONES = ('total', 'lado', 'symbol', 'hora') + tuple(TRAMOS) + tuple(CATEGORIAS)
+COLUMNAS_AGREGADO = ('n', 'ganadoras', 'tp', 'sl', 'suma_pnl', 'ganancias', 'perdidas')
+SIN_DATO = 'sin_dato'
+
+
+def tramo(valor, limites):
+    """'<30', '30-40', ..., '>=80' según los límites (SIN_DATO si falta el valor)."""
+    if valor is None or (isinstance(valor, float) and np.isnan(valor)): return SIN_DATO
+    k = bisect.bisect_right(limites, valor)
+    if k == 0: return f"<{limites[0]:g}"
+    if k == len(limites): return f">={limites[-1]:g}"
+    return f"{limites[k - 1]:g}-{limites[k]:g}"
+
+
+def grupos_trade(trade):
+    """[(dimension, grupo)] a los que suma el trade, en el orden de DIMENSIONES."""
+    entry_date = trade.get('entry_date') or ''
+    grupos = [('total', 'total'), ('lado', trade.get('entry_type') or SIN_DATO),
+              ('symbol', trade.get('symbol') or SIN_DATO),
+              ('hora', entry_date[11:13] if len(entry_date) >= 13 else SIN_DATO)]
+    grupos += [(dim, tramo(trade.get(campo), limites)) for dim, (campo, limites) in TRAMOS.items()]
+    grupos += [(dim, SIN_DATO if trade.get(campo) is None else str(trade[campo])) for dim, campo in CATEGORIAS.items()]
+    return grupos
+
+
+def resultado_trade(trade):
+    """pnl % del trade cerrado (0 si le falta el precio de entrada o de cierre)."""
+    try: return pnl_pct(trade['entry_type'], float(trade['entry_price']), float(trade['close_price']))
+    except (KeyError, TypeError, ValueError, ZeroDivisionError): return 0.0
+
+
+def contribucion(trade):
+    """Lo que suma el trade a cada columna de COLUMNAS_AGREGADO."""
+    pnl = resultado_trade(trade)
+    return (1, int(pnl > 0), int(trade.get('status') == 'CLOSED_TP'), int(trade.get('status') == 'CLOSED_SL'),
+            pnl, max(pnl, 0.0), max(-pnl, 0.0))
+
+
+def filas_agregado(symbol, trade):
+    """Filas (dia, dimension, grupo, *contribucion) del cierre de un trade."""
+    trade = dict(trade, symbol=symbol)
+    dia, suma = (trade.get('close_date') or '')[:10] or SIN_DATO, contribucion(trade)
+    return [(dia, dimension, grupo) + suma for dimension, grupo in grupos_trade(trade)]
+
+
+def rango_semana(hoy):
+    """[lunes, lunes siguiente) de la semana ISO anterior a 'hoy' (fechas 'AAAA-MM-DD')."""
+    lunes = datetime.strptime(hoy, "%Y-%m-%d").date()
+    lunes -= timedelta(days=lunes.weekday() + 7)
+    return lunes.isoformat(), (lunes + timedelta(days=7)).isoformat()
+
+
+# ==============================================================================
+# INFORMES
+# ==============================================================================
+
+def tabla(agregados, min_trades=1):
+    """DataFrame por (dimension, grupo) con trades, acierto %, esperanza %, pnl total y factor de beneficio."""
+    filas = [dict(zip(COLUMNAS_AGREGADO, valores), dimension=dimension, grupo=grupo)
+             for (dimension, grupo), valores in agregados.items()]
+    columnas = ['dimension', 'grupo', 'trades', 'acierto', 'esperanza', 'pnl_total', 'factor_beneficio', 'tp', 'sl']
+    if not filas: return pd.DataFrame(columns=columnas)
+    df = pd.DataFrame(filas)
+    df = df[df['n'] >= min_trades]
+    df = df.assign(trades=df['n'], acierto=df['ganadoras'] / df['n'] * 100, esperanza=df['suma_pnl'] / df['n'],
+                   pnl_total=df['suma_pnl'], factor_beneficio=df['ganancias'] / df['perdidas'].replace(0, np.nan))
+    orden = {d: i for i, d in enumerate(DIMENSIONES)}
+    df = df.assign(_orden=df['dimension'].map(orden).fillna(len(orden))).sort_values(['_orden', 'esperanza'], ascending=[True, False])
+    return df[columnas].reset_index(drop=True)
+
+
+def _linea(nombre, fila):
+    return (f"{nombre}: n={int(fila['trades'])} acierto {fila['acierto']:.0f}% E {fila['esperanza']:+.2f}%")
+
+
+def resumen_telegram(agregados, titulo, min_trades=3):
+    """
+    Mensaje del resumen de un periodo: totales (G = cierres TP, P = cierres SL), acierto, esperanza,
+    lados y el mejor / peor tramo de cada indicador con al menos 'min_trades'.
+    """
+    total = agregados.get(('total', 'total'))
+    if not total: return None
+    n, ganadoras, tp, sl, suma_pnl = total[:5]
+    lineas = [f"📊 **{titulo}** 📊",
+              f"G: {tp} | P: {sl} | T: {n}",
+              f"Acierto: {ganadoras / n * 100:.1f}% | Esperanza: {suma_pnl / n:+.2f}% | PnL: {suma_pnl:+.2f}%"]
+    df = tabla(agregados)
+    lados = df[df['dimension'] == 'lado']
+    if len(lados) > 1: lineas.append(" | ".join(_linea(f['grupo'], f) for _, f in lados.iterrows()))
+    for dimension in TRAMOS:
+        grupo = df[(df['dimension'] == dimension) & (df['grupo'] != SIN_DATO) & (df['trades'] >= min_trades)]
+        if len(grupo) < 2: continue
+        mejor, peor = grupo.iloc[0], grupo.iloc[-1]
+        lineas.append(f"{dimension}: mejor {mejor['grupo']} (n={int(mejor['trades'])}, E {mejor['esperanza']:+.2f}%) | "
+                      f"peor {peor['grupo']} (n={int(peor['trades'])}, E {peor['esperanza']:+.2f}%)")
+    return "\n".join(lineas)
+
+
+# ==============================================================================
+# VERIFICACIÓN
+# ==============================================================================
+
+def agregar_desde_cero(trades):
+    """Los mismos agregados que mantiene TradeStore, recalculados recorriendo todos los trades."""
+    agregados = {}
+    for t in trades:
+        for fila in filas_agregado(t['symbol'], t):
+            clave = fila[1:3]
+            previo = agregados.get(clave, (0,) * len(COLUMNAS_AGREGADO))
+            agregados[clave] = tuple(a + b for a, b in zip(previo, fila[3:]))
+    return agregados
+
+
+def verificar_paridad(n_trades=2000, semilla=0):
+    """Abre y cierra trades aleatorios en un TradeStore temporal y compara sus agregados con el recálculo completo."""
+    from trade_store import TradeStore
+    rng = np.random.default_rng(semilla)
+    inicio = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    with tempfile.TemporaryDirectory() as directorio:
+        store = TradeStore(os.path.join(directorio, 'trades.db'))
+        for k in range(n_trades):
+            symbol = f"SIM{int(rng.integers(200))}USDT"
+            if store.esta_abierto(symbol): continue
+            entrada = inicio + timedelta(minutes=15 * k)
+            trade = {'status': 'OPEN', 'entry_type': str(rng.choice(['LONG', 'SHORT'])), 'entry_price': float(rng.uniform(1, 100)),
+                     'entry_date': entrada.isoformat(), 'rsi_entry': float(rng.uniform(10, 95)),
+                     'adx_entry': float(rng.uniform(5, 60)), 'vol_ratio_entry': float(rng.uniform(0, 4)),
+                     'efficiency_ratio_entry': float(rng.uniform(0, 1)), 'h1_trend_aligned_entry': bool(rng.random() < 0.5),
+                     'short_entry_zone': None}
+            store.abrir(symbol, trade)
+            if rng.random() < 0.9:
+                trade.update(status=str(rng.choice(['CLOSED_TP', 'CLOSED_SL'])), close_price=trade['entry_price'] * float(rng.uniform(0.95, 1.05)),
+                             close_date=(entrada + timedelta(hours=float(rng.uniform(1, 72)))).isoformat(), symbol=symbol)
+                store.cerrar(symbol, trade)
+                store.cerrar(symbol, trade)  # Un segundo cierre no debe sumar dos veces
+        rango = ('2024-01-05', '2024-01-12')
+        completo, completo_rango = agregar_desde_cero(store.cerrados()), agregar_desde_cero(store.cerrados(*rango))
+        comparaciones = [('incremental', store.estadisticas(), completo),
+                         ('incremental por rango', store.estadisticas(*rango), completo_rango)]
+        store.reconstruir_agregados()
+        comparaciones.append(('reconstruido', store.estadisticas(), completo))
+        store.close()
+    for nombre, otro, esperado in comparaciones:
+        if set(otro) != set(esperado): raise AssertionError(f"Agregados {nombre}: grupos distintos del recálculo completo")
+        for clave, valores in esperado.items():
+            if not np.allclose(otro[clave], valores): raise AssertionError(f"Agregados {nombre} de {clave} difieren: {otro[clave]} != {valores}")
+    return completo[('total', 'total')][0]
+
+
+def main(argv=None):
+    from trade_store import TradeStore, TRADES_DB_FILE
+    parser = argparse.ArgumentParser(description="Estadísticas de los trades cerrados por símbolo, hora, lado y tramos de indicadores.")
+    parser.add_argument('--trades-db', default=TRADES_DB_FILE)
+    parser.add_argument('--desde', default=None, help="día de cierre inicial (AAAA-MM-DD, inclusivo)")
+    parser.add_argument('--hasta', default=None, help="día de cierre final (AAAA-MM-DD, exclusivo)")
+    parser.add_argument('--dimension', action='append', choices=DIMENSIONES, help="dimensiones a mostrar (repetible; por defecto todas)")
+    parser.add_argument('--min-trades', type=int, default=1)
+    parser.add_argument('--verificar', action='store_true', help="comprueba los agregados incrementales contra el recálculo completo")
+    args = parser.parse_args(argv)
+
+    if args.verificar:
+        print(f"Paridad de agregados incrementales OK ({verificar_paridad()} trades cerrados)")
+        return 0
+    store = TradeStore(args.trades_db)
+    df = tabla(store.estadisticas(args.desde, args.hasta, args.dimension), args.min_trades)
+    if df.empty: print("Sin trades cerrados en el periodo."); return 0
+    with pd.option_context('display.max_rows', None, 'display.width', 200):
+        print(df.to_string(index=False, float_format=lambda x: f"{x:.2f}"))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,207 +1,285 @@
-import pandas as pd
-import numpy as np
+# -*- coding: utf-8 -*-
+"""
+Análisis post-trade del cruce inverso de EMAs.
+
+Para cada trade cerrado (por defecto SL y TP) revisa las N barras M15 que siguen
+a la barra de entrada y busca el primer cruce de la EMA rápida contra la lenta en
+sentido contrario a la operación (LONG: la rápida cruza por debajo; SHORT: por
+encima). Las EMAs se calientan con las barras previas a la entrada, como en el
+análisis original (50 barras de calentamiento, EMA24/50, 10 barras).
+
+Los trades se agrupan por símbolo: los que están cerca en el tiempo comparten un
+único rango de velas del almacén local (compartido con monitor_signals.py; solo
+se descarga lo que falta, en paralelo) y los cruces de todos los trades se
+buscan en una sola pasada vectorizada (trades x barras).
+
+Uso:
+    python analizar_cruces.py
+    python analizar_cruces.py --estados CLOSED_SL --barras 20 --ema-rapida 8 --ema-lenta 24
+    python analizar_cruces.py --desde 2024-05-01 --simbolos BTCUSDT ETHUSDT --solo-almacen
+"""
+import argparse
 import json
-from binance.client import Client
-from dotenv import load_dotenv
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
-import traceback
 
-# --- Configuración ---
-load_dotenv()
-API_KEY = os.getenv("API_KEY")
-SECRET_KEY = os.getenv("SECRET_KEY")
+import numpy as np
+import pandas as pd
+
+from kline_store import KlineStore, KLINES_DB_FILE, INTERVALO_MS
+from trade_store import TradeStore, TRADES_DB_FILE
+from indicadores import ema_lote
+
+TRADES_FILE = 'closed_trades.json'         # Solo para la importación inicial al almacén de trades
+ACTIVE_TRADES_FILE = 'active_trades.json'  # Ídem
+HISTORICO_CSV_FILE = 'historico_trades.csv'
+INVERSE_CROSS_FILE = 'inverse_cross_analysis.json'
+
+INTERVALO = '15m'
+PASO_MS = INTERVALO_MS[INTERVALO]
+BARS_TO_CHECK = 10         # Las 10 barras *después* de la entrada
+BARRAS_CALENTAMIENTO = 50  # Barras previas a la entrada para calentar las EMAs
+EMA_SHORT = 24             # EMA rápida de tu bot
+EMA_LONG = 50              # EMA lenta de tu bot
+ESTADOS_DEFECTO = ('CLOSED_SL', 'CLOSED_TP')
+MAX_HUECO_BARRAS = 1000    # Trades de un símbolo a menos de esto comparten un único rango de velas
+
+# ==============================================================================
+# 1. DATOS (TRADES Y VELAS POR SÍMBOLO)
+# ==============================================================================
+
+def _fecha_ms(texto):
+    dt = datetime.fromisoformat(texto)
+    if dt.tzinfo is None: dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1000)
+
 
-if not API_KEY or not SECRET_KEY:
-    print("ERROR: No se encontraron API_KEY o SECRET_KEY en el archivo .env.")
-    print("Asegúrate de que el archivo .env está en el mismo directorio.")
-    exit()
+def barra_entrada_ms(trade):
+    """open_time de la vela M15 en curso cuando se abrió el trade."""
+    return _fecha_ms(trade['entry_date']) // PASO_MS * PASO_MS
 
-try:
-    client = Client(API_KEY, SECRET_KEY, {"timeout": 60})
-except Exception as e:
-    print(f"Error al conectar con Binance (revisa tus claves API): {e}")
-    exit()
 
-TRADES_FILE = 'closed_trades.json'
-BARS_TO_CHECK = 10  # Las 10 barras *después* de la entrada
-EMA_SHORT = 24      # EMA rápida de tu bot
-EMA_LONG = 50       # EMA lenta de tu bot
+def tramos_por_simbolo(trades, calentamiento=BARRAS_CALENTAMIENTO, barras=BARS_TO_CHECK):
+    """symbol -> lista de rangos [inicio_ms, fin_ms] que cubren las ventanas de sus trades (ventanas cercanas se unen)."""
+    ventanas = {}
+    for trade in trades:
+        ot = barra_entrada_ms(trade)
+        ventanas.setdefault(trade['symbol'], []).append((ot - calentamiento * PASO_MS, ot + barras * PASO_MS))
+    tramos = {}
+    for symbol, lista in ventanas.items():
+        lista.sort()
+        unidos = [list(lista[0])]
+        for inicio, fin in lista[1:]:
+            if inicio <= unidos[-1][1] + MAX_HUECO_BARRAS * PASO_MS: unidos[-1][1] = max(unidos[-1][1], fin)
+            else: unidos.append([inicio, fin])
+        tramos[symbol] = [tuple(t) for t in unidos]
+    return tramos
+
+
+def crear_cliente():
+    """
+    Cliente de la API con límite de peso (con el transporte de BINANCE_TRANSPORTE, ver transporte.py),
+    o None si no hay claves en .env (solo se usa el almacén).
+    """
+    from dotenv import load_dotenv
+    load_dotenv()
+    modo = os.getenv("BINANCE_TRANSPORTE", "directo")
+    if (not os.getenv("API_KEY") or not os.getenv("SECRET_KEY")) and modo != 'reproducir':
+        print("⚠️ Sin API_KEY / SECRET_KEY en .env: solo se usarán las velas ya guardadas.")
+        return None
+    from transporte import cliente_binance, GRABACION_DIR
+    from limitador_api import LimitadorPeso, ClienteLimitado
+    client = cliente_binance(os.getenv("API_KEY"), os.getenv("SECRET_KEY"), {"timeout": 60}, modo,
+                             os.getenv("BINANCE_GRABACION_DIR", GRABACION_DIR), 'analizar_cruces')
+    return ClienteLimitado(client, LimitadorPeso(int(os.getenv("PESO_API_POR_MINUTO", "2000"))))
+
+
+def cargar_velas(store, tramos, client=None, workers=8):
+    """
+    symbol -> (open_time, close) de las velas M15 de sus tramos. Con 'client' se descarga
+    antes lo que falte en el almacén; los símbolos se procesan en un pool de hilos.
+    """
+    ahora_ms = int(time.time() * 1000)
+
+    def cargar(symbol):
+        partes = []
+        for inicio, fin in tramos[symbol]:
+            fin = min(fin, ahora_ms)
+            if client is not None: store.sincronizar(client, symbol, INTERVALO, inicio, fin)
+            partes.append(store.leer_velas(symbol, INTERVALO, inicio, fin))
+        # Arrays estructurados (solo open_time y Close se usan): sin DataFrames intermedios
+        velas = np.concatenate(partes)
+        _, unicas = np.unique(velas['open_time'], return_index=True)  # Ordena y quita duplicados
+        velas = velas[unicas]
+        return velas['open_time'].copy(), velas['Close'].copy()
+
+    velas = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='cruces') as pool:
+        futuros = {symbol: pool.submit(cargar, symbol) for symbol in tramos}
+        for symbol, futuro in futuros.items():
+            try: velas[symbol] = futuro.result()
+            except Exception as e: print(f"⚠️ Error cargando velas de {symbol}: {e}")
+    return velas
+
+# ==============================================================================
+# 2. DETECCIÓN DE CRUCES (VECTORIZADA)
+# ==============================================================================
+
+def ventanas_cierre(trades, velas, calentamiento=BARRAS_CALENTAMIENTO, barras=BARS_TO_CHECK):
+    """
+    Matriz (trades x barras) de cierres: 'calentamiento' barras previas, la de entrada y
+    'barras' posteriores. Retorna (matriz, valido); las filas sin velas suficientes no son válidas.
+    """
+    largo = calentamiento + 1 + barras
+    cierres = np.full((len(trades), largo), np.nan)
+    valido = np.zeros(len(trades), dtype=bool)
+    for i, trade in enumerate(trades):
+        if trade['symbol'] not in velas: continue
+        open_time, close = velas[trade['symbol']]
+        k = int(np.searchsorted(open_time, barra_entrada_ms(trade)))  # Barra de entrada (o la siguiente si falta)
+        if k - calentamiento < 0 or k + barras >= len(close): continue
+        cierres[i] = close[k - calentamiento:k + barras + 1]
+        valido[i] = True
+    return cierres, valido
+
+
+def detectar_cruces(cierres, es_long, calentamiento=BARRAS_CALENTAMIENTO, ema_rapida=EMA_SHORT, ema_lenta=EMA_LONG):
+    """
+    Número de barra post-entrada (1..N) del primer cruce inverso de cada fila, o -1.
+    Cambio de signo de (EMA rápida - EMA lenta) entre barras consecutivas, desde la de entrada.
+    """
+    cierres = np.asarray(cierres, dtype=float)
+    diferencia = (ema_lote(cierres, ema_rapida) - ema_lote(cierres, ema_lenta))[:, calentamiento:]
+    prev, last = diferencia[:, :-1], diferencia[:, 1:]
+    cruce = np.where(np.asarray(es_long)[:, None], (prev > 0) & (last < 0), (prev < 0) & (last > 0))
+    return np.where(cruce.any(axis=1), cruce.argmax(axis=1) + 1, -1)
 
-# --- Funciones de Indicadores (basadas en la lógica del bot) ---
 
 def calculate_emas(df, short_span, long_span):
-    """Calcula las EMAs en el DataFrame."""
+    """Calcula las EMAs en el DataFrame (versión escalar, referencia de verificar_paridad)."""
     df['EMA_short'] = df['Close'].ewm(span=short_span, adjust=False).mean()
     df['EMA_long'] = df['Close'].ewm(span=long_span, adjust=False).mean()
     return df
 
+
 def check_inverse_cross(df, entry_type):
     """
-    Revisa si hay un cruce inverso en las 10 barras post-entrada.
-    El DataFrame de entrada (df) debe tener 11 barras:
-    - Fila 0: Barra de entrada (para usar como 'prev')
-    - Filas 1-10: Las 10 barras post-entrada a chequear
+    Versión escalar del chequeo (la del análisis original), sobre la barra de entrada
+    (fila 0, usada como 'prev') y las barras post-entrada. Retorna la barra del cruce o -1.
     """
-    inverse_cross_bar = -1
-    
-    # Empezamos en i=1 (la primera barra *después* de la entrada)
     for i in range(1, len(df)):
-        prev = df.iloc[i-1]
-        last = df.iloc[i]
-
-        # Omitir si las EMAs no están listas (calentamiento)
+        prev, last = df.iloc[i - 1], df.iloc[i]
         if pd.isna(prev['EMA_short']) or pd.isna(prev['EMA_long']) or \
            pd.isna(last['EMA_short']) or pd.isna(last['EMA_long']):
-            continue 
-
-        # Chequear cruce inverso para un LONG
-        # (EMA_short cruza por DEBAJO de EMA_long)
-        if entry_type == 'LONG':
-            if (prev['EMA_short'] > prev['EMA_long']) and (last['EMA_short'] < last['EMA_long']):
-                inverse_cross_bar = i # i es el número de barra (1-10)
-                break
-        
-        # Chequear cruce inverso para un SHORT
-        # (EMA_short cruza por ENCIMA de EMA_long)
-        elif entry_type == 'SHORT':
-            if (prev['EMA_short'] < prev['EMA_long']) and (last['EMA_short'] > last['EMA_long']):
-                inverse_cross_bar = i # i es el número de barra (1-10)
-                break
-                
-    return inverse_cross_bar
-
-# --- Carga de Datos ---
-try:
-    with open(TRADES_FILE, 'r') as f:
-        trades = json.load(f)
-except FileNotFoundError:
-    print(f"ERROR: No se encontró el archivo '{TRADES_FILE}'. Asegúrate de que esté en el mismo directorio.")
-    exit()
-except Exception as e:
-    print(f"Error al cargar {TRADES_FILE}: {e}")
-    exit()
-
-print(f"Total de trades a analizar: {len(trades)}")
-
-# Filtrar solo trades perdidos (CLOSED_SL)
-lost_trades = [t for t in trades if t['status'] == 'CLOSED_SL']
-print(f"Total de trades perdidos (SL): {len(lost_trades)}")
-
-trades_with_inverse_cross = 0
-trades_with_inverse_cross_pure_loss = 0
-trades_with_inverse_cross_break_even = 0
-total_pure_loss = 0
-total_break_even = 0
-
-analysis_results = []
-processed_count = 0
-
-for i, trade in enumerate(lost_trades):
-    symbol = trade['symbol']
-    entry_date_str = trade['entry_date']
-    entry_type = trade['entry_type']
-    is_break_even = trade.get('tp1_hit', False) # Usar .get() por seguridad
-    
-    if is_break_even:
-        total_break_even += 1
-    else:
-        total_pure_loss += 1
-
-    print(f"\n--- Analizando Trade {i+1}/{len(lost_trades)} ---")
-    print(f"Símbolo: {symbol}, Tipo: {entry_type}, Entry: {entry_date_str}")
+            continue
+        if entry_type == 'LONG' and prev['EMA_short'] > prev['EMA_long'] and last['EMA_short'] < last['EMA_long']:
+            return i
+        if entry_type == 'SHORT' and prev['EMA_short'] < prev['EMA_long'] and last['EMA_short'] > last['EMA_long']:
+            return i
+    return -1
 
-    try:
-        # Convertir fecha de entrada a timestamp de Binance (milisegundos)
-        entry_dt = datetime.fromisoformat(entry_date_str)
-        entry_timestamp_ms = int(entry_dt.timestamp() * 1000)
-
-        # Necesitamos 50 barras *antes* de la entrada para calentar las EMAs
-        ms_15min = 900000 # 15 * 60 * 1000
-        start_time_with_warmup = entry_timestamp_ms - (50 * ms_15min)
-        
-        # Pedimos 50 (warmup) + 1 (entrada) + 10 (chequeo) = 61 barras
-        klines_with_warmup = client.futures_historical_klines(
-            symbol=symbol,
-            interval=Client.KLINE_INTERVAL_15MINUTE,
-            start_str=str(start_time_with_warmup), # API prefiere string
-            limit=50 + BARS_TO_CHECK + 1
-        )
-
-        if len(klines_with_warmup) < 52: # 50 warmup + 1 entrada + 1 post-barra
-             print(f"No hay suficientes klines para {symbol} (con warmup). Se necesitan 52+, se obtuvieron {len(klines_with_warmup)}")
-             continue
-             
-        df_warmup = pd.DataFrame(klines_with_warmup, columns=['open_time', 'Open', 'High', 'Low', 'Close', 'Volume', 'ct', 'qav','nt','tbbav','tbqav','ig'])
-        df_warmup['Close'] = df_warmup['Close'].astype(float)
-        
-        # Calcular EMAs en todo el set de datos
-        df_warmup = calculate_emas(df_warmup, EMA_SHORT, EMA_LONG)
-        
-        # La barra de entrada es el índice 50 (la 51ava barra).
-        # Los 10 bares a chequear son del 51 al 60.
-        
-        # df_to_check debe incluir la barra de entrada (índice 50) para usarla como 'prev'
-        # y las 10 barras siguientes (índice 51 a 60). Total 11 barras.
-        # Slice: [50 : 50 + 10 + 1] -> [50:61]
-        df_to_check = df_warmup.iloc[50 : 51 + BARS_TO_CHECK]
-        
-        if len(df_to_check) < BARS_TO_CHECK + 1:
-             print(f"Datos insuficientes post-entrada para {symbol}. Se necesitan {BARS_TO_CHECK + 1} barras, se obtuvieron {len(df_to_check)}")
-             continue
-
-        # Chequear cruce inverso
-        # Pasamos el df con 11 barras (entrada + 10 post)
-        cross_bar_number = check_inverse_cross(df_to_check, entry_type)
-        
-        result_data = {
-            "symbol": symbol,
-            "entry_type": entry_type,
-            "is_break_even": is_break_even,
-            "inverse_cross_detected": cross_bar_number > -1,
-            "bar_of_cross": cross_bar_number
-        }
-        analysis_results.append(result_data)
-        processed_count += 1
-
-        if cross_bar_number > -1:
-            trades_with_inverse_cross += 1
-            print(f"¡CRUCE INVERSO DETECTADO! en barra {cross_bar_number} post-entrada")
-            if is_break_even:
-                trades_with_inverse_cross_break_even += 1
-            else:
-                trades_with_inverse_cross_pure_loss += 1
-        else:
-            print("No se detectó cruce inverso.")
+# ==============================================================================
+# 3. ANÁLISIS Y RESUMEN
+# ==============================================================================
+
+def analizar(trades, velas, calentamiento=BARRAS_CALENTAMIENTO, barras=BARS_TO_CHECK,
+             ema_rapida=EMA_SHORT, ema_lenta=EMA_LONG):
+    """Lista de resultados (uno por trade con velas suficientes) con la barra del cruce inverso."""
+    cierres, valido = ventanas_cierre(trades, velas, calentamiento, barras)
+    analizables = [t for t, v in zip(trades, valido) if v]
+    if not analizables: return []
+    es_long = np.array([t['entry_type'] == 'LONG' for t in analizables])
+    barra_cruce = detectar_cruces(cierres[valido], es_long, calentamiento, ema_rapida, ema_lenta)
+    return [{"symbol": t['symbol'], "entry_type": t['entry_type'], "entry_date": t['entry_date'],
+             "status": t['status'], "is_break_even": bool(t.get('tp1_hit', False)) and t['status'] == 'CLOSED_SL',
+             "inverse_cross_detected": bool(b > -1), "bar_of_cross": int(b)}
+            for t, b in zip(analizables, barra_cruce)]
+
+
+def resumen(resultados, total_trades, barras=BARS_TO_CHECK):
+    """Texto del resumen por estado de cierre (y, en los SL, derrotas puras frente a empates)."""
+    lineas = [f"--- RESUMEN DEL ANÁLISIS DE CRUCE INVERSO (en {barras} barras) ---",
+              f"Trades analizados: {len(resultados)} de {total_trades}"]
+    if not resultados:
+        return "\n".join(lineas + ["No se pudieron procesar trades para el análisis."])
+    df = pd.DataFrame(resultados)
 
+    def linea(nombre, grupo):
+        n, cruces = len(grupo), int(grupo['inverse_cross_detected'].sum())
+        return f"  {nombre}: {cruces} de {n} tuvieron un cruce inverso ({cruces / n * 100:.1f}%)"
+
+    for status, grupo in df.groupby('status'):
+        lineas.append(f"\n{status}:")
+        lineas.append(linea("Total", grupo))
+        if status == 'CLOSED_SL':
+            for nombre, es_empate in (("Derrotas Puras (sin TP1)", False), ("Empates (con TP1)", True)):
+                sub = grupo[grupo['is_break_even'] == es_empate]
+                if len(sub): lineas.append(linea(nombre, sub))
+        for entry_type, sub in grupo.groupby('entry_type'):
+            lineas.append(linea(entry_type, sub))
+    return "\n".join(lineas)
+
+
+def verificar_paridad(n_trades=300, semilla=0):
+    """Compara detectar_cruces con check_inverse_cross (bucle con iloc) sobre ventanas sintéticas."""
+    rng = np.random.default_rng(semilla)
+    cierres = 100 * np.exp(np.cumsum(rng.normal(0, 0.004, (n_trades, BARRAS_CALENTAMIENTO + 1 + BARS_TO_CHECK)), axis=1))
+    es_long = rng.random(n_trades) < 0.5
+    vectorizado = detectar_cruces(cierres, es_long)
+    for i in range(n_trades):
+        df = calculate_emas(pd.DataFrame({'Close': cierres[i]}), EMA_SHORT, EMA_LONG)
+        escalar = check_inverse_cross(df.iloc[BARRAS_CALENTAMIENTO:], 'LONG' if es_long[i] else 'SHORT')
+        assert escalar == vectorizado[i], (i, escalar, vectorizado[i])
+    print(f"Paridad cruce inverso OK ({n_trades} trades, {int((vectorizado > -1).sum())} con cruce)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cruce inverso de EMAs tras la entrada de los trades cerrados.")
+    parser.add_argument('--estados', nargs='*', default=list(ESTADOS_DEFECTO), help="Estados de cierre a analizar")
+    parser.add_argument('--desde', default=None, help="Fecha de cierre inicial UTC (YYYY-MM-DD)")
+    parser.add_argument('--hasta', default=None, help="Fecha de cierre final UTC, excluida (YYYY-MM-DD)")
+    parser.add_argument('--simbolos', nargs='*', default=None, help="Solo estos símbolos")
+    parser.add_argument('--barras', type=int, default=BARS_TO_CHECK, help="Barras post-entrada a revisar")
+    parser.add_argument('--calentamiento', type=int, default=BARRAS_CALENTAMIENTO, help="Barras previas para las EMAs")
+    parser.add_argument('--ema-rapida', type=int, default=EMA_SHORT)
+    parser.add_argument('--ema-lenta', type=int, default=EMA_LONG)
+    parser.add_argument('--workers', type=int, default=8, help="Hilos de carga de velas")
+    parser.add_argument('--db', default=KLINES_DB_FILE, help="Almacén SQLite de velas")
+    parser.add_argument('--trades-db', default=TRADES_DB_FILE, help="Almacén SQLite de trades")
+    parser.add_argument('--solo-almacen', action='store_true', help="No descargar velas: usar solo las guardadas")
+    parser.add_argument('--salida', default=INVERSE_CROSS_FILE, help="JSON con el resultado por trade")
+    parser.add_argument('--verificar', action='store_true', help="Solo comprobar la paridad con el chequeo escalar")
+    args = parser.parse_args()
+
+    if args.verificar:
+        verificar_paridad(); return
+
+    trade_store = TradeStore(args.trades_db)
+    trade_store.importar_json(ACTIVE_TRADES_FILE, TRADES_FILE, HISTORICO_CSV_FILE)
+    trades = [t for t in trade_store.cerrados(desde=args.desde, hasta=args.hasta)
+              if t.get('status') in args.estados and t.get('entry_date') and t.get('entry_type') in ('LONG', 'SHORT')
+              and (not args.simbolos or t.get('symbol') in args.simbolos)]
+    print(f"Trades a analizar ({', '.join(args.estados)}): {len(trades)}")
+    if not trades: return
+
+    t0 = time.time()
+    tramos = tramos_por_simbolo(trades, args.calentamiento, args.barras)
+    client = None if args.solo_almacen else crear_cliente()
+    store = KlineStore(args.db)
+    try: velas = cargar_velas(store, tramos, client, args.workers)
+    finally: store.close()
+    print(f"Velas de {len(velas)} símbolos ({sum(len(t) for t in tramos.values())} rangos) en {time.time() - t0:.1f}s")
+
+    resultados = analizar(trades, velas, args.calentamiento, args.barras, args.ema_rapida, args.ema_lenta)
+    print("\n" + resumen(resultados, len(trades), args.barras))
+    try:
+        with open(args.salida, 'w') as f: json.dump(resultados, f, indent=4)
+        print(f"\nResultados detallados guardados en '{args.salida}'")
     except Exception as e:
-        print(f"Error procesando {symbol}: {e}")
-        # traceback.print_exc()
-
-# --- Imprimir Resumen ---
-print("\n\n--- RESUMEN DEL ANÁLISIS DE CRUCE INVERSO (en 10 barras) ---")
-print(f"Total de Trades Perdidos (SL) analizados: {processed_count} de {len(lost_trades)}")
-print(f"  - Derrotas Puras (sin TP1): {total_pure_loss}")
-print(f"  - Empates (con TP1): {total_break_even}")
-
-print("\n--- Resultados del Cruce Inverso ---")
-if processed_count > 0:
-    print(f"Trades Totales con Cruce Inverso: {trades_with_inverse_cross} de {processed_count} ({(trades_with_inverse_cross/processed_count)*100:.1f}%)")
-
-    if total_pure_loss > 0:
-        print(f"\nEn Derrotas Puras:")
-        print(f"  {trades_with_inverse_cross_pure_loss} de {total_pure_loss} tuvieron un cruce inverso ({(trades_with_inverse_cross_pure_loss/total_pure_loss*100):.1f}%)")
-
-    if total_break_even > 0:
-        print(f"\nEn Empates (Break-Even):")
-        print(f"  {trades_with_inverse_cross_break_even} de {total_break_even} tuvieron un cruce inverso ({(trades_with_inverse_cross_break_even/total_break_even*100):.1f}%)")
-else:
-    print("No se pudieron procesar trades para el análisis.")
-
-# Guardar resultados detallados
-try:
-    with open('inverse_cross_analysis.json', 'w') as f:
-        json.dump(analysis_results, f, indent=4)
-    print("\nResultados detallados guardados en 'inverse_cross_analysis.json'")
-except Exception as e:
-    print(f"Error al guardar el JSON de análisis: {e}")
+        print(f"Error al guardar el JSON de análisis: {e}")
+
+
+if __name__ == '__main__':
+    main()
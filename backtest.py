@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+"""
+Backtester histórico de la estrategia sobre las velas M15 del almacén local.
+
+Reproduce las reglas en vivo (estrategia.py): entradas de detect_new_signals
+(filtro horario, RSI diario, pivotes Fibonacci del día anterior, cruce
+EMA24/50 y filtros de RSI/ADX/volumen/EMA200) y salidas de
+check_active_trades (SL, TP2, TP1 -> SL a break-even), evaluadas en cada vela
+de 15 minutos con su recorrido intravela (high/low) como hace el bot. Los símbolos se reparten en lotes
+sobre un ProcessPoolExecutor y cada uno se simula de forma vectorizada.
+
+Diferencias conocidas con el bot en vivo:
+- Los indicadores se calculan sobre la serie continua, no sobre la ventana
+  de 55 horas; las EMAs largas pueden diferir levemente en los decimales.
+- No se consulta la alineación H1 (en vivo solo se guarda como dato).
+
+Uso:
+    python backtest.py --desde 2024-01-01 --hasta 2024-12-31 --workers 8
+    python backtest.py --desde 2024-06-01 --simbolos BTCUSDT ETHUSDT --descargar
+"""
+import argparse
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from kline_store import KlineStore, KLINES_DB_FILE, INTERVALO_MS
+from indicadores import apilar_ventanas, calcular_indicadores_lote
+from estrategia import (calcular_pivotes_lote, mascaras_entrada, precio_salida, pnl_pct, horario_operativo, rsi_diario_actual,
+                        favorable_long_diario, NIVELES_TRADE, PARAMETROS_DEFECTO, RSI_DIARIO_PERIODO, MIN_DIAS_RSI_DIARIO)
+
+logger = logging.getLogger(__name__)
+
+SYMBOLS_FILE = 'top_100_symbols.json'
+BACKTEST_TRADES_FILE = 'backtest_trades.csv'
+
+INTERVALO = '15m'
+PASO_MS = INTERVALO_MS[INTERVALO]
+DIA_MS = INTERVALO_MS['1d']
+HORA_MS = 3_600_000
+BARRAS_CALENTAMIENTO = 200  # En vivo se exigen 201 velas en la ventana
+DIAS_CONTEXTO = 31          # Historial previo para el RSI diario (30 días) y los pivotes de ayer
+SIMBOLOS_POR_TAREA = 16     # Símbolos apilados por tarea: el bucle de las EMAs recorre las barras una vez por lote
+
+# ==============================================================================
+# 1. CONTEXTO DIARIO (PIVOTES, RSI DIARIO, HORARIO)
+# ==============================================================================
+
+def contexto_diario_base(open_time, high, low, close):
+    """
+    Para cada vela M15 calcula lo que el bot en vivo vería al evaluarla (al cierre):
+    pivotes del día UTC anterior, RSI diario y hora UTC. No depende de los umbrales.
+    Retorna un dict con arrays por vela (ver favorables).
+    """
+    dia_vela = open_time // DIA_MS
+    d0 = int(dia_vela[0])
+    n_dias = int(dia_vela[-1]) - d0 + 2  # +1 por si la última vela se evalúa ya en el día siguiente
+    idx = (dia_vela - d0).astype(np.int64)
+
+    # Vela diaria (H/L/C) reconstruida desde M15; días sin velas quedan en NaN
+    high_d = np.full(n_dias, -np.inf); low_d = np.full(n_dias, np.inf); close_d = np.full(n_dias, np.nan)
+    np.maximum.at(high_d, idx, high); np.minimum.at(low_d, idx, low)
+    ultima_del_dia = np.r_[np.flatnonzero(np.diff(idx)), len(idx) - 1]
+    close_d[idx[ultima_del_dia]] = close[ultima_del_dia]
+    high_d[np.isnan(close_d)] = np.nan; low_d[np.isnan(close_d)] = np.nan
+
+    # El bot evalúa la vela justo al cerrar: ese instante fija el día de pivotes y la hora
+    eval_ms = open_time + PASO_MS
+    dia_eval = (eval_ms // DIA_MS - d0).astype(np.int64)
+    ayer = dia_eval - 1
+    piv_dia = calcular_pivotes_lote(high_d, low_d, close_d)
+    pivotes = {k: np.where(ayer >= 0, v[np.maximum(ayer, 0)], np.nan) for k, v in piv_dia.items()}
+
+    # RSI diario (rolling 14 de la API de 30 días): 13 diferencias de cierres previos + la del precio actual
+    delta = np.diff(close_d, prepend=np.nan)
+    gan, per = np.where(delta > 0, delta, 0.), np.where(delta < 0, -delta, 0.)
+    gan[np.isnan(delta)] = np.nan; per[np.isnan(delta)] = np.nan
+    nan_acum = np.r_[0, np.cumsum(np.isnan(delta))]
+    gan_acum, per_acum = np.r_[0, np.cumsum(np.nan_to_num(gan))], np.r_[0, np.cumsum(np.nan_to_num(per))]
+    desde = np.maximum(dia_eval - (RSI_DIARIO_PERIODO - 1), 0)
+    hasta = np.minimum(dia_eval, n_dias)
+    cierre_previo = close_d[np.maximum(ayer, 0)]
+    delta_actual = close - cierre_previo
+    rsi_diario = rsi_diario_actual(gan_acum[hasta] - gan_acum[desde], per_acum[hasta] - per_acum[desde], cierre_previo, close)
+    incompleto = (dia_eval < RSI_DIARIO_PERIODO) | (nan_acum[hasta] - nan_acum[desde] > 0) | np.isnan(delta_actual)
+    rsi_diario[incompleto] = np.nan
+    pocos_dias = dia_eval + 1 < MIN_DIAS_RSI_DIARIO
+    hora = (eval_ms % DIA_MS) // HORA_MS
+    return {'pivotes': pivotes, 'rsi_diario': rsi_diario, 'pocos_dias': pocos_dias, 'hora': hora}
+
+
+def favorables(ctx, params=PARAMETROS_DEFECTO, velas=slice(None)):
+    """Filtro horario y de RSI diario (get_market_condition) sobre las velas indicadas."""
+    horario_ok = horario_operativo(ctx['hora'][velas], params)
+    favorable_long = horario_ok & favorable_long_diario(ctx['rsi_diario'][velas], ctx['pocos_dias'][velas], params)
+    return favorable_long, horario_ok
+
+
+def contexto_diario(open_time, high, low, close, params=PARAMETROS_DEFECTO):
+    """Retorna (pivotes, favorable_long, favorable_short) con arrays por vela."""
+    ctx = contexto_diario_base(open_time, high, low, close)
+    return (ctx['pivotes'],) + favorables(ctx, params)
+
+# ==============================================================================
+# 2. SIMULACIÓN POR SÍMBOLO
+# ==============================================================================
+
+def _primero(mascara):
+    return int(np.argmax(mascara)) if mascara.any() else None
+
+
+def simular_salida(entry_type, i, entry_price, close, pivotes, high=None, low=None):
+    """
+    Aplica evaluar_salida vela a vela desde i+1 de forma vectorizada, con el recorrido
+    intravela de cada vela (high/low; si no se pasan, solo el cierre).
+    Retorna (status, idx_cierre, close_price, idx_tp1); status 'OPEN' si no se cerró.
+    """
+    niveles = NIVELES_TRADE[entry_type]
+    c = close[i + 1:]
+    h = c if high is None else np.maximum(high[i + 1:], c)
+    l = c if low is None else np.minimum(low[i + 1:], c)
+    tp1, tp2, sl = (pivotes[niveles[k]][i + 1:] for k in ('tp1_key', 'tp2_key', 'sl_key'))
+    if entry_type == 'LONG': sl_c, tp2_c, tp1_c = l < sl, h > tp2, h > tp1
+    else: sl_c, tp2_c, tp1_c = h > sl, l < tp2, l < tp1
+
+    k = _primero(sl_c | tp2_c | tp1_c)
+    if k is None: return 'OPEN', None, None, None
+    if sl_c[k]: return 'CLOSED_SL', i + 1 + k, precio_salida(entry_type, 'SL', sl[k], c[k]), None
+    if tp2_c[k]: return 'CLOSED_TP', i + 1 + k, precio_salida(entry_type, 'TP2', tp2[k], c[k]), i + 1 + k
+
+    # TP1 alcanzado: desde la vela siguiente el SL pasa a break-even
+    c2, tp2_2 = c[k + 1:], tp2_c[k + 1:]
+    be_c = l[k + 1:] < entry_price if entry_type == 'LONG' else h[k + 1:] > entry_price
+    k2 = _primero(be_c | tp2_2)
+    if k2 is None: return 'OPEN', None, None, i + 1 + k
+    if be_c[k2]: return 'CLOSED_SL', i + 2 + k + k2, precio_salida(entry_type, 'SL', entry_price, c2[k2]), i + 1 + k
+    return 'CLOSED_TP', i + 2 + k + k2, precio_salida(entry_type, 'TP2', tp2[k + 1 + k2], c2[k2]), i + 1 + k
+
+
+def seleccionar_trades(candidatas, cierre):
+    """
+    Un único trade a la vez sobre los índices de entrada 'candidatas' (ordenados).
+    'cierre(i)' devuelve el índice de la vela de cierre o None si sigue abierto.
+    Se puede reentrar en la vela de cierre: en vivo check_active_trades corre antes que detect_new_signals.
+    """
+    elegidas, libre_desde = [], -1
+    for i in candidatas:
+        if i < libre_desde: continue
+        elegidas.append(i)
+        j = cierre(i)
+        if j is None: break  # Sigue abierto al final de los datos
+        libre_desde = j
+    return elegidas
+
+
+def _fecha(ms):
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).isoformat()
+
+
+def simular_simbolo(symbol, df, desde_ms, params=PARAMETROS_DEFECTO, ind=None):
+    """
+    Simula la estrategia sobre el DataFrame OHLCV M15 de un símbolo.
+    Solo abre trades en velas con open_time >= desde_ms y un único trade a la vez,
+    permitiendo reentrar en la misma vela en que se cerró el anterior (como en vivo).
+    'ind' permite reutilizar indicadores ya calculados para el mismo df.
+    """
+    if len(df) <= BARRAS_CALENTAMIENTO: return []
+    ot = df['open_time'].to_numpy(dtype=np.int64)
+    high, low, close, volume = (df[c].to_numpy(dtype=float) for c in ('High', 'Low', 'Close', 'Volume'))
+    if ind is None:
+        ind = calcular_indicadores_lote(high[None], low[None], close[None], volume[None])
+    ind = {k: v[0] for k, v in ind.items()}
+    pivotes, fav_l, fav_s = contexto_diario(ot, high, low, close, params)
+
+    largo, corto = mascaras_entrada(ind, pivotes['R1'], pivotes['R3'], pivotes['S1'], fav_l, fav_s, params)
+    validas = (np.arange(len(df)) >= BARRAS_CALENTAMIENTO) & (ot >= desde_ms)
+    candidatas = np.flatnonzero((largo | corto) & validas)
+
+    salidas = {}
+    def cierre(i):
+        salidas[i] = simular_salida('LONG' if largo[i] else 'SHORT', i, close[i], close, pivotes, high, low)
+        return salidas[i][1]
+
+    trades = []
+    for i in seleccionar_trades(candidatas, cierre):
+        entry_type = 'LONG' if largo[i] else 'SHORT'
+        entry_price = close[i]
+        status, j, close_price, j_tp1 = salidas[i]
+        vol_ma = ind['Volume_MA20'][i]
+        trade = {
+            'symbol': symbol, 'entry_type': entry_type, 'status': status,
+            'entry_date': _fecha(ot[i] + PASO_MS), 'entry_price': entry_price,
+            'close_date': _fecha(ot[j] + PASO_MS) if j is not None else None, 'close_price': close_price,
+            'tp1_hit': j_tp1 is not None, 'tp2_hit': status == 'CLOSED_TP',
+            'tp1_date': _fecha(ot[j_tp1] + PASO_MS) if j_tp1 is not None else None,
+            'rsi_entry': round(ind['RSI'][i], 2), 'adx_entry': round(ind['ADX'][i], 2),
+            'vol_ratio_entry': round(ind['Volume'][i] / vol_ma, 2) if vol_ma > 0 else 0,
+            'ema_200_context': bool(entry_price > ind['EMA200'][i]),
+            'barras': (j - i) if j is not None else None,
+        }
+        if close_price is not None: trade['pnl_pct'] = round(pnl_pct(entry_type, entry_price, close_price), 4)
+        trades.append(trade)
+    return trades
+
+
+def cargar_velas(store, symbol, desde_ms, hasta_ms):
+    """Velas M15 guardadas con el historial previo necesario para indicadores y contexto diario."""
+    inicio = desde_ms - DIAS_CONTEXTO * DIA_MS - BARRAS_CALENTAMIENTO * PASO_MS
+    df = store.leer_rango(symbol, INTERVALO, inicio, hasta_ms)
+    return df.dropna(subset=['Close']).reset_index(drop=True)
+
+
+def backtest_lote(symbols, desde_ms, hasta_ms, db_path=KLINES_DB_FILE, params=PARAMETROS_DEFECTO):
+    """
+    Trabajo de un proceso: abre su propia conexión al almacén, calcula los indicadores
+    de varios símbolos en una sola matriz (símbolos x barras) y simula cada uno.
+    """
+    store = KlineStore(db_path)
+    try:
+        dfs = {}
+        for symbol in symbols:
+            try:
+                df = cargar_velas(store, symbol, desde_ms, hasta_ms)
+                if len(df) > BARRAS_CALENTAMIENTO: dfs[symbol] = df
+            except Exception as e: logger.error(f"Error leyendo velas de {symbol}: {e}")
+    finally:
+        store.close()
+    if not dfs: return []
+
+    m = apilar_ventanas(list(dfs.values()))
+    ind_lote = calcular_indicadores_lote(m['High'], m['Low'], m['Close'], m['Volume'])
+    trades = []
+    for i, (symbol, df) in enumerate(dfs.items()):
+        # Las series se alinean a la derecha: la fila del símbolo son sus últimas len(df) columnas
+        ind = {k: v[i:i + 1, -len(df):] for k, v in ind_lote.items()}
+        try: trades.extend(simular_simbolo(symbol, df, desde_ms, params, ind))
+        except Exception as e: logger.error(f"Error en backtest de {symbol}: {e}")
+    return trades
+
+
+# ==============================================================================
+# 3. EJECUCIÓN
+# ==============================================================================
+
+def descargar_historial(symbols, desde_ms, hasta_ms, db_path=KLINES_DB_FILE):
+    """Completa el almacén con las velas M15 que falten (usa el cliente de la API con límite de peso)."""
+    from binance.client import Client
+    from dotenv import load_dotenv
+    from limitador_api import LimitadorPeso, ClienteLimitado
+    load_dotenv()
+    client = ClienteLimitado(Client(os.getenv("API_KEY"), os.getenv("SECRET_KEY"), {"timeout": 60}),
+                             LimitadorPeso(int(os.getenv("PESO_API_POR_MINUTO", "2000"))))
+    store = KlineStore(db_path)
+    inicio = desde_ms - DIAS_CONTEXTO * DIA_MS - BARRAS_CALENTAMIENTO * PASO_MS
+    try:
+        for n, symbol in enumerate(symbols, 1):
+            try: store.sincronizar(client, symbol, INTERVALO, inicio, hasta_ms)
+            except Exception as e: print(f"⚠️ Error descargando {symbol}: {e}")
+            if n % 20 == 0: print(f"  {n}/{len(symbols)} símbolos sincronizados")
+    finally:
+        store.close()
+
+
+def ejecutar_backtest(symbols, desde_ms, hasta_ms, workers=None, db_path=KLINES_DB_FILE, params=PARAMETROS_DEFECTO):
+    """Reparte los símbolos en lotes sobre un pool de procesos y devuelve un DataFrame con todos los trades."""
+    trades = []
+    lotes = [symbols[i:i + SIMBOLOS_POR_TAREA] for i in range(0, len(symbols), SIMBOLOS_POR_TAREA)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futuros = [pool.submit(backtest_lote, lote, desde_ms, hasta_ms, db_path, params) for lote in lotes]
+        for futuro in futuros: trades.extend(futuro.result())
+    df = pd.DataFrame(trades)
+    if not df.empty: df = df.sort_values(['entry_date', 'symbol']).reset_index(drop=True)
+    return df
+
+
+def resumen(df):
+    """Texto con las métricas principales del backtest."""
+    if df.empty: return "Sin trades en el periodo."
+    cerrados = df[df['status'] != 'OPEN']
+    lineas = [f"Trades: {len(df)} (cerrados {len(cerrados)}, abiertos {len(df) - len(cerrados)})"]
+    for tipo, grupo in [('TOTAL', cerrados)] + list(cerrados.groupby('entry_type')):
+        if grupo.empty: continue
+        ganadores = (grupo['pnl_pct'] > 0).mean() * 100
+        lineas.append(f"  {tipo:<6} n={len(grupo):<5} TP={int((grupo['status'] == 'CLOSED_TP').sum()):<5} "
+                      f"SL={int((grupo['status'] == 'CLOSED_SL').sum()):<5} TP1={int(grupo['tp1_hit'].sum()):<5} "
+                      f"acierto={ganadores:.1f}% pnl medio={grupo['pnl_pct'].mean():.3f}% pnl total={grupo['pnl_pct'].sum():.2f}%")
+    return "\n".join(lineas)
+
+
+def _fecha_ms(texto):
+    return int(pd.Timestamp(texto, tz='UTC').timestamp() * 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backtest de la estrategia sobre las velas M15 del almacén local.")
+    parser.add_argument('--desde', required=True, help="Fecha inicial UTC (YYYY-MM-DD)")
+    parser.add_argument('--hasta', default=None, help="Fecha final UTC (por defecto, ahora)")
+    parser.add_argument('--simbolos', nargs='*', default=None, help=f"Símbolos (por defecto, los de {SYMBOLS_FILE})")
+    parser.add_argument('--workers', type=int, default=None, help="Procesos (por defecto, uno por CPU)")
+    parser.add_argument('--db', default=KLINES_DB_FILE, help="Almacén SQLite de velas")
+    parser.add_argument('--salida', default=BACKTEST_TRADES_FILE, help="CSV con los trades simulados")
+    parser.add_argument('--descargar', action='store_true', help="Descargar antes las velas que falten (requiere .env)")
+    args = parser.parse_args()
+
+    symbols = args.simbolos
+    if not symbols:
+        with open(SYMBOLS_FILE, 'r') as f: symbols = json.load(f)
+    desde_ms = _fecha_ms(args.desde)
+    hasta_ms = _fecha_ms(args.hasta) if args.hasta else int(time.time() * 1000)
+
+    if args.descargar:
+        print(f"⬇️ Sincronizando velas de {len(symbols)} símbolos...")
+        descargar_historial(symbols, desde_ms, hasta_ms, args.db)
+
+    t0 = time.time()
+    df = ejecutar_backtest(symbols, desde_ms, hasta_ms, args.workers, args.db)
+    if not df.empty: df.to_csv(args.salida, index=False)
+    print(f"✅ Backtest de {len(symbols)} símbolos en {time.time() - t0:.1f}s. Trades guardados en '{args.salida}'.")
+    print(resumen(df))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,445 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks del bot sin conexión con Binance.
+
+- Generador determinista de velas sintéticas por símbolo: en tendencia, en
+  rango o con huecos (ventanas de mantenimiento). La serie M15 es función del
+  símbolo y la semilla (las descargas incrementales del almacén ven siempre
+  los mismos datos) y las velas H1 / H4 / diarias se agregan de ella, así que
+  los pivotes diarios son coherentes con los precios M15.
+- ClienteFalso: sustituto de binance.client.Client con futures_klines,
+  futures_historical_klines, futures_ticker, futures_symbol_ticker y
+  futures_time, con latencia configurable por llamada y recuento de llamadas.
+- Etapas medidas con el código real de monitor_signals (en un directorio
+  temporal): pivotes diarios, escaneo en frío (almacén vacío) y en caliente
+  (solo la cola), check_active_trades con un trade abierto por símbolo, y los
+  indicadores por símbolo (calculate_adx en pandas) frente al lote NumPy.
+- Se informa del tiempo por símbolo, del escalado entre tamaños de universo
+  y del pico de memoria (tracemalloc), y se compara con una línea base
+  guardada (código de salida 1 si alguna etapa empeora más de la tolerancia).
+
+Uso:
+    python benchmark.py --simbolos 100 1000 5000 --latencia-ms 5 --guardar-base
+    python benchmark.py --simbolos 100 1000 5000 --latencia-ms 5 --comparar
+"""
+import argparse
+import collections
+import json
+import math
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import zlib
+
+import numpy as np
+import pandas as pd
+import binance.client
+from binance.client import Client
+from binance.helpers import date_to_milliseconds
+
+from kline_store import KlineStore, INTERVALO_MS, MAX_KLINES_POR_PETICION
+from limitador_api import LimitadorPeso, ClienteLimitado
+from indicadores import calculate_adx, apilar_ventanas, calcular_indicadores_lote
+from estrategia import NIVELES_TRADE
+from precios import InstantaneaPrecios
+from remuestreo import RemuestreadorIncremental
+from trade_store import TradeStore
+
+BENCH_BASE_FILE = 'bench_base.json'
+TOLERANCIA_REGRESION = 0.25   # Empeoramiento relativo admitido frente a la línea base
+MIN_DIFERENCIA_SEG = 0.005    # Por debajo de esto la diferencia es ruido de medida
+PERFILES = ('tendencia', 'rango', 'huecos')
+ETAPAS = ('indicadores', 'escaneo', 'salidas')
+# Historial sintético disponible (el bot pide 55 h de M15, 5 días de H1 y 30 de velas diarias)
+HISTORIAL_SINTETICO_DIAS = 40
+INTERVALO_BASE = '15m'
+BARRAS_INDICADORES = 220      # Igual que la ventana M15 de 55 h del bot
+PESO_SIN_LIMITE = 10 ** 9
+DIA_MS = INTERVALO_MS['1d']
+
+# ==============================================================================
+# 1. VELAS SINTÉTICAS
+# ==============================================================================
+
+def perfil_simbolo(symbol, perfil='mixto'):
+    """Perfil de la serie del símbolo: el indicado o, en 'mixto', uno fijo según el nombre."""
+    if perfil != 'mixto': return perfil
+    return PERFILES[zlib.crc32(symbol.encode()) % len(PERFILES)]
+
+
+def _rng(symbol, semilla, componente):
+    # Un generador por componente: la serie de n+k velas empieza igual que la de n
+    return np.random.default_rng([zlib.crc32(symbol.encode()), semilla, componente])
+
+
+def serie_sintetica(symbol, n, perfil='mixto', semilla=0):
+    """
+    n velas M15 (open, high, low, close, volume) y máscara de velas presentes, deterministas
+    en (symbol, semilla). 'tendencia': paseo aleatorio con deriva; 'rango': oscilación
+    alrededor de un nivel; 'huecos': tendencia con bloques de velas ausentes.
+    """
+    perfil = perfil_simbolo(symbol, perfil)
+    base = _rng(symbol, semilla, 0)
+    nivel, deriva, periodo = 10 ** base.uniform(-2, 3), base.uniform(-4e-4, 4e-4), base.uniform(40, 200)
+    ruido = _rng(symbol, semilla, 1).normal(0, 0.004, n)
+    if perfil == 'rango':
+        t = np.arange(n)
+        log_close = 0.04 * np.sin(2 * np.pi * t / periodo) + 0.3 * ruido + np.cumsum(ruido) * 0.05
+    else:
+        log_close = np.cumsum(ruido + deriva)
+    close = nivel * np.exp(log_close)
+    open_ = np.r_[nivel, close[:-1]]
+    mechas = _rng(symbol, semilla, 2).uniform(0, 0.004, (2, n))
+    high = np.maximum(open_, close) * (1 + mechas[0])
+    low = np.minimum(open_, close) * (1 - mechas[1])
+    volume = _rng(symbol, semilla, 3).lognormal(5, 0.6, n)
+    presentes = np.ones(n, dtype=bool)
+    if perfil == 'huecos':
+        # Bloques de 4 velas ausentes tras cada inicio de mantenimiento (solo hacia atrás: prefijo estable)
+        inicios = _rng(symbol, semilla, 4).random(n) < 0.005
+        presentes = np.convolve(inicios, np.ones(4, dtype=int))[:n] == 0
+    return open_, high, low, close, volume, presentes
+
+
+def agregar_velas(serie, factor):
+    """
+    Agrupa cada 'factor' velas base (solo las presentes) en una vela del marco superior.
+    Devuelve (índice de grupo, open, high, low, close, volume) de los grupos con alguna vela.
+    """
+    o, h, l, c, v, presentes = serie
+    idx = np.flatnonzero(presentes)
+    grupo = idx // factor
+    inicio = np.r_[0, np.flatnonzero(np.diff(grupo)) + 1] if len(idx) else np.array([], dtype=int)
+    if not len(inicio): return (np.array([], dtype=np.int64),) + tuple(np.array([]) for _ in range(5))
+    ultima = np.r_[inicio[1:], len(idx)] - 1
+    return (grupo[inicio], o[idx][inicio], np.maximum.reduceat(h[idx], inicio), np.minimum.reduceat(l[idx], inicio),
+            c[idx][ultima], np.add.reduceat(v[idx], inicio))
+
+
+def ventanas_sinteticas(n_simbolos, n_barras=BARRAS_INDICADORES, perfil='mixto', semilla=0):
+    """DataFrames OHLCV M15 de 'n_barras' (sin huecos) para medir solo el cálculo de indicadores."""
+    dfs = []
+    for i in range(n_simbolos):
+        o, h, l, c, v, _ = serie_sintetica(f"BENCH{i}USDT", n_barras, perfil, semilla)
+        dfs.append(pd.DataFrame({'Open': o, 'High': h, 'Low': l, 'Close': c, 'Volume': v}))
+    return dfs
+
+# ==============================================================================
+# 2. CLIENTE FALSO DE BINANCE
+# ==============================================================================
+
+class ClienteFalso(Client):
+    """
+    Client de python-binance sin red: las velas y precios salen de serie_sintetica.
+    Cada llamada espera 'latencia_ms' (simula el viaje a la API) y se cuenta en 'llamadas'.
+    """
+
+    def __init__(self, api_key=None, api_secret=None, requests_params=None, n_simbolos=100,
+                 perfil='mixto', latencia_ms=0.0, semilla=0):
+        # No se llama a Client.__init__: ni sesión HTTP ni ping al exchange
+        self.simbolos = [f"BENCH{i}USDT" for i in range(n_simbolos)]
+        self.perfil, self.latencia_ms, self.semilla = perfil, latencia_ms, semilla
+        self.response = self.session = None
+        self.llamadas = collections.Counter()
+        self._lock = threading.Lock()
+        self.inicio_ms = (int(time.time() * 1000) // DIA_MS - HISTORIAL_SINTETICO_DIAS) * DIA_MS
+        self._ultimos = {}  # symbol -> (índice de la vela M15 en curso, precio)
+
+    def _llamada(self, metodo):
+        with self._lock: self.llamadas[metodo] += 1
+        if self.latencia_ms: time.sleep(self.latencia_ms / 1000)
+
+    def _velas(self, symbol, interval, inicio_ms, fin_ms, limit):
+        paso, paso_base, t0 = INTERVALO_MS[interval], INTERVALO_MS[INTERVALO_BASE], self.inicio_ms
+        ahora = int(time.time() * 1000)
+        fin_ms = min(ahora if fin_ms is None else int(fin_ms), ahora)
+        if inicio_ms is None: inicio_ms = fin_ms - (limit - 1) * paso
+        primera = max(0, -(-(int(inicio_ms) - t0) // paso))
+        ultima = (fin_ms - t0) // paso
+        if ultima < primera: return []
+        # La vela superior en curso solo incluye las velas base ya empezadas
+        n_base = min((ultima + 1) * (paso // paso_base), (ahora - t0) // paso_base + 1)
+        grupo, *columnas = agregar_velas(serie_sintetica(symbol, n_base, self.perfil, self.semilla), paso // paso_base)
+        sel = np.flatnonzero(grupo >= primera)[:limit]
+        # Mismo formato que la API: precios y volumen como texto
+        columnas = [a[sel].astype(str).tolist() for a in columnas]
+        return [[t0 + g * paso, *fila, t0 + (g + 1) * paso - 1, '0', 0, '0', '0', '0']
+                for g, fila in zip(grupo[sel].tolist(), zip(*columnas))]
+
+    def _precio(self, symbol):
+        """Cierre (parcial) de la vela M15 en curso, cacheado mientras no cambie la vela."""
+        indice = (int(time.time() * 1000) - self.inicio_ms) // INTERVALO_MS[INTERVALO_BASE]
+        ultimo = self._ultimos.get(symbol)
+        if ultimo is None or ultimo[0] != indice:
+            cierre = serie_sintetica(symbol, indice + 1, self.perfil, self.semilla)[3][-1]
+            ultimo = self._ultimos[symbol] = (indice, float(cierre))
+        return ultimo[1]
+
+    def futures_klines(self, symbol, interval, startTime=None, endTime=None, limit=500, **kwargs):
+        self._llamada('futures_klines')
+        return self._velas(symbol, interval, startTime, endTime, min(int(limit), MAX_KLINES_POR_PETICION))
+
+    def futures_historical_klines(self, symbol, interval, start_str, end_str=None, limit=1000, **kwargs):
+        inicio = start_str if isinstance(start_str, int) else date_to_milliseconds(start_str)
+        fin = None if end_str is None else end_str if isinstance(end_str, int) else date_to_milliseconds(end_str)
+        velas = []
+        while True:
+            pagina = self.futures_klines(symbol, interval, startTime=inicio, endTime=fin, limit=limit)
+            velas += pagina
+            if len(pagina) < limit: return velas
+            inicio = pagina[-1][0] + INTERVALO_MS[interval]
+
+    def futures_ticker(self, symbol=None, **kwargs):
+        """Estadísticas de 24 h (volumen en USDT decreciente con el índice del símbolo)."""
+        self._llamada('futures_ticker')
+        def ticker(i, s):
+            precio = self._precio(s)
+            return {'symbol': s, 'lastPrice': repr(precio), 'quoteVolume': repr(1e9 / (i + 1)),
+                    'highPrice': repr(precio * (1 + 0.01 * (i % 7 + 1))), 'lowPrice': repr(precio * (1 - 0.01 * (i % 5 + 1))),
+                    'volume': repr(1e9 / (i + 1) / precio), 'count': 100000 // (i + 1) + 1,
+                    'closeTime': int(time.time() * 1000)}
+        if symbol: return ticker(self.simbolos.index(symbol), symbol)
+        return [ticker(i, s) for i, s in enumerate(self.simbolos)]
+
+    def futures_symbol_ticker(self, symbol=None, **kwargs):
+        self._llamada('futures_symbol_ticker')
+        ahora = int(time.time() * 1000)
+        if symbol: return {'symbol': symbol, 'price': repr(self._precio(symbol)), 'time': ahora}
+        return [{'symbol': s, 'price': repr(self._precio(s)), 'time': ahora} for s in self.simbolos]
+
+    def futures_time(self):
+        self._llamada('futures_time')
+        return {'serverTime': int(time.time() * 1000)}
+
+# ==============================================================================
+# 3. ETAPAS MEDIDAS
+# ==============================================================================
+
+def medir(funcion, memoria=False):
+    """(segundos, pico de memoria en MB o None, resultado) de funcion()."""
+    if memoria: tracemalloc.start()
+    try:
+        t0 = time.perf_counter()
+        resultado = funcion()
+        segundos = time.perf_counter() - t0
+        pico = tracemalloc.get_traced_memory()[1] / 2 ** 20 if memoria else None
+    finally:
+        if memoria: tracemalloc.stop()
+    return segundos, pico, resultado
+
+
+def _fila(segundos, n, pico=None, llamadas=None):
+    fila = {'segundos': round(segundos, 4), 'ms_por_simbolo': round(segundos * 1000 / max(n, 1), 4)}
+    if pico is not None: fila['memoria_mb'] = round(pico, 2)
+    if llamadas is not None: fila['llamadas_api'] = llamadas
+    return fila
+
+
+def bench_indicadores(n, perfil='mixto', semilla=0):
+    """calculate_adx símbolo a símbolo (pandas) frente a calcular_indicadores_lote de todo el universo."""
+    dfs = ventanas_sinteticas(n, perfil=perfil, semilla=semilla)
+    segundos, _, _ = medir(lambda: [calculate_adx(df.copy()) for df in dfs])
+    resultados = {'adx_pandas': _fila(segundos, n)}
+    def lote():
+        m = apilar_ventanas(dfs)
+        return calcular_indicadores_lote(m['High'], m['Low'], m['Close'], m['Volume'])
+    segundos, _, _ = medir(lote)
+    _, pico, _ = medir(lote, memoria=True)
+    resultados['indicadores_lote'] = _fila(segundos, n, pico)
+    return resultados
+
+
+def cargar_bot(directorio):
+    """
+    Importa monitor_signals dentro de 'directorio' (ahí quedan su log, sus bases de datos y
+    sus archivos) con ClienteFalso en lugar del cliente real y sin notificaciones de Telegram.
+    """
+    os.environ.setdefault('API_KEY', 'benchmark'); os.environ.setdefault('SECRET_KEY', 'benchmark')
+    os.environ['TELEGRAM_BOT_TOKEN'] = ''
+    os.chdir(directorio)
+    original, binance.client.Client = binance.client.Client, ClienteFalso
+    try: import monitor_signals
+    finally: binance.client.Client = original
+    # Se evalúa a cualquier hora (el filtro de horario cortaría el escaneo)
+    monitor_signals.horario_operativo = lambda hora_utc: True
+    return monitor_signals
+
+
+def preparar_bot(ms, cliente, n, directorio, peso_por_minuto=None):
+    """Estado limpio del bot para un universo de 'n' símbolos servido por 'cliente'."""
+    ms.client = ClienteLimitado(cliente, LimitadorPeso(peso_por_minuto or PESO_SIN_LIMITE))
+    ms.reloj_servidor.client = ms.client
+    ms.kline_store = KlineStore(os.path.join(directorio, f'klines_{n}.db'))
+    ms.trade_store = ms.cuenta_principal.trade_store = TradeStore(os.path.join(directorio, f'trades_{n}_escaneo.db'))
+    ms.cuentas = [ms.cuenta_principal]
+    ms.tabla_diaria.update(fecha=None, pivots={}, contexto={})
+    ms.universo_actual.update(fecha=None, simbolos={})  # Sin niveles: se escanean los 'n' en cada vela
+    ms.series_h1 = RemuestreadorIncremental(Client.KLINE_INTERVAL_1HOUR)
+    ms.instantanea_precios = InstantaneaPrecios()
+    if os.path.exists(ms.PIVOTS_FILE): os.remove(ms.PIVOTS_FILE)
+    with open(ms.SYMBOLS_FILE, 'w') as f: json.dump(cliente.simbolos[:n], f)
+
+
+def abrir_trades_sinteticos(ms, all_pivots):
+    """Un trade LONG abierto por símbolo, con entrada en el precio actual."""
+    for symbol in all_pivots:
+        trade = {'status': 'OPEN', 'entry_type': 'LONG', 'entry_price': ms.client._client._precio(symbol),
+                 'tp1_hit': False, 'tp2_hit': False, 'entry_date': pd.Timestamp.now(tz='UTC').isoformat()}
+        trade.update(NIVELES_TRADE['LONG'])
+        ms.trade_store.abrir(symbol, trade)
+
+
+def bench_bot(ms, n, directorio, latencia_ms=0.0, perfil='mixto', semilla=0, etapas=ETAPAS, peso_por_minuto=None):
+    """Pivotes, escaneo en frío / en caliente y check_active_trades con un universo de 'n' símbolos."""
+    cliente = ClienteFalso(n_simbolos=n, perfil=perfil, latencia_ms=latencia_ms, semilla=semilla)
+    preparar_bot(ms, cliente, n, directorio, peso_por_minuto)
+    cierre_ms = int(time.time() * 1000) // INTERVALO_MS['15m'] * INTERVALO_MS['15m']
+    resultados = {}
+
+    def etapa(nombre, funcion, memoria=False):
+        previas = sum(cliente.llamadas.values())
+        segundos, pico, resultado = medir(funcion, memoria)
+        resultados[nombre] = _fila(segundos, n, pico, sum(cliente.llamadas.values()) - previas)
+        return resultado
+
+    all_pivots = etapa('pivotes', ms.cargar_pivotes)
+    if not all_pivots: raise RuntimeError("No se pudieron calcular los pivotes sintéticos")
+    if 'escaneo' in etapas:
+        etapa('escaneo_frio', lambda: ms.detect_new_signals(all_pivots, cierre_ms=cierre_ms))
+        # Sin trades abiertos, para escanear el mismo universo que en frío
+        ms.trade_store = ms.cuenta_principal.trade_store = TradeStore(os.path.join(directorio, f'trades_{n}_caliente.db'))
+        etapa('escaneo_caliente', lambda: ms.detect_new_signals(all_pivots, cierre_ms=cierre_ms))
+        ms.trade_store = ms.cuenta_principal.trade_store = TradeStore(os.path.join(directorio, f'trades_{n}_memoria.db'))
+        _, pico, _ = medir(lambda: ms.detect_new_signals(all_pivots, cierre_ms=cierre_ms), memoria=True)
+        resultados['escaneo_caliente']['memoria_mb'] = round(pico, 2)
+    if 'salidas' in etapas:
+        ms.trade_store = ms.cuenta_principal.trade_store = TradeStore(os.path.join(directorio, f'trades_{n}_salidas.db'))
+        abrir_trades_sinteticos(ms, all_pivots)
+        etapa('check_active_trades', lambda: ms.check_active_trades(all_pivots, cierre_ms=cierre_ms), memoria=True)
+    return resultados
+
+
+def ejecutar(tamanos, latencia_ms=0.0, perfil='mixto', semilla=0, etapas=ETAPAS, workers=None, peso_por_minuto=None):
+    """Resultados {'etapa/n_simbolos': {...}} de todas las etapas para cada tamaño de universo."""
+    resultados = {}
+    if 'indicadores' in etapas:
+        for n in tamanos:
+            for nombre, fila in bench_indicadores(n, perfil, semilla).items():
+                resultados[f"{nombre}/{n}"] = fila
+    etapas_bot = [e for e in etapas if e != 'indicadores']
+    if not etapas_bot: return resultados
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix='bench_bot_') as directorio:
+        try:
+            ms = cargar_bot(directorio)
+            if workers: ms.SCAN_WORKERS = workers
+            for n in tamanos:
+                print(f"Universo de {n} símbolos...", flush=True)
+                for nombre, fila in bench_bot(ms, n, directorio, latencia_ms, perfil, semilla, etapas_bot,
+                                              peso_por_minuto).items():
+                    resultados[f"{nombre}/{n}"] = fila
+        finally:
+            os.chdir(cwd)
+    return resultados
+
+# ==============================================================================
+# 4. INFORME Y LÍNEA BASE
+# ==============================================================================
+
+def _claves(resultados):
+    por_etapa = collections.defaultdict(list)
+    for clave in resultados:
+        nombre, n = clave.rsplit('/', 1)
+        por_etapa[nombre].append(int(n))
+    return {nombre: sorted(ns) for nombre, ns in por_etapa.items()}
+
+
+def exponente_escalado(resultados, nombre, tamanos):
+    """Pendiente log-log del tiempo frente al número de símbolos (1 = lineal) entre el menor y el mayor tamaño."""
+    if len(tamanos) < 2: return None
+    t1, t2 = resultados[f"{nombre}/{tamanos[0]}"]['segundos'], resultados[f"{nombre}/{tamanos[-1]}"]['segundos']
+    if t1 <= 0 or t2 <= 0: return None
+    return math.log(t2 / t1) / math.log(tamanos[-1] / tamanos[0])
+
+
+def imprimir(resultados):
+    for nombre, tamanos in _claves(resultados).items():
+        print(f"\n{nombre}")
+        print(f"  {'símbolos':>9} {'s':>9} {'ms/símbolo':>11} {'MB':>8} {'llamadas':>9}")
+        for n in tamanos:
+            f = resultados[f"{nombre}/{n}"]
+            print(f"  {n:>9} {f['segundos']:>9.3f} {f['ms_por_simbolo']:>11.3f} "
+                  f"{f.get('memoria_mb', ''):>8} {f.get('llamadas_api', ''):>9}")
+        exponente = exponente_escalado(resultados, nombre, tamanos)
+        if exponente is not None: print(f"  escalado ~ n^{exponente:.2f}")
+
+
+def comparar(resultados, base, tolerancia=TOLERANCIA_REGRESION):
+    """Filas (clave, métrica, base, actual, ratio, regresión) de las claves presentes en ambos."""
+    filas = []
+    for clave, fila in sorted(resultados.items()):
+        previa = base.get(clave)
+        if not previa: continue
+        for metrica, minimo in (('segundos', MIN_DIFERENCIA_SEG), ('memoria_mb', 1.0)):
+            if metrica not in fila or metrica not in previa: continue
+            antes, ahora = previa[metrica], fila[metrica]
+            ratio = ahora / antes if antes else float('inf')
+            filas.append((clave, metrica, antes, ahora, ratio, ratio > 1 + tolerancia and ahora - antes > minimo))
+    return filas
+
+
+def guardar_base(resultados, meta, path=BENCH_BASE_FILE):
+    with open(path, 'w') as f: json.dump({'meta': meta, 'resultados': resultados}, f, indent=2)
+    print(f"\nLínea base guardada en {path}")
+
+
+def cargar_base(path=BENCH_BASE_FILE):
+    with open(path, 'r') as f: return json.load(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks del bot con velas sintéticas y un cliente de Binance falso.")
+    parser.add_argument('--simbolos', type=int, nargs='+', default=[100, 500, 1000],
+                        help="tamaños del universo (p. ej. 100 1000 5000)")
+    parser.add_argument('--etapas', nargs='+', choices=ETAPAS, default=list(ETAPAS))
+    parser.add_argument('--latencia-ms', type=float, default=0.0, help="latencia simulada por llamada a la API")
+    parser.add_argument('--perfil', choices=('mixto',) + PERFILES, default='mixto')
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None, help="SCAN_WORKERS del escaneo (por defecto el del entorno)")
+    parser.add_argument('--peso-api', type=int, default=None,
+                        help="peso por minuto del limitador (por defecto sin límite)")
+    parser.add_argument('--base', default=BENCH_BASE_FILE, help="archivo de la línea base")
+    parser.add_argument('--guardar-base', action='store_true', help="guarda los resultados como línea base")
+    parser.add_argument('--comparar', action='store_true', help="compara con la línea base y falla si hay regresión")
+    parser.add_argument('--tolerancia', type=float, default=TOLERANCIA_REGRESION)
+    args = parser.parse_args(argv)
+
+    base_path = os.path.abspath(args.base)
+    meta = {'fecha': pd.Timestamp.now(tz='UTC').isoformat(), 'simbolos': args.simbolos, 'etapas': args.etapas,
+            'latencia_ms': args.latencia_ms, 'perfil': args.perfil, 'semilla': args.semilla,
+            'workers': args.workers, 'python': sys.version.split()[0], 'numpy': np.__version__, 'pandas': pd.__version__}
+    resultados = ejecutar(sorted(set(args.simbolos)), args.latencia_ms, args.perfil, args.semilla,
+                          args.etapas, args.workers, args.peso_api)
+    imprimir(resultados)
+
+    codigo = 0
+    if args.comparar:
+        base = cargar_base(base_path)
+        if any(base['meta'].get(k) != meta[k] for k in ('latencia_ms', 'perfil', 'semilla', 'workers')):
+            print("\n⚠️ La línea base se midió con otra configuración (latencia, perfil, semilla o workers).")
+        filas = comparar(resultados, base['resultados'], args.tolerancia)
+        print(f"\nComparación con {base_path} (tolerancia {args.tolerancia:.0%})")
+        for clave, metrica, antes, ahora, ratio, regresion in filas:
+            print(f"  {'❌' if regresion else '✅'} {clave:<32} {metrica:<10} {antes:>10.3f} -> {ahora:>10.3f} (x{ratio:.2f})")
+        if any(f[-1] for f in filas):
+            print("Regresión de rendimiento detectada.")
+            codigo = 1
+    if args.guardar_base: guardar_base(resultados, meta, base_path)
+    return codigo
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+Varias cuentas sobre un único flujo de datos de mercado.
+
+Las velas, los precios, los pivotes y la evaluación de señales se hacen una
+sola vez (con el cliente de la cuenta principal); cada Cuenta solo aporta lo
+que es suyo: su almacén de trades, su chat de Telegram y su propio cliente
+de la API (sesión HTTP y presupuesto de peso por clave) para las llamadas de
+sus trades, como el precio individual de un símbolo abierto que falta en la
+instantánea de precios. El cliente se crea la primera vez que se usa, así que
+una cuenta más cuesta una consulta SQLite por ciclo y ninguna llamada extra a
+la API mientras sus trades no la necesiten.
+
+Configuración (variables de entorno):
+    CUENTAS=cuenta1,cuenta2                 # Cuentas adicionales a la principal
+    BINANCE_API_KEY_<CUENTA> / BINANCE_API_SECRET_<CUENTA>
+    TELEGRAM_CHAT_ID_<CUENTA>               # Por defecto, el chat principal
+    TELEGRAM_BOT_TOKEN_<CUENTA>             # Por defecto, el bot principal
+    PESO_API_POR_MINUTO_<CUENTA>            # Por defecto, PESO_API_POR_MINUTO
+"""
+import os
+import re
+import threading
+import time
+import logging
+
+from limitador_api import LimitadorPeso, ClienteLimitado, PESO_MAX_POR_MINUTO
+
+logger = logging.getLogger(__name__)
+
+CUENTA_PRINCIPAL = 'principal'
+
+
+def nombres_cuentas(valor):
+    """'cuenta1, cuenta2' -> ['cuenta1', 'cuenta2'] (sin vacíos, duplicados ni la principal)."""
+    nombres = []
+    for nombre in (valor or '').split(','):
+        nombre = nombre.strip()
+        if nombre and nombre != CUENTA_PRINCIPAL and nombre not in nombres: nombres.append(nombre)
+    return nombres
+
+
+def sufijo_archivo(nombre):
+    """Sufijo seguro para los archivos propios de la cuenta ('' para la principal)."""
+    return '' if nombre == CUENTA_PRINCIPAL else '_' + re.sub(r'[^A-Za-z0-9_-]', '_', nombre)
+
+
+def con_sufijo(path, nombre):
+    """'trades.db' -> 'trades_cuenta1.db' (sin cambios para la principal)."""
+    base, extension = os.path.splitext(path)
+    return f"{base}{sufijo_archivo(nombre)}{extension}"
+
+
+class Cuenta:
+    """Estado propio de una cuenta: trades, notificaciones y cliente de la API con su presupuesto de peso."""
+
+    def __init__(self, nombre, trade_store, despachador, client=None, crear_cliente=None,
+                 peso_por_minuto=PESO_MAX_POR_MINUTO, metricas=None, historico_csv=None, parquet_dir=None):
+        self.nombre = nombre
+        self.trade_store = trade_store
+        self.despachador = despachador
+        self.historico_csv = historico_csv
+        self.parquet_dir = parquet_dir
+        self.peso_por_minuto = peso_por_minuto
+        self.metricas = metricas
+        self._client = client
+        self._crear_cliente = crear_cliente  # () -> Client de la cuenta (solo se llama al primer uso)
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        """Cliente de la API de la cuenta, con su propio LimitadorPeso (el peso se cuenta por clave); None sin claves."""
+        with self._lock:
+            if self._client is None and self._crear_cliente is not None:
+                self._client = ClienteLimitado(self._crear_cliente(), LimitadorPeso(self.peso_por_minuto), self.metricas)
+            return self._client
+
+    def enviar(self, mensaje):
+        # Las cuentas adicionales pueden compartir chat: el mensaje lleva el nombre de la cuenta
+        self.despachador.enviar(mensaje if self.nombre == CUENTA_PRINCIPAL else f"[{self.nombre}] {mensaje}")
+
+    def activos(self):
+        """Trades abiertos de la cuenta (symbol -> trade); {} si el almacén falla."""
+        try: return self.trade_store.activos()
+        except Exception as e:
+            logger.error(f"Error al cargar los trades activos de la cuenta {self.nombre}: {e}")
+            return {}
+
+
+def cargar_cuentas(nombres, crear_trade_store, crear_despachador, crear_cliente, trades_db, historico_csv,
+                   parquet_dir='', peso_por_minuto=PESO_MAX_POR_MINUTO, metricas=None, entorno=None, despachadores=None):
+    """
+    Cuentas adicionales a partir de las variables de entorno de cada nombre (ver el docstring del módulo).
+    crear_trade_store(path), crear_despachador(token, chat_id) y crear_cliente(nombre, api_key, api_secret)
+    construyen los recursos; los despachadores con el mismo bot y chat se comparten ('despachadores':
+    (token, chat_id) -> despachador ya creados, p. ej. el de la cuenta principal).
+    """
+    entorno = os.environ if entorno is None else entorno
+    despachadores, cuentas = dict(despachadores or {}), []
+    for nombre in nombres:
+        token = entorno.get(f"TELEGRAM_BOT_TOKEN_{nombre}") or entorno.get("TELEGRAM_BOT_TOKEN")
+        chat_id = entorno.get(f"TELEGRAM_CHAT_ID_{nombre}") or entorno.get("TELEGRAM_CHAT_ID")
+        if (token, chat_id) not in despachadores: despachadores[(token, chat_id)] = crear_despachador(token, chat_id)
+        api_key, api_secret = entorno.get(f"BINANCE_API_KEY_{nombre}"), entorno.get(f"BINANCE_API_SECRET_{nombre}")
+        if not api_key or not api_secret:
+            logger.warning(f"Cuenta {nombre} sin BINANCE_API_KEY_{nombre} / BINANCE_API_SECRET_{nombre}: solo seguimiento de señales.")
+        cuentas.append(Cuenta(
+            nombre, crear_trade_store(con_sufijo(trades_db, nombre)), despachadores[(token, chat_id)],
+            crear_cliente=(lambda n=nombre, k=api_key, s=api_secret: crear_cliente(n, k, s)) if api_key and api_secret else None,
+            peso_por_minuto=int(entorno.get(f"PESO_API_POR_MINUTO_{nombre}") or peso_por_minuto), metricas=metricas,
+            historico_csv=con_sufijo(historico_csv, nombre),
+            parquet_dir=os.path.join(parquet_dir, nombre) if parquet_dir else ''))
+    return cuentas
+
+
+class _ClienteFalso:
+    """Client mínimo para verificar_presupuestos: sin red ni cabeceras de peso."""
+    response = None
+
+    def futures_symbol_ticker(self, symbol=None):
+        return {'symbol': symbol, 'price': '1'}
+
+
+def verificar_presupuestos(peso_por_minuto=60):
+    """Dos cuentas con clave propia gastan presupuestos de peso separados: agotar uno no frena al otro."""
+    entorno = {'BINANCE_API_KEY_a': 'ka', 'BINANCE_API_SECRET_a': 'sa',
+               'BINANCE_API_KEY_b': 'kb', 'BINANCE_API_SECRET_b': 'sb'}
+    creados = []
+    a, b, c = cargar_cuentas(['a', 'b', 'c'], lambda path: None, lambda token, chat_id: None,
+                             lambda nombre, api_key, api_secret: creados.append(nombre) or _ClienteFalso(),
+                             'trades.db', 'historico.csv', peso_por_minuto=peso_por_minuto, entorno=entorno)
+    if creados: raise AssertionError("Clientes creados antes del primer uso")
+    if c.client is not None: raise AssertionError("Una cuenta sin claves no debe tener cliente propio")
+    if a.client is b.client or a.client.limitador is b.client.limitador:
+        raise AssertionError("Las cuentas comparten cliente o limitador")
+    for _ in range(peso_por_minuto): a.client.futures_symbol_ticker(symbol='BTCUSDT')
+    if a.client.limitador.tokens >= 1: raise AssertionError("El peso de la cuenta a no se descontó de su presupuesto")
+    t0 = time.monotonic()
+    for _ in range(peso_por_minuto): b.client.futures_symbol_ticker(symbol='BTCUSDT')
+    if time.monotonic() - t0 > 0.5: raise AssertionError("La cuenta b espera por el peso gastado por la cuenta a")
+    if b.client.limitador.tokens >= 1: raise AssertionError("El peso de la cuenta b no se descontó de su presupuesto")
+    if creados != ['a', 'b']: raise AssertionError(f"Clientes creados: {creados}")
+    return 2 * peso_por_minuto
+
+
+if __name__ == '__main__':
+    print(f"Presupuestos de peso por cuenta OK ({verificar_presupuestos()} llamadas)")
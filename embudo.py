@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+Embudo de filtros perezoso para la evaluación de señales.
+
+Las reglas de entrada se expresan como una lista ordenada de etapas, de la más
+barata y selectiva (cruce de EMAs en la última vela, zona de pivotes) a la más
+cara (set completo de indicadores, consultas de contexto). Cada etapa recibe
+solo los candidatos que sobrevivieron a las anteriores, así lo caro se calcula
+para unos pocos símbolos. Cada ejecución deja el embudo de descartes (cuántos
+candidatos eliminó cada etapa) para el log y las métricas.
+"""
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class EmbudoFiltros:
+    """Etapas (nombre, función) aplicadas en orden; cada función recibe la lista de candidatos y devuelve los que pasan."""
+
+    def __init__(self, etapas, metricas=None):
+        self.etapas = list(etapas)
+        self.metricas = metricas  # RegistroMetricas opcional: duración y descartes por etapa
+        self.ultimo = []          # [(etapa, entran, pasan, segundos)] de la última ejecución
+
+    def ejecutar(self, candidatos):
+        """Pasa 'candidatos' por las etapas (se corta en cuanto no queda ninguno) y devuelve los supervivientes."""
+        self.ultimo = []
+        for nombre, funcion in self.etapas:
+            entran = len(candidatos)
+            t0 = time.perf_counter()
+            if candidatos: candidatos = list(funcion(candidatos))
+            segundos = time.perf_counter() - t0
+            self.ultimo.append((nombre, entran, len(candidatos), segundos))
+            if self.metricas:
+                if entran: self.metricas.observar('bot_etapa_segundos', segundos, etapa=nombre)
+                self.metricas.incrementar('bot_embudo_descartes_total', entran - len(candidatos), etapa=nombre)
+                self.metricas.fijar('bot_embudo_pasan', len(candidatos), etapa=nombre)
+        return candidatos
+
+    def descartes(self):
+        """etapa -> candidatos que eliminó en la última ejecución."""
+        return {nombre: entran - pasan for nombre, entran, pasan, _ in self.ultimo}
+
+    def resumen(self):
+        """'300 → datos 298 → cruce 9 → ...' de la última ejecución."""
+        if not self.ultimo: return "sin ejecutar"
+        return " → ".join([str(self.ultimo[0][1])] + [f"{nombre} {pasan}" for nombre, _, pasan, _ in self.ultimo])
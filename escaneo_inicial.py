@@ -1,7 +1,9 @@
-import json
-from binance.client import Client
+import argparse
+import time
 from dotenv import load_dotenv
 import os
+from transporte import cliente_binance, GRABACION_DIR
+import universo
 
 # Cargar variables de entorno del archivo .env
 # Este comando debe estar al inicio para que las claves estén disponibles.
@@ -13,35 +15,31 @@ load_dotenv()
 # Se usa os.getenv() para buscar las variables dentro del entorno cargado.
 API_KEY = os.getenv("API_KEY")
 SECRET_KEY = os.getenv("SECRET_KEY")
+MODO_TRANSPORTE = os.getenv("BINANCE_TRANSPORTE", "directo") # 'directo', 'grabar' o 'reproducir' (ver transporte.py)
 
-# Verifica si las claves existen antes de inicializar el cliente
-if not API_KEY or not SECRET_KEY:
+# Verifica si las claves existen antes de inicializar el cliente (la reproducción no las necesita)
+if (not API_KEY or not SECRET_KEY) and MODO_TRANSPORTE != 'reproducir':
     raise ValueError("ERROR: API_KEY o SECRET_KEY no se encontraron en el archivo .env. Asegúrate de que el archivo existe y las variables están definidas.")
 
-client = Client(API_KEY, SECRET_KEY)
+client = cliente_binance(API_KEY, SECRET_KEY, modo=MODO_TRANSPORTE,
+                         directorio=os.getenv("BINANCE_GRABACION_DIR", GRABACION_DIR), origen='escaneo_inicial')
 
-def obtener_top_symbols(limit=200):
-    """Obtiene los 'limit' mejores pares de USDT de Binance Futures."""
+def obtener_top_symbols(limit=universo.MAX_SIMBOLOS, min_volumen=universo.MIN_VOLUMEN_USDT,
+                        activos=universo.SIMBOLOS_ACTIVOS):
+    """
+    Obtiene los 'limit' mejores pares USDT perpetuos de Binance Futures, ordenados por volumen
+    y volatilidad de 24 h (ver universo.py), con su nivel de escaneo. Muestra las altas y
+    bajas respecto al universo anterior.
+    """
     try:
-        # Usamos la función de futuros ya que tu monitoreo es en Futures.
-        tickers = client.futures_ticker()
-        
-        # Filtra solo pares contra USDT y excluye índices
-        usdt_pairs = [t for t in tickers if t['symbol'].endswith('USDT') and not t['symbol'].endswith('_USDT')]
-
-        # Tomamos los primeros 'limit' pares
-        top_symbols = [t['symbol'] for t in usdt_pairs[:limit]]
-
-        if not top_symbols:
-            print("❌ Error: No se encontraron pares USDT.")
-            return []
-
-        # Guardar en JSON
-        with open('top_100_symbols.json', 'w') as f:
-            json.dump(top_symbols, f)
-
-        print(f"✅ Se guardaron {len(top_symbols)} pares en 'top_100_symbols.json'.")
-        return top_symbols
+        previo = universo.cargar(universo.UNIVERSO_FILE)
+        nuevo, dif = universo.escanear(client, previo, max_simbolos=limit, min_volumen=min_volumen, n_activos=activos)
+        simbolos = nuevo['simbolos']
+        n_activos = sum(1 for info in simbolos.values() if info['nivel'] == 'activo')
+        print(f"✅ Se guardaron {len(simbolos)} pares en '{universo.SYMBOLS_FILE}' "
+              f"({n_activos} activos, {len(simbolos) - n_activos} latentes; detalle en '{universo.UNIVERSO_FILE}').")
+        if previo: print(f"   Cambios respecto al escaneo anterior: {universo.resumen_diferencias(dif)}")
+        return list(simbolos)
 
     except Exception as e:
         print(f"❌ Error al obtener/guardar símbolos. Verifica la conexión a la API: {e}")
@@ -49,4 +47,13 @@ def obtener_top_symbols(limit=200):
 
 # Ejecutar el escaneo inicial
 if __name__ == '__main__':
-    obtener_top_symbols(limit=200)
+    parser = argparse.ArgumentParser(description="Selecciona el universo de pares USDT por liquidez y volatilidad.")
+    parser.add_argument('--limite', type=int, default=universo.MAX_SIMBOLOS, help="número máximo de pares")
+    parser.add_argument('--min-volumen', type=float, default=universo.MIN_VOLUMEN_USDT, help="volumen mínimo de 24 h en USDT")
+    parser.add_argument('--activos', type=int, default=universo.SIMBOLOS_ACTIVOS, help="pares del nivel activo (cada vela)")
+    parser.add_argument('--cada-horas', type=float, default=0, help="repetir el escaneo cada N horas (0 = una vez)")
+    args = parser.parse_args()
+    while True:
+        obtener_top_symbols(args.limite, args.min_volumen, args.activos)
+        if args.cada_horas <= 0: break
+        time.sleep(args.cada_horas * 3600)
@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+"""
+Reglas de la estrategia (entrada y salida) sin dependencias del cliente de Binance.
+
+Las usan tanto el bot en vivo (monitor_signals.py) como el backtester, para
+que ambos apliquen exactamente la misma lógica. Cada regla de entrada tiene
+una versión escalar (última vela de un símbolo) y una vectorizada (todas las
+velas / todos los símbolos a la vez) que deben mantenerse equivalentes.
+"""
+import numpy as np
+
+# Umbrales de la estrategia (antes fijos dentro de detect_new_signals / get_market_condition)
+PARAMETROS_DEFECTO = {
+    'rsi_min': 50, 'rsi_max': 67,   # Punto 3: Filtro RSI (67)
+    'vol_ratio_min': 1.0,           # Punto 2: Filtro Volumen
+    'adx_min': 25,
+    'hora_corte_utc': 17,           # Punto 1: no operar después de las 17:00 UTC
+    'rsi_diario_max': 75,           # Punto 4: no comprar si el RSI diario > 75
+    'ema_rapida': 24, 'ema_lenta': 50,  # Cruce de entrada
+    'ema_tendencia': 200,           # Filtro de contexto de los SHORT
+}
+
+INDICADORES_REQUERIDOS = ['ADX', 'RSI', 'MACD_hist', 'BB_upper', 'Efficiency_Ratio', 'EMA8', 'EMA24', 'EMA50', 'EMA100', 'EMA200', 'Volume_MA20']
+
+RSI_DIARIO_PERIODO = 14
+MIN_DIAS_RSI_DIARIO = 20  # Con menos velas diarias el mercado se considera favorable
+
+# Claves de pivote usadas como TP1 / TP2 / SL según el tipo de entrada
+NIVELES_TRADE = {
+    'LONG': {'tp1_key': 'R1', 'tp2_key': 'R2', 'sl_key': 'S1'},
+    'SHORT': {'tp1_key': 'PP', 'tp2_key': 'S1', 'sl_key': 'R2'},
+}
+
+# ==============================================================================
+# 1. PIVOTES
+# ==============================================================================
+
+def calculate_pivots_fibonacci(high, low, close):
+    # Asegurarse de que high >= low
+    if high < low: high, low = low, high
+    rango = high - low
+    PP = (high + low + close) / 3
+    FIB_382, FIB_618, FIB_100 = 0.382, 0.618, 1.000
+    R1 = PP + (rango * FIB_382); R2 = PP + (rango * FIB_618); R3 = PP + (rango * FIB_100)
+    S1 = PP - (rango * FIB_382); S2 = PP - (rango * FIB_618); S3 = PP - (rango * FIB_100)
+    return {k: round(v, 4) for k, v in {'PP': PP, 'R1': R1, 'R2': R2, 'R3': R3, 'S1': S1, 'S2': S2, 'S3': S3}.items()}
+
+
+def calcular_pivotes_lote(high, low, close):
+    """calculate_pivots_fibonacci sobre arrays (mismo orden de operaciones). Devuelve dict nivel -> array."""
+    high, low, close = (np.asarray(x, dtype=float) for x in (high, low, close))
+    high, low = np.maximum(high, low), np.minimum(high, low)
+    rango = high - low
+    PP = (high + low + close) / 3
+    FIB_382, FIB_618, FIB_100 = 0.382, 0.618, 1.000
+    niveles = {'PP': PP, 'R1': PP + (rango * FIB_382), 'R2': PP + (rango * FIB_618), 'R3': PP + (rango * FIB_100),
+               'S1': PP - (rango * FIB_382), 'S2': PP - (rango * FIB_618), 'S3': PP - (rango * FIB_100)}
+    return {k: np.round(v, 4) for k, v in niveles.items()}
+
+# ==============================================================================
+# 2. FILTROS DE MERCADO (HORARIO Y TOP-DOWN)
+# ==============================================================================
+
+def horario_operativo(hora_utc, params=PARAMETROS_DEFECTO):
+    """Punto 1: no se abren señales a partir de la hora de corte (UTC)."""
+    return hora_utc < params['hora_corte_utc']
+
+
+def contexto_diario_lote(cierres, n_velas):
+    """
+    Parte del RSI diario que no cambia durante el día, para varios símbolos a la vez.
+    'cierres' son los cierres diarios completos (símbolos x días, alineados a la derecha,
+    NaN a la izquierda) y 'n_velas' las velas diarias de cada símbolo contando la de hoy.
+    Retorna un dict de arrays por símbolo (ver rsi_diario_actual).
+    """
+    cierres = np.asarray(cierres, dtype=float)
+    delta = np.diff(cierres[:, -RSI_DIARIO_PERIODO:], axis=1)  # Las 13 diferencias previas a hoy
+    completo = (cierres.shape[1] >= RSI_DIARIO_PERIODO) & ~np.isnan(delta).any(axis=1)
+    return {'ganancia_previa': np.where(delta > 0, delta, 0.).sum(axis=1),
+            'perdida_previa': np.where(delta < 0, -delta, 0.).sum(axis=1),
+            'cierre_previo': cierres[:, -1], 'completo': completo,
+            'pocos_dias': np.asarray(n_velas) < MIN_DIAS_RSI_DIARIO}
+
+
+def rsi_diario_actual(ganancia_previa, perdida_previa, cierre_previo, precio):
+    """RSI diario (media simple de 14 diferencias) con la vela de hoy cerrando en 'precio'."""
+    delta = np.asarray(precio, dtype=float) - cierre_previo
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ganancia = (ganancia_previa + np.maximum(delta, 0)) / RSI_DIARIO_PERIODO
+        perdida = (perdida_previa + np.maximum(-delta, 0)) / RSI_DIARIO_PERIODO
+        return 100 - (100 / (1 + ganancia / perdida))
+
+
+def favorable_long_diario(rsi_diario, pocos_dias, params=PARAMETROS_DEFECTO):
+    """Punto 4: no comprar con el RSI diario por encima del máximo (sin historial suficiente, favorable)."""
+    return np.logical_or(pocos_dias, np.logical_not(np.greater(rsi_diario, params['rsi_diario_max'])))
+
+# ==============================================================================
+# 3. REGLAS DE ENTRADA
+# ==============================================================================
+
+def columnas_ema(params=PARAMETROS_DEFECTO):
+    """Nombres de las EMAs (rápida, lenta, tendencia) que usan las reglas con estos parámetros."""
+    return tuple(f"EMA{int(params[k])}" for k in ('ema_rapida', 'ema_lenta', 'ema_tendencia'))
+
+
+def calcular_vol_ratio(last):
+    return last['Volume'] / last['Volume_MA20'] if (last['Volume_MA20'] is not None and last['Volume_MA20'] > 0) else 0
+
+
+def reglas_entrada(last, prev, pivotes, favorable_para_long, favorable_para_short, params=PARAMETROS_DEFECTO):
+    """
+    Reglas de entrada sobre la última vela ('last') y la anterior ('prev').
+    Retorna 'LONG', 'SHORT' o None.
+    """
+    R1, R3, S1 = pivotes['R1'], pivotes['R3'], pivotes['S1']
+    ema_r, ema_l, ema_t = columnas_ema(params)
+    price_last_closed = last['Close']
+    vol_ratio = calcular_vol_ratio(last)
+
+    cruce_alcista = (prev[ema_r] < prev[ema_l]) and (last[ema_r] > last[ema_l])
+    cruce_bajista = (prev[ema_r] > prev[ema_l]) and (last[ema_r] < last[ema_l])
+
+    ### ======================================================= ###
+    ### ### AJUSTE: NUEVOS FILTROS LONG (Puntos 2, 3, 4)      ### ###
+    ### ======================================================= ###
+    if (favorable_para_long and cruce_alcista and
+        (S1 < price_last_closed < R1) and last['MACD_hist'] > 0 and
+        (last['RSI'] > params['rsi_min'] and last['RSI'] < params['rsi_max']) and  # <-- Punto 3: Filtro RSI (67)
+        vol_ratio > params['vol_ratio_min'] and                                     # <-- Punto 2: Filtro Volumen
+        last['ADX'] > params['adx_min'] and price_last_closed < last['BB_upper']):
+        return 'LONG'
+
+    ### ======================================================= ###
+    ### ### AJUSTE: NUEVO FILTRO SHORT (Sugerencia EMA 200)   ### ###
+    ### ======================================================= ###
+    if (favorable_para_short and cruce_bajista and
+        (R1 < price_last_closed < R3) and
+        price_last_closed < last[ema_t]): # <-- ¡NUEVO FILTRO DE CONTEXTO EMA 200!
+        return 'SHORT'
+
+    return None
+
+
+def direccion_cruce(rapida, lenta):
+    """
+    Cruce de las EMAs de entrada en la última columna de matrices (símbolos x barras):
+    +1 alcista, -1 bajista, 0 sin cruce. Tanto el LONG como el SHORT lo exigen, así
+    que es el primer filtro del embudo de señales (solo necesita dos EMAs).
+    """
+    r_prev, l_prev, r, l = rapida[:, -2], lenta[:, -2], rapida[:, -1], lenta[:, -1]
+    return np.where((r_prev < l_prev) & (r > l), 1, np.where((r_prev > l_prev) & (r < l), -1, 0))
+
+
+def ultimo_cruce(rapida, lenta, barras=1):
+    """
+    Cruce más reciente dentro de las últimas 'barras' velas de cada fila (entero o array por símbolo):
+    (dirección, desfase) con desfase 0 = última vela; sin cruce, (0, 0). Los símbolos que no se
+    evalúan en cada vela (nivel latente del universo) revisan así las velas que se saltaron.
+    Con barras = 1 equivale a direccion_cruce.
+    """
+    barras = np.broadcast_to(np.asarray(barras, dtype=int), (rapida.shape[0],))
+    direccion, desfase = np.zeros(rapida.shape[0], dtype=int), np.zeros(rapida.shape[0], dtype=int)
+    pendiente = np.ones(rapida.shape[0], dtype=bool)
+    for d in range(min(int(barras.max(initial=1)), rapida.shape[1] - 1)):
+        n = rapida.shape[1] - d
+        cruce = direccion_cruce(rapida[:, :n], lenta[:, :n])
+        nuevo = pendiente & (d < barras) & (cruce != 0)
+        direccion[nuevo], desfase[nuevo] = cruce[nuevo], d
+        pendiente &= ~nuevo
+    return direccion, desfase
+
+
+def en_zona_pivotes(direccion, price, R1, R3, S1):
+    """Zona de pivotes que exige cada cruce: LONG entre S1 y R1, SHORT entre R1 y R3."""
+    return np.where(direccion > 0, (S1 < price) & (price < R1), (direccion < 0) & (R1 < price) & (price < R3))
+
+
+def condiciones_entrada(ind, R1, R3, S1, params=PARAMETROS_DEFECTO):
+    """
+    Parte vectorizada de reglas_entrada que no depende de los umbrales (solo de las EMAs):
+    indicadores completos, cruce, zona de pivotes, MACD, Bollinger y EMA de tendencia.
+    'ind' es un dict nombre -> array (..., barras); los pivotes son arrays del mismo shape.
+    Retorna un dict con las máscaras 'largo' / 'corto' y las series que filtran los umbrales.
+    """
+    def prev(x):
+        p = np.full(x.shape, np.nan); p[..., 1:] = x[..., :-1]
+        return p
+
+    ema_r, ema_l, ema_t = columnas_ema(params)
+    completos = np.ones(ind['Close'].shape, dtype=bool)
+    for k in set(INDICADORES_REQUERIDOS) | {ema_r, ema_l, ema_t}:
+        completos &= ~np.isnan(ind[k])
+    price = ind['Close']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        vol_ratio = np.where(ind['Volume_MA20'] > 0, ind['Volume'] / ind['Volume_MA20'], 0.)
+    rapida, lenta = ind[ema_r], ind[ema_l]
+    cruce_alcista = (prev(rapida) < prev(lenta)) & (rapida > lenta)
+    cruce_bajista = (prev(rapida) > prev(lenta)) & (rapida < lenta)
+
+    largo = completos & cruce_alcista & (S1 < price) & (price < R1) & (ind['MACD_hist'] > 0) & (price < ind['BB_upper'])
+    corto = completos & cruce_bajista & (R1 < price) & (price < R3) & (price < ind[ema_t])
+    return {'largo': largo, 'corto': corto, 'RSI': ind['RSI'], 'ADX': ind['ADX'], 'vol_ratio': vol_ratio}
+
+
+def filtrar_entrada(cond, favorable_para_long, favorable_para_short, params=PARAMETROS_DEFECTO):
+    """Aplica los umbrales y los favorables a condiciones_entrada (o a un subconjunto de sus velas)."""
+    rsi = cond['RSI']
+    largo = (cond['largo'] & favorable_para_long & (rsi > params['rsi_min']) & (rsi < params['rsi_max']) &
+             (cond['vol_ratio'] > params['vol_ratio_min']) & (cond['ADX'] > params['adx_min']))
+    corto = cond['corto'] & ~largo & favorable_para_short
+    return largo, corto
+
+
+def mascaras_entrada(ind, R1, R3, S1, favorable_para_long, favorable_para_short, params=PARAMETROS_DEFECTO):
+    """
+    Versión vectorizada de reglas_entrada para todas las velas a la vez.
+    Incluye el chequeo de indicadores completos. Retorna (mascara_long, mascara_short).
+    """
+    return filtrar_entrada(condiciones_entrada(ind, R1, R3, S1, params), favorable_para_long, favorable_para_short, params)
+
+# ==============================================================================
+# 4. REGLAS DE SALIDA
+# ==============================================================================
+
+def evaluar_salida(trade, price, pivotes, high=None, low=None):
+    """
+    Reglas de salida de un trade abierto al precio 'price'.
+    'high' / 'low' son los extremos de precio desde el último chequeo (recorrido intravela);
+    si no se pasan, solo se juzga 'price'. Ante un SL y un TP en el mismo tramo gana el SL.
+    Retorna (evento, nivel) con evento 'SL', 'TP2', 'TP1' o None.
+    """
+    tp1_level, tp2_level, sl_level = pivotes[trade['tp1_key']], pivotes[trade['tp2_key']], pivotes[trade['sl_key']]
+    is_long = trade['entry_type'] == 'LONG'
+    high = price if high is None else max(high, price)
+    low = price if low is None else min(low, price)
+
+    ### AJUSTE 1 (DATO-CRÍTICO): MOVER SL A BREAK-EVEN EN TP1 ###
+    if trade.get('tp1_hit', False):
+        sl_level = trade['entry_price']
+
+    if (is_long and low < sl_level) or (not is_long and high > sl_level): return 'SL', sl_level
+    if (is_long and high > tp2_level) or (not is_long and low < tp2_level): return 'TP2', tp2_level
+    if ((is_long and high > tp1_level) or (not is_long and low < tp1_level)) and not trade.get('tp1_hit'):
+        return 'TP1', tp1_level
+    return None, None
+
+
+def precio_salida(entry_type, evento, nivel, price):
+    """
+    Precio de cierre de un SL / TP2: el precio actual si ya cruzó el nivel, o el propio
+    nivel si solo lo tocó un extremo intravela (donde se habría ejecutado la orden).
+    """
+    is_long = entry_type == 'LONG'
+    cruzado = (price < nivel) if (is_long == (evento == 'SL')) else (price > nivel)
+    return price if cruzado else nivel
+
+
+def pnl_pct(entry_type, entry_price, close_price):
+    signo = 1 if entry_type == 'LONG' else -1
+    return signo * (close_price / entry_price - 1) * 100
+
+
+# ==============================================================================
+# 5. VERIFICACIÓN
+# ==============================================================================
+
+def verificar_paridad(n_barras=20000, semilla=0):
+    """Compara mascaras_entrada con reglas_entrada vela a vela sobre indicadores sintéticos."""
+    rng = np.random.default_rng(semilla)
+    close = 100 + rng.normal(0, 1, n_barras)
+    ind = {k: rng.normal(0, 1, n_barras) for k in INDICADORES_REQUERIDOS}
+    ind.update({'Close': close, 'Volume': rng.uniform(0, 2, n_barras), 'Volume_MA20': rng.uniform(0, 1.5, n_barras),
+                'RSI': rng.uniform(40, 75, n_barras), 'ADX': rng.uniform(15, 40, n_barras),
+                'BB_upper': close + rng.normal(1, 1, n_barras), 'EMA200': close + rng.normal(0, 1, n_barras)})
+    ind['EMA50'] = ind['EMA24'] + rng.normal(0, 0.1, n_barras)
+    ind['ADX'][rng.random(n_barras) < 0.05] = np.nan
+    R1, R3, S1 = close + rng.normal(0, 1, n_barras), close + rng.normal(1, 1, n_barras), close - rng.normal(0.5, 1, n_barras)
+    fav_l, fav_s = rng.random(n_barras) < 0.8, rng.random(n_barras) < 0.8
+    largo, corto = mascaras_entrada(ind, R1, R3, S1, fav_l, fav_s)
+    # Los prefiltros del embudo (cruce y zona de pivotes) son condiciones necesarias de la señal
+    ema_r, ema_l, _ = columnas_ema()
+    direccion = np.zeros(n_barras, dtype=int)
+    direccion[1:] = direccion_cruce(np.stack([ind[ema_r][:-1], ind[ema_r][1:]], axis=1),
+                                    np.stack([ind[ema_l][:-1], ind[ema_l][1:]], axis=1))
+    prefiltro = en_zona_pivotes(direccion, close, R1, R3, S1)
+    if np.any(largo & ~(prefiltro & (direccion > 0))) or np.any(corto & ~(prefiltro & (direccion < 0))):
+        raise AssertionError("El prefiltro del embudo descarta velas con señal")
+    senales = 0
+    for t in range(1, n_barras):
+        last = {k: v[t] for k, v in ind.items()}; prev = {k: v[t - 1] for k, v in ind.items()}
+        esperado = None
+        if not any(np.isnan(last[k]) for k in INDICADORES_REQUERIDOS):
+            esperado = reglas_entrada(last, prev, {'R1': R1[t], 'R3': R3[t], 'S1': S1[t]}, fav_l[t], fav_s[t])
+        obtenido = 'LONG' if largo[t] else 'SHORT' if corto[t] else None
+        if esperado != obtenido: raise AssertionError(f"Vela {t}: escalar={esperado} vectorizada={obtenido}")
+        senales += esperado is not None
+    return senales
+
+
+def verificar_cruces_latentes(n_simbolos=50, n_barras=400, cadencia=4, semilla=0):
+    """
+    Un símbolo evaluado una vela de cada 'cadencia' (con su fase) no pierde cruces: cada cruce cae en
+    la ventana de algún escaneo y ultimo_cruce devuelve el más reciente de la ventana.
+    """
+    rng = np.random.default_rng(semilla)
+    rapida = np.cumsum(rng.normal(0, 1, (n_simbolos, n_barras)), axis=1)
+    lenta = rapida + rng.normal(0, 1.5, (n_simbolos, n_barras))
+    todos = np.zeros((n_simbolos, n_barras), dtype=int)
+    todos[:, 1:] = direccion_cruce(np.stack([rapida[:, :-1], rapida[:, 1:]], axis=2).reshape(-1, 2),
+                                   np.stack([lenta[:, :-1], lenta[:, 1:]], axis=2).reshape(-1, 2)).reshape(n_simbolos, -1)
+    fases = rng.integers(0, cadencia, n_simbolos)
+    revisados, cruces = np.zeros((n_simbolos, n_barras), dtype=bool), 0
+    for t in range(cadencia, n_barras):
+        escanea = (t + fases) % cadencia == 0
+        direccion, desfase = ultimo_cruce(rapida[:, :t + 1], lenta[:, :t + 1], cadencia)
+        for i in np.flatnonzero(escanea):
+            revisados[i, t - cadencia + 1:t + 1] = True
+            ventana = todos[i, t - cadencia + 1:t + 1]
+            esperado = next(((int(ventana[-1 - d]), d) for d in range(cadencia) if ventana[-1 - d]), (0, 0))
+            if (int(direccion[i]), int(desfase[i])) != esperado:
+                raise AssertionError(f"Símbolo {i}, vela {t}: {(direccion[i], desfase[i])} en vez de {esperado}")
+            cruces += esperado[0] != 0
+    # Entre el primer escaneo completo y el último de cada símbolo todas las velas caen en alguna ventana
+    tramo = slice(2 * cadencia, n_barras - cadencia)
+    if np.any((todos[:, tramo] != 0) & ~revisados[:, tramo]): raise AssertionError("Cruces fuera de toda ventana de escaneo")
+    return cruces
+
+
+if __name__ == '__main__':
+    print(f"Paridad reglas escalares vs vectorizadas OK ({verificar_paridad()} señales comparadas)")
+    print(f"Cruces de los símbolos latentes OK ({verificar_cruces_latentes()} ventanas con cruce)")
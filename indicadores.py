@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+"""
+Indicadores M15 del bot.
+
+- Versión por símbolo (pandas): calcular_indicadores_m15, calculate_adx y
+  calculate_efficiency_ratio; son las fórmulas de referencia del bot.
+- Versión por lotes (NumPy): calcular_indicadores_lote recibe matrices
+  (símbolos x barras) de High/Low/Close/Volume y calcula todo el set de
+  indicadores del universo en una sola pasada vectorizada, con resultados
+  numéricamente equivalentes a la versión pandas.
+
+Las series más cortas se alinean a la derecha y se rellenan con NaN a la
+izquierda (ver apilar_ventanas); el relleno no altera los valores.
+"""
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+EFFICIENCY_RATIO_PERIOD = 20 # Periodo para el Ratio de Eficiencia
+EMAS_M15 = (8, 24, 50, 100, 200)
+
+# ==============================================================================
+# 1. VERSIÓN POR SÍMBOLO (pandas)
+# ==============================================================================
+
+def calculate_adx(df, period=14):
+    df['Prev_Close'] = df['Close'].shift(1); df['Prev_High'] = df['High'].shift(1); df['Prev_Low'] = df['Low'].shift(1)
+    df['High-Low'] = df['High'] - df['Low']
+    df['High-PrevClose'] = abs(df['High'] - df['Prev_Close'])
+    df['Low-PrevClose'] = abs(df['Low'] - df['Prev_Close'])
+    df['TR'] = df[['High-Low', 'High-PrevClose', 'Low-PrevClose']].max(axis=1).fillna(0)
+    move_up = df['High'] - df['Prev_High']; move_down = df['Prev_Low'] - df['Low']
+    df['+DM'] = np.where((move_up > move_down) & (move_up > 0), move_up, 0)
+    df['-DM'] = np.where((move_down > move_up) & (move_down > 0), move_down, 0)
+    alpha = 1 / period
+    TR_smooth = df['TR'].ewm(alpha=alpha, adjust=False).mean()
+    DM_plus_smooth = df['+DM'].ewm(alpha=alpha, adjust=False).mean(); DM_minus_smooth = df['-DM'].ewm(alpha=alpha, adjust=False).mean()
+    df['DI_plus'] = np.where(TR_smooth != 0, (DM_plus_smooth / TR_smooth) * 100, 0)
+    df['DI_minus'] = np.where(TR_smooth != 0, (DM_minus_smooth / TR_smooth) * 100, 0)
+    DI_diff = abs(df['DI_plus'] - df['DI_minus']); DI_sum = df['DI_plus'] + df['DI_minus']
+    df['DX'] = np.where(DI_sum != 0, (DI_diff / DI_sum) * 100, 0)
+    df['ADX'] = df['DX'].ewm(alpha=alpha, adjust=False).mean()
+    df.drop(columns=['Prev_Close', 'Prev_High', 'Prev_Low', 'High-Low', 'High-PrevClose', 'Low-PrevClose', 'TR', '+DM', '-DM', 'DX'], inplace=True, errors='ignore') # errors='ignore'
+    return df
+
+
+def calculate_efficiency_ratio(series, period):
+    """Calcula el Ratio de Eficiencia."""
+    if not isinstance(series, pd.Series): series = pd.Series(series) # Asegurar que es Series
+    if series.isnull().any() or len(series) < period + 1: return np.nan
+    net_change = abs(series.iloc[-1] - series.iloc[-(period + 1)])
+    sum_of_moves = abs(series.diff()).iloc[-period:].sum()
+    return net_change / sum_of_moves if sum_of_moves != 0 else 0
+
+
+def calcular_indicadores_m15(df):
+    """Indicadores M15 de un símbolo sobre un DataFrame con Close/High/Low/Volume (fórmulas de referencia)."""
+    df['EMA8'] = df['Close'].ewm(span=8, adjust=False).mean()
+    df['EMA24'] = df['Close'].ewm(span=24, adjust=False).mean()
+    df['EMA50'] = df['Close'].ewm(span=50, adjust=False).mean()
+    df['EMA100'] = df['Close'].ewm(span=100, adjust=False).mean()
+    df['EMA200'] = df['Close'].ewm(span=200, adjust=False).mean()
+    delta = df['Close'].diff(); gain = (delta.where(delta > 0, 0)).rolling(window=14).mean(); loss = (-delta.where(delta < 0, 0)).rolling(window=14).mean()
+    rs = gain / loss
+    df['RSI'] = 100 - (100 / (1 + rs.replace([np.inf, -np.inf], np.nan)))
+
+    ### AJUSTE 3 (DATO-CRÍTICO): CORRECCIÓN ADVERTENCIA PANDAS ###
+    df['RSI'] = df['RSI'].ffill()
+
+    df['EMA12'] = df['Close'].ewm(span=12, adjust=False).mean(); df['EMA26'] = df['Close'].ewm(span=26, adjust=False).mean()
+    macd_line = df['EMA12'] - df['EMA26']; macd_signal = macd_line.ewm(span=9, adjust=False).mean()
+    df['MACD_hist'] = macd_line - macd_signal
+    df['BB_middle'] = df['Close'].rolling(window=20).mean(); std_dev = df['Close'].rolling(window=20).std()
+    df['BB_upper'] = df['BB_middle'] + (std_dev * 2); df['BB_lower'] = df['BB_middle'] - (std_dev * 2)
+    df['Volume_MA20'] = df['Volume'].rolling(window=20).mean()
+    df = calculate_adx(df, period=14)
+    df['Efficiency_Ratio'] = df['Close'].rolling(window=EFFICIENCY_RATIO_PERIOD + 1).apply(lambda x: calculate_efficiency_ratio(pd.Series(x), EFFICIENCY_RATIO_PERIOD))
+    return df
+
+# ==============================================================================
+# 2. VERSIÓN POR LOTES (NumPy, símbolos x barras)
+# ==============================================================================
+
+def apilar_ventanas(dfs, columnas=('High', 'Low', 'Close', 'Volume')):
+    """
+    Convierte una lista de DataFrames OHLCV (uno por símbolo) en matrices (símbolos x barras),
+    alineadas a la derecha (última vela en la última columna) y con NaN a la izquierda.
+    """
+    n_barras = max((len(df) for df in dfs), default=0)
+    matrices = {c: np.full((len(dfs), n_barras), np.nan) for c in columnas}
+    for i, df in enumerate(dfs):
+        if len(df) == 0: continue
+        for c in columnas:
+            matrices[c][i, n_barras - len(df):] = df[c].to_numpy(dtype=float)
+    return matrices
+
+
+def ewm_lote(x, alpha):
+    """ewm(alpha=alpha, adjust=False).mean() por filas, con la misma aritmética que pandas."""
+    x = np.asarray(x, dtype=float)
+    out = np.empty_like(x)
+    old_wt = 1. - alpha
+    peso = np.full(x.shape[0], np.nan)
+    for t in range(x.shape[1]):
+        cur = x[:, t]
+        nuevo = (old_wt * peso + alpha * cur) / (old_wt + alpha)
+        nuevo = np.where(peso == cur, peso, nuevo)  # pandas evita errores numéricos en series constantes
+        peso = np.where(np.isnan(peso), cur, np.where(np.isnan(cur), peso, nuevo))
+        out[:, t] = peso
+    return out
+
+
+def ema_lote(x, span):
+    return ewm_lote(x, 2. / (span + 1.))
+
+
+def _ventanas(x, n):
+    """Vista (símbolos x barras-n+1 x n) de las ventanas deslizantes de n barras."""
+    return sliding_window_view(x, n, axis=1)
+
+
+def _rellenar_izq(valores, n_total):
+    out = np.full((valores.shape[0], n_total), np.nan)
+    out[:, n_total - valores.shape[1]:] = valores
+    return out
+
+
+def media_movil_lote(x, n):
+    """rolling(n).mean() por filas (NaN si la ventana no está completa)."""
+    if x.shape[1] < n: return np.full(x.shape, np.nan)
+    return _rellenar_izq(_ventanas(x, n).mean(axis=-1), x.shape[1])
+
+
+def desviacion_movil_lote(x, n):
+    """rolling(n).std() por filas (ddof=1)."""
+    if x.shape[1] < n: return np.full(x.shape, np.nan)
+    return _rellenar_izq(_ventanas(x, n).std(axis=-1, ddof=1), x.shape[1])
+
+
+def suma_movil_lote(x, n):
+    if x.shape[1] < n: return np.full(x.shape, np.nan)
+    return _rellenar_izq(_ventanas(x, n).sum(axis=-1), x.shape[1])
+
+
+def ffill_lote(x):
+    """ffill() por filas."""
+    idx = np.where(np.isnan(x), 0, np.arange(x.shape[1]))
+    np.maximum.accumulate(idx, axis=1, out=idx)
+    out = x[np.arange(x.shape[0])[:, None], idx]
+    # Las posiciones anteriores al primer valor válido siguen siendo NaN
+    return out
+
+
+def _diff(x):
+    d = np.full(x.shape, np.nan)
+    d[:, 1:] = x[:, 1:] - x[:, :-1]
+    return d
+
+
+def _shift(x):
+    s = np.full(x.shape, np.nan)
+    s[:, 1:] = x[:, :-1]
+    return s
+
+
+def rsi_lote(close, periodo=14):
+    """RSI del bot (medias simples de ganancias/pérdidas + ffill)."""
+    relleno = np.isnan(close)
+    delta = _diff(close)
+    # delta.where(delta > 0, 0): el NaN de la primera barra cuenta como 0 (igual que pandas)
+    gain = np.where(relleno, np.nan, np.where(delta > 0, delta, 0.))
+    loss = np.where(relleno, np.nan, np.where(delta < 0, -delta, 0.))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rs = media_movil_lote(gain, periodo) / media_movil_lote(loss, periodo)
+        rs[np.isinf(rs)] = np.nan
+        rsi = 100 - (100 / (1 + rs))
+    return ffill_lote(rsi)
+
+
+def adx_lote(high, low, close, periodo=14):
+    """ADX y DI+/DI- (suavizado de Wilder vía ewm alpha=1/periodo), igual que calculate_adx."""
+    relleno = np.isnan(close)
+    prev_close, prev_high, prev_low = _shift(close), _shift(high), _shift(low)
+    with np.errstate(invalid='ignore'):
+        rangos = np.stack([high - low, np.abs(high - prev_close), np.abs(low - prev_close)])
+        tr = np.where(np.all(np.isnan(rangos), axis=0), 0., np.nanmax(np.where(np.isnan(rangos), -np.inf, rangos), axis=0))
+        move_up = high - prev_high; move_down = prev_low - low
+        dm_plus = np.where((move_up > move_down) & (move_up > 0), move_up, 0.)
+        dm_minus = np.where((move_down > move_up) & (move_down > 0), move_down, 0.)
+    # Las barras de relleno no existen en la serie original: NaN para que no inicien el ewm
+    tr[relleno] = np.nan; dm_plus[relleno] = np.nan; dm_minus[relleno] = np.nan
+    alpha = 1 / periodo
+    tr_s = ewm_lote(tr, alpha); dmp_s = ewm_lote(dm_plus, alpha); dmm_s = ewm_lote(dm_minus, alpha)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        di_plus = np.where(tr_s != 0, (dmp_s / tr_s) * 100, 0.)
+        di_minus = np.where(tr_s != 0, (dmm_s / tr_s) * 100, 0.)
+        di_diff = np.abs(di_plus - di_minus); di_sum = di_plus + di_minus
+        dx = np.where(di_sum != 0, (di_diff / di_sum) * 100, 0.)
+    dx[relleno] = np.nan
+    return ewm_lote(dx, alpha), di_plus, di_minus
+
+
+def efficiency_ratio_lote(close, periodo=EFFICIENCY_RATIO_PERIOD):
+    """Ratio de Eficiencia sobre ventanas de periodo+1 cierres, igual que calculate_efficiency_ratio."""
+    if close.shape[1] < periodo + 1: return np.full(close.shape, np.nan)
+    neto = np.full(close.shape, np.nan)
+    neto[:, periodo:] = np.abs(close[:, periodo:] - close[:, :-periodo])
+    movimientos = suma_movil_lote(np.abs(_diff(close)), periodo)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        er = np.where(movimientos != 0, neto / movimientos, 0.)
+    er[np.isnan(neto) | np.isnan(movimientos)] = np.nan
+    return er
+
+
+def calcular_indicadores_lote(high, low, close, volume):
+    """
+    Set completo de indicadores M15 para todo el universo en una pasada.
+    Entradas: matrices (símbolos x barras). Devuelve dict nombre -> matriz (símbolos x barras)
+    con las mismas columnas que calcular_indicadores_m15.
+    """
+    high, low, close, volume = (np.asarray(m, dtype=float) for m in (high, low, close, volume))
+    ind = {'High': high, 'Low': low, 'Close': close, 'Volume': volume}
+    for span in EMAS_M15:
+        ind[f'EMA{span}'] = ema_lote(close, span)
+    ind['RSI'] = rsi_lote(close, 14)
+    ind['EMA12'] = ema_lote(close, 12); ind['EMA26'] = ema_lote(close, 26)
+    macd_line = ind['EMA12'] - ind['EMA26']
+    ind['MACD_hist'] = macd_line - ema_lote(macd_line, 9)
+    ind['BB_middle'] = media_movil_lote(close, 20); std_dev = desviacion_movil_lote(close, 20)
+    ind['BB_upper'] = ind['BB_middle'] + (std_dev * 2); ind['BB_lower'] = ind['BB_middle'] - (std_dev * 2)
+    ind['Volume_MA20'] = media_movil_lote(volume, 20)
+    ind['ADX'], ind['DI_plus'], ind['DI_minus'] = adx_lote(high, low, close, 14)
+    ind['Efficiency_Ratio'] = efficiency_ratio_lote(close, EFFICIENCY_RATIO_PERIOD)
+    return ind
+
+
+def fila_indicadores(ind, i, j=-1):
+    """Valores de todos los indicadores del símbolo i en la barra j (como dict, igual que df.iloc[j])."""
+    return {nombre: matriz[i, j] for nombre, matriz in ind.items()}
+
+# ==============================================================================
+# 3. VERIFICACIÓN DE PARIDAD
+# ==============================================================================
+
+def verificar_paridad(n_simbolos=20, n_barras=250, semilla=0, tolerancia=1e-9):
+    """Compara calcular_indicadores_lote con calcular_indicadores_m15 sobre series sintéticas de distinta longitud."""
+    rng = np.random.default_rng(semilla)
+    dfs = []
+    for i in range(n_simbolos):
+        n = int(rng.integers(n_barras // 2, n_barras + 1)) if i else n_barras
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+        if i == 1: close[-60:] = close[-61]  # tramo plano (pérdidas = 0, TR = 0)
+        high = close * (1 + rng.uniform(0, 0.01, n)); low = close * (1 - rng.uniform(0, 0.01, n))
+        dfs.append(pd.DataFrame({'High': high, 'Low': low, 'Close': close, 'Volume': rng.uniform(10, 1000, n)}))
+    m = apilar_ventanas(dfs)
+    ind = calcular_indicadores_lote(m['High'], m['Low'], m['Close'], m['Volume'])
+    peor = 0.
+    for i, df in enumerate(dfs):
+        ref = calcular_indicadores_m15(df.copy())
+        for col in ref.columns:
+            lote = ind[col][i, -len(df):]
+            esperado = ref[col].to_numpy(dtype=float)
+            if not np.array_equal(np.isnan(lote), np.isnan(esperado)):
+                raise AssertionError(f"NaN distintos en {col} (símbolo {i})")
+            dif = np.nanmax(np.abs(lote - esperado) / np.maximum(1., np.abs(esperado)), initial=0.)
+            peor = max(peor, dif)
+            if dif > tolerancia: raise AssertionError(f"{col} (símbolo {i}) difiere en {dif:.3g}")
+    return peor
+
+
+if __name__ == '__main__':
+    print(f"Paridad lote vs pandas OK (máxima diferencia relativa: {verificar_paridad():.3g})")
@@ -0,0 +1,414 @@
+# -*- coding: utf-8 -*-
+"""
+Indicadores M15 incrementales: cada objeto se actualiza en O(1) al cerrar una
+vela (EMA, RSI, MACD, medias/desviaciones móviles, ADX de Wilder y Ratio de
+Eficiencia) con la misma aritmética que las fórmulas pandas de indicadores.py.
+
+El estado completo se puede volcar a disco (JSON) para que un proceso
+reiniciado continúe donde quedó sin recalentar 200 símbolos x 250 velas.
+"""
+import json
+import math
+import os
+import logging
+from collections import deque
+
+import numpy as np
+
+from indicadores import EFFICIENCY_RATIO_PERIOD, EMAS_M15
+
+logger = logging.getLogger(__name__)
+
+INDICADORES_SNAPSHOT_FILE = 'indicadores_snapshot.json'
+NAN = float('nan')
+FILAS_HISTORIAL = 5  # Filas recientes que necesita evaluar_entrada (última, previa y volumen de la hora anterior;
+                     # también cubren el cruce de los latentes hasta 4 velas atrás, ver etapa_cruce)
+
+
+def _isnan(x):
+    return x is None or x != x
+
+
+# ==============================================================================
+# 1. INDICADORES BÁSICOS
+# ==============================================================================
+
+class EMA:
+    """ewm(alpha, adjust=False).mean() incremental."""
+
+    def __init__(self, span=None, alpha=None):
+        self.alpha = alpha if alpha is not None else 2. / (span + 1.)
+        self.valor = NAN
+
+    def actualizar(self, x):
+        if _isnan(x): return self.valor
+        if _isnan(self.valor): self.valor = float(x)
+        elif self.valor != x:
+            old_wt = 1. - self.alpha
+            self.valor = (old_wt * self.valor + self.alpha * x) / (old_wt + self.alpha)
+        return self.valor
+
+    def estado(self):
+        return {'alpha': self.alpha, 'valor': self.valor}
+
+    def restaurar(self, estado):
+        self.alpha, self.valor = estado['alpha'], estado['valor']
+        return self
+
+
+class SumaMovil:
+    """Suma de las últimas n observaciones en O(1); se recalcula cada n pasos para no acumular error."""
+
+    def __init__(self, n):
+        self.n = n
+        self.valores = deque(maxlen=n)
+        self.suma = 0.
+        self._pasos = 0
+
+    def actualizar(self, x):
+        if len(self.valores) == self.n: self.suma -= self.valores[0]
+        self.valores.append(float(x)); self.suma += x
+        self._pasos += 1
+        if self._pasos >= self.n:
+            self.suma = math.fsum(self.valores); self._pasos = 0
+        return self.valor
+
+    @property
+    def completa(self):
+        return len(self.valores) == self.n and not any(_isnan(v) for v in self.valores)
+
+    @property
+    def valor(self):
+        return self.suma if self.completa else NAN
+
+    def estado(self):
+        return {'n': self.n, 'valores': list(self.valores)}
+
+    def restaurar(self, estado):
+        self.__init__(estado['n'])
+        self.valores.extend(estado['valores']); self.suma = math.fsum(self.valores)
+        return self
+
+
+class MediaMovil(SumaMovil):
+    """rolling(n).mean() incremental."""
+
+    @property
+    def valor(self):
+        return self.suma / self.n if self.completa else NAN
+
+
+class DesviacionMovil:
+    """rolling(n).std() (ddof=1) incremental, con sumas desplazadas para evitar cancelación numérica."""
+
+    def __init__(self, n):
+        self.n = n
+        self.valores = deque(maxlen=n)
+        self._iguales = 0
+        self._recentrar()
+
+    def _recentrar(self):
+        self.ref = self.valores[-1] if self.valores else 0.
+        self.s1 = math.fsum(v - self.ref for v in self.valores)
+        self.s2 = math.fsum((v - self.ref) ** 2 for v in self.valores)
+        self._pasos = 0
+
+    def actualizar(self, x):
+        if len(self.valores) == self.n:
+            d = self.valores[0] - self.ref; self.s1 -= d; self.s2 -= d * d
+        # Velas idénticas consecutivas: con n iguales la desviación es exactamente 0 (como en pandas)
+        self._iguales = self._iguales + 1 if self.valores and self.valores[-1] == x else 1
+        self.valores.append(float(x))
+        d = x - self.ref; self.s1 += d; self.s2 += d * d
+        self._pasos += 1
+        if self._pasos >= self.n: self._recentrar()
+        return self.valor
+
+    @property
+    def valor(self):
+        if len(self.valores) < self.n or any(_isnan(v) for v in self.valores): return NAN
+        if self._iguales >= self.n: return 0.
+        var = (self.s2 - self.s1 * self.s1 / self.n) / (self.n - 1)
+        return math.sqrt(var) if var > 0 else 0.
+
+    def estado(self):
+        return {'n': self.n, 'valores': list(self.valores)}
+
+    def restaurar(self, estado):
+        self.n = estado['n']; self.valores = deque(estado['valores'], maxlen=self.n)
+        # Racha de valores iguales al final de la ventana, como la habría contado actualizar
+        self._iguales, ultimo = 0, None
+        for v in self.valores:
+            self._iguales = self._iguales + 1 if v == ultimo else 1
+            ultimo = v
+        self._recentrar()
+        return self
+
+
+class RSI:
+    """RSI del bot: medias simples de ganancias/pérdidas, con ffill del último valor válido."""
+
+    def __init__(self, periodo=14):
+        self.gain = MediaMovil(periodo); self.loss = MediaMovil(periodo)
+        self.prev_close = NAN
+        self.valor = NAN
+
+    def actualizar(self, close):
+        delta = close - self.prev_close if not _isnan(self.prev_close) else NAN
+        self.gain.actualizar(delta if delta > 0 else 0.)
+        self.loss.actualizar(-delta if delta < 0 else 0.)
+        self.prev_close = close
+        gain, loss = self.gain.valor, self.loss.valor
+        if not _isnan(gain) and not _isnan(loss) and loss != 0:
+            self.valor = 100 - (100 / (1 + gain / loss))
+        return self.valor
+
+    def estado(self):
+        return {'gain': self.gain.estado(), 'loss': self.loss.estado(), 'prev_close': self.prev_close, 'valor': self.valor}
+
+    def restaurar(self, estado):
+        self.gain = MediaMovil(1).restaurar(estado['gain']); self.loss = MediaMovil(1).restaurar(estado['loss'])
+        self.prev_close, self.valor = estado['prev_close'], estado['valor']
+        return self
+
+
+class MACD:
+    """Histograma MACD (EMA12 - EMA26 y señal EMA9)."""
+
+    def __init__(self, rapida=12, lenta=26, senal=9):
+        self.rapida, self.lenta, self.senal = EMA(rapida), EMA(lenta), EMA(senal)
+
+    def actualizar(self, close):
+        linea = self.rapida.actualizar(close) - self.lenta.actualizar(close)
+        return linea - self.senal.actualizar(linea)
+
+    def estado(self):
+        return {'rapida': self.rapida.estado(), 'lenta': self.lenta.estado(), 'senal': self.senal.estado()}
+
+    def restaurar(self, estado):
+        self.rapida = EMA(alpha=0).restaurar(estado['rapida']); self.lenta = EMA(alpha=0).restaurar(estado['lenta'])
+        self.senal = EMA(alpha=0).restaurar(estado['senal'])
+        return self
+
+
+class ADX:
+    """ADX y DI+/DI- con suavizado de Wilder (ewm alpha=1/periodo), igual que calculate_adx."""
+
+    def __init__(self, periodo=14):
+        alpha = 1 / periodo
+        self.tr, self.dm_plus, self.dm_minus, self.adx = EMA(alpha=alpha), EMA(alpha=alpha), EMA(alpha=alpha), EMA(alpha=alpha)
+        self.prev = None  # (high, low, close) de la vela anterior
+        self.di_plus = self.di_minus = NAN
+
+    def actualizar(self, high, low, close):
+        if self.prev is None:
+            tr, dm_plus, dm_minus = high - low, 0., 0.
+        else:
+            p_high, p_low, p_close = self.prev
+            tr = max(high - low, abs(high - p_close), abs(low - p_close))
+            move_up, move_down = high - p_high, p_low - low
+            dm_plus = move_up if (move_up > move_down and move_up > 0) else 0.
+            dm_minus = move_down if (move_down > move_up and move_down > 0) else 0.
+        self.prev = (high, low, close)
+        tr_s = self.tr.actualizar(tr); dmp_s = self.dm_plus.actualizar(dm_plus); dmm_s = self.dm_minus.actualizar(dm_minus)
+        self.di_plus = (dmp_s / tr_s) * 100 if tr_s != 0 else 0.
+        self.di_minus = (dmm_s / tr_s) * 100 if tr_s != 0 else 0.
+        di_sum = self.di_plus + self.di_minus
+        dx = (abs(self.di_plus - self.di_minus) / di_sum) * 100 if di_sum != 0 else 0.
+        return self.adx.actualizar(dx)
+
+    def estado(self):
+        return {k: getattr(self, k).estado() for k in ('tr', 'dm_plus', 'dm_minus', 'adx')} | \
+               {'prev': self.prev, 'di_plus': self.di_plus, 'di_minus': self.di_minus}
+
+    def restaurar(self, estado):
+        for k in ('tr', 'dm_plus', 'dm_minus', 'adx'):
+            setattr(self, k, EMA(alpha=0).restaurar(estado[k]))
+        self.prev = tuple(estado['prev']) if estado['prev'] is not None else None
+        self.di_plus, self.di_minus = estado['di_plus'], estado['di_minus']
+        return self
+
+
+class EfficiencyRatio:
+    """Ratio de Eficiencia sobre los últimos periodo+1 cierres, en O(1) por vela."""
+
+    def __init__(self, periodo=EFFICIENCY_RATIO_PERIOD):
+        self.periodo = periodo
+        self.cierres = deque(maxlen=periodo + 1)
+        self.movimientos = SumaMovil(periodo)
+
+    def actualizar(self, close):
+        if self.cierres: self.movimientos.actualizar(abs(close - self.cierres[-1]))
+        self.cierres.append(float(close))
+        return self.valor
+
+    @property
+    def valor(self):
+        if len(self.cierres) < self.periodo + 1: return NAN
+        suma = self.movimientos.valor
+        if _isnan(suma): return NAN
+        return abs(self.cierres[-1] - self.cierres[0]) / suma if suma != 0 else 0.
+
+    def estado(self):
+        return {'periodo': self.periodo, 'cierres': list(self.cierres), 'movimientos': self.movimientos.estado()}
+
+    def restaurar(self, estado):
+        self.periodo = estado['periodo']; self.cierres = deque(estado['cierres'], maxlen=self.periodo + 1)
+        self.movimientos = SumaMovil(1).restaurar(estado['movimientos'])
+        return self
+
+
+# ==============================================================================
+# 2. ESTADO COMPLETO M15 DE UN SÍMBOLO
+# ==============================================================================
+
+class EstadoIndicadoresM15:
+    """Todo el set de indicadores M15 de un símbolo, actualizado vela a vela."""
+
+    def __init__(self):
+        self.emas = {span: EMA(span) for span in EMAS_M15 + (12, 26)}
+        self.rsi = RSI(14); self.macd = MACD(12, 26, 9)
+        self.bb_media = MediaMovil(20); self.bb_std = DesviacionMovil(20); self.vol_ma = MediaMovil(20)
+        self.adx = ADX(14); self.er = EfficiencyRatio(EFFICIENCY_RATIO_PERIOD)
+        self.ultimo_open_time = None
+        self.filas = deque(maxlen=FILAS_HISTORIAL)
+
+    def actualizar(self, open_time, high, low, close, volume):
+        """Incorpora una vela cerrada y devuelve la fila de indicadores (mismas claves que fila_indicadores)."""
+        if self.ultimo_open_time is not None and open_time <= self.ultimo_open_time: return self.filas[-1]
+        fila = {'High': high, 'Low': low, 'Close': close, 'Volume': volume}
+        for span, ema in self.emas.items():
+            fila[f'EMA{span}'] = ema.actualizar(close)
+        fila['RSI'] = self.rsi.actualizar(close)
+        fila['MACD_hist'] = self.macd.actualizar(close)
+        fila['BB_middle'] = self.bb_media.actualizar(close); std_dev = self.bb_std.actualizar(close)
+        fila['BB_upper'] = fila['BB_middle'] + (std_dev * 2); fila['BB_lower'] = fila['BB_middle'] - (std_dev * 2)
+        fila['Volume_MA20'] = self.vol_ma.actualizar(volume)
+        fila['ADX'] = self.adx.actualizar(high, low, close)
+        fila['DI_plus'], fila['DI_minus'] = self.adx.di_plus, self.adx.di_minus
+        fila['Efficiency_Ratio'] = self.er.actualizar(close)
+        self.ultimo_open_time = int(open_time)
+        self.filas.append(fila)
+        return fila
+
+    def actualizar_velas(self, velas):
+        """Incorpora las velas (ot, o, h, l, c, v, ct) posteriores a la última procesada."""
+        for vela in velas:
+            if self.ultimo_open_time is None or vela[0] > self.ultimo_open_time:
+                self.actualizar(int(vela[0]), float(vela[2]), float(vela[3]), float(vela[4]), float(vela[5]))
+
+    def como_lote(self):
+        """Últimas filas como lote de 1 símbolo (mismo formato que calcular_indicadores_lote)."""
+        return {nombre: np.array([[f[nombre] for f in self.filas]], dtype=float) for nombre in self.filas[-1]}
+
+    def estado(self):
+        return {
+            'emas': {str(span): ema.estado() for span, ema in self.emas.items()},
+            'rsi': self.rsi.estado(), 'macd': self.macd.estado(),
+            'bb_media': self.bb_media.estado(), 'bb_std': self.bb_std.estado(), 'vol_ma': self.vol_ma.estado(),
+            'adx': self.adx.estado(), 'er': self.er.estado(),
+            'ultimo_open_time': self.ultimo_open_time, 'filas': list(self.filas),
+        }
+
+    @classmethod
+    def desde_estado(cls, estado):
+        obj = cls()
+        obj.emas = {int(span): EMA(alpha=0).restaurar(e) for span, e in estado['emas'].items()}
+        obj.rsi = RSI().restaurar(estado['rsi']); obj.macd = MACD().restaurar(estado['macd'])
+        obj.bb_media = MediaMovil(1).restaurar(estado['bb_media']); obj.bb_std = DesviacionMovil(1).restaurar(estado['bb_std'])
+        obj.vol_ma = MediaMovil(1).restaurar(estado['vol_ma'])
+        obj.adx = ADX().restaurar(estado['adx']); obj.er = EfficiencyRatio().restaurar(estado['er'])
+        obj.ultimo_open_time = estado['ultimo_open_time']
+        obj.filas = deque(estado['filas'], maxlen=FILAS_HISTORIAL)
+        return obj
+
+
+# ==============================================================================
+# 3. SNAPSHOTS EN DISCO
+# ==============================================================================
+
+def guardar_snapshot(estados, path=INDICADORES_SNAPSHOT_FILE):
+    """Vuelca {symbol: EstadoIndicadoresM15} a disco de forma atómica."""
+    temp_file = path + ".tmp"
+    try:
+        with open(temp_file, 'w') as f: json.dump({s: e.estado() for s, e in estados.items()}, f)
+        os.replace(temp_file, path)
+    except Exception as e:
+        logger.error(f"Error al guardar {path}: {e}")
+        if os.path.exists(temp_file):
+            try: os.remove(temp_file)
+            except Exception as rem_e: logger.error(f"No se pudo eliminar archivo temporal {temp_file}: {rem_e}")
+
+
+def cargar_snapshot(path=INDICADORES_SNAPSHOT_FILE):
+    """Carga los estados guardados ({} si no hay snapshot o está corrupto)."""
+    try:
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, 'r') as f:
+                return {s: EstadoIndicadoresM15.desde_estado(e) for s, e in json.load(f).items()}
+    except Exception as e:
+        logger.warning(f"Snapshot de indicadores {path} no válido ({e}). Se recalentará desde las velas.")
+    return {}
+
+
+# ==============================================================================
+# 4. VERIFICACIÓN DE PARIDAD
+# ==============================================================================
+
+def verificar_paridad(n_barras=600, semilla=1, tolerancia=1e-7):
+    """
+    Compara el estado incremental (con un volcado/restauración a mitad) con calcular_indicadores_m15.
+    La tolerancia cubre el residuo (~1e-6 absoluto) que deja rolling().std() de pandas en tramos planos,
+    donde la versión incremental devuelve 0 exacto.
+    """
+    import pandas as pd
+    from indicadores import calcular_indicadores_m15
+
+    rng = np.random.default_rng(semilla)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n_barras)))
+    close[200:260] = close[199]  # tramo plano
+    df = pd.DataFrame({'High': close * (1 + rng.uniform(0, 0.01, n_barras)), 'Low': close * (1 - rng.uniform(0, 0.01, n_barras)),
+                       'Close': close, 'Volume': rng.uniform(10, 1000, n_barras)})
+    ref = calcular_indicadores_m15(df.copy())
+
+    estado, peor = EstadoIndicadoresM15(), 0.
+    for t, fila_df in enumerate(df.itertuples(index=False)):
+        if t == n_barras // 2:  # volcado y restauración a mitad de la serie
+            estado = EstadoIndicadoresM15.desde_estado(json.loads(json.dumps(estado.estado())))
+        fila = estado.actualizar(t, fila_df.High, fila_df.Low, fila_df.Close, fila_df.Volume)
+        for col in ref.columns:
+            esperado = ref[col].iloc[t]
+            if _isnan(esperado) != _isnan(fila[col]):
+                raise AssertionError(f"NaN distintos en {col} (barra {t})")
+            if _isnan(esperado): continue
+            dif = abs(fila[col] - esperado) / max(1., abs(esperado))
+            peor = max(peor, dif)
+            if dif > tolerancia: raise AssertionError(f"{col} (barra {t}) difiere en {dif:.3g}")
+    return peor
+
+
+def verificar_restauracion(n=20, n_valores=200, semilla=2):
+    """
+    Vuelca y restaura DesviacionMovil en cada paso (también dentro de tramos planos, donde importa
+    la racha de valores iguales) y comprueba que sigue igual que la instancia sin interrumpir.
+    """
+    rng = np.random.default_rng(semilla)
+    valores = rng.normal(100, 1, n_valores)
+    valores[50:50 + 2 * n] = valores[49]; valores[120:120 + n // 2] = valores[119]  # tramos planos largo y corto
+    original = DesviacionMovil(n)
+    esperados = [original.actualizar(x) for x in valores]
+    for t in range(n_valores):
+        restaurada = DesviacionMovil(n)
+        for x in valores[:t + 1]: restaurada.actualizar(x)
+        restaurada = DesviacionMovil(1).restaurar(json.loads(json.dumps(restaurada.estado())))
+        for u in range(t + 1, min(n_valores, t + 1 + n)):
+            obtenido, esperado = restaurada.actualizar(valores[u]), esperados[u]
+            if _isnan(obtenido) != _isnan(esperado) or (obtenido == 0) != (esperado == 0) or \
+               (not _isnan(esperado) and abs(obtenido - esperado) > 1e-9 * max(1., abs(esperado))):
+                raise AssertionError(f"Restaurada en el paso {t}: {obtenido} en vez de {esperado} (paso {u})")
+    return n_valores
+
+
+if __name__ == '__main__':
+    print(f"Paridad incremental vs pandas OK (máxima diferencia relativa: {verificar_paridad():.3g})")
+    print(f"Volcado y restauración de DesviacionMovil OK ({verificar_restauracion()} pasos)")
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+Almacén local de klines (SQLite) indexado por símbolo + intervalo.
+
+En lugar de volver a pedir 250 velas por símbolo en cada ciclo, el almacén
+guarda las velas ya descargadas y solo pide a Binance la cola que falta
+(normalmente 1-2 velas), rellena huecos detectados y devuelve una ventana
+OHLCV lista para calcular indicadores. Las respuestas de la API se decodifican
+directamente a arrays estructurados (ver velas.py), sin DataFrames de texto.
+"""
+import itertools
+import sqlite3
+import threading
+import time
+import logging
+
+import numpy as np
+
+from velas import DTYPE_VELA, decodificar_klines, a_dataframe
+
+logger = logging.getLogger(__name__)
+
+KLINES_DB_FILE = 'klines_store.db'
+
+# Duración de cada intervalo en milisegundos (mismos códigos que Client.KLINE_INTERVAL_*)
+INTERVALO_MS = {
+    '1m': 60_000, '3m': 180_000, '5m': 300_000, '15m': 900_000, '30m': 1_800_000,
+    '1h': 3_600_000, '2h': 7_200_000, '4h': 14_400_000, '6h': 21_600_000,
+    '8h': 28_800_000, '12h': 43_200_000, '1d': 86_400_000,
+}
+
+MAX_KLINES_POR_PETICION = 1000
+
+COLUMNAS_OHLCV = list(DTYPE_VELA.names)  # ['open_time', 'Open', 'High', 'Low', 'Close', 'Volume', 'close_time']
+
+
+def _ahora_ms():
+    return int(time.time() * 1000)
+
+
+class KlineStore:
+    """Almacén persistente de velas con descarga incremental de la cola y relleno de huecos."""
+
+    def __init__(self, path=KLINES_DB_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS klines (
+                symbol TEXT NOT NULL, interval TEXT NOT NULL, open_time INTEGER NOT NULL,
+                open REAL, high REAL, low REAL, close REAL, volume REAL,
+                close_time INTEGER, cerrada INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (symbol, interval, open_time)
+            ) WITHOUT ROWID""")
+        # 'inicio_ms' es el inicio más antiguo que ya se pidió a la API para el par:
+        # evita volver a pedir historial que el exchange no tiene (p. ej. listados recientes).
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS cobertura (
+                symbol TEXT NOT NULL, interval TEXT NOT NULL, inicio_ms INTEGER NOT NULL,
+                PRIMARY KEY (symbol, interval)
+            )""")
+        self._conn.commit()
+        self._huecos_intentados = set()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # --------------------------------------------------------------------------
+    # Escritura / lectura básica
+    # --------------------------------------------------------------------------
+
+    def guardar_klines(self, symbol, interval, klines, recibido_ms=None):
+        """Inserta (o reemplaza) velas crudas de la API. Devuelve cuántas se guardaron."""
+        if not len(klines): return 0
+        recibido_ms = recibido_ms or _ahora_ms()
+        velas = decodificar_klines(klines)
+        cerrada = (velas['close_time'] < recibido_ms).astype(int)
+        filas = zip(itertools.repeat(symbol), itertools.repeat(interval),
+                    *(velas[c].tolist() for c in DTYPE_VELA.names), cerrada.tolist())
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO klines VALUES (?,?,?,?,?,?,?,?,?,?)", filas)
+            self._conn.commit()
+        return len(velas)
+
+    def _rango_guardado(self, symbol, interval):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MIN(open_time), MAX(open_time) FROM klines WHERE symbol=? AND interval=?",
+                (symbol, interval)).fetchone()
+            cob = self._conn.execute(
+                "SELECT inicio_ms FROM cobertura WHERE symbol=? AND interval=?", (symbol, interval)).fetchone()
+        return row[0], row[1], (cob[0] if cob else None)
+
+    def _primera_abierta(self, symbol, interval):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MIN(open_time) FROM klines WHERE symbol=? AND interval=? AND cerrada=0",
+                (symbol, interval)).fetchone()
+        return row[0]
+
+    def _registrar_cobertura(self, symbol, interval, inicio_ms):
+        with self._lock:
+            self._conn.execute("""
+                INSERT INTO cobertura VALUES (?,?,?)
+                ON CONFLICT(symbol, interval) DO UPDATE SET inicio_ms=MIN(inicio_ms, excluded.inicio_ms)""",
+                (symbol, interval, inicio_ms))
+            self._conn.commit()
+
+    def leer_velas(self, symbol, interval, inicio_ms, fin_ms=None):
+        """Velas guardadas con open_time en [inicio_ms, fin_ms] como array estructurado DTYPE_VELA."""
+        fin_ms = fin_ms if fin_ms is not None else _ahora_ms()
+        with self._lock:
+            cursor = self._conn.execute("""
+                SELECT open_time, open, high, low, close, volume, close_time FROM klines
+                WHERE symbol=? AND interval=? AND open_time BETWEEN ? AND ? ORDER BY open_time""",
+                (symbol, interval, int(inicio_ms), int(fin_ms)))
+            return np.fromiter(cursor, dtype=DTYPE_VELA)
+
+    def leer_rango(self, symbol, interval, inicio_ms, fin_ms=None):
+        """Devuelve las velas guardadas con open_time en [inicio_ms, fin_ms] como DataFrame OHLCV."""
+        return a_dataframe(self.leer_velas(symbol, interval, inicio_ms, fin_ms))
+
+    # --------------------------------------------------------------------------
+    # Sincronización con la API
+    # --------------------------------------------------------------------------
+
+    def _descargar(self, client, symbol, interval, inicio_ms, fin_ms=None):
+        """Descarga [inicio_ms, fin_ms] paginando futures_klines con el 'limit' justo (menor peso de API)."""
+        paso = INTERVALO_MS[interval]
+        fin_ms = fin_ms if fin_ms is not None else _ahora_ms()
+        inicio_ms, total = int(inicio_ms), 0
+        while inicio_ms <= fin_ms:
+            limite = int(min(MAX_KLINES_POR_PETICION, max(1, (fin_ms - inicio_ms) // paso + 1)))
+            recibido_ms = _ahora_ms()
+            klines = client.futures_klines(symbol=symbol, interval=interval, startTime=inicio_ms,
+                                           endTime=int(fin_ms), limit=limite)
+            total += self.guardar_klines(symbol, interval, klines, recibido_ms)
+            if len(klines) < limite: break
+            inicio_ms = int(klines[-1][0]) + paso
+        return total
+
+    def _rellenar_huecos(self, client, symbol, interval, inicio_ms, fin_ms):
+        paso = INTERVALO_MS[interval]
+        with self._lock:
+            tiempos = [r[0] for r in self._conn.execute(
+                "SELECT open_time FROM klines WHERE symbol=? AND interval=? AND open_time BETWEEN ? AND ? ORDER BY open_time",
+                (symbol, interval, int(inicio_ms), int(fin_ms))).fetchall()]
+        for previo, siguiente in zip(tiempos, tiempos[1:]):
+            if siguiente - previo <= paso: continue
+            hueco = (symbol, interval, previo + paso, siguiente - 1)
+            # Un hueco real del exchange (mantenimiento) se intenta rellenar una sola vez por proceso
+            if hueco in self._huecos_intentados: continue
+            self._huecos_intentados.add(hueco)
+            logger.info(f"Hueco detectado en {symbol} {interval}: {(siguiente - previo) // paso - 1} velas. Rellenando...")
+            self._descargar(client, symbol, interval, hueco[2], hueco[3])
+
+    def sincronizar(self, client, symbol, interval, inicio_ms, fin_ms=None):
+        """
+        Asegura que el almacén cubre [inicio_ms, fin_ms] (fin None = hasta ahora):
+        pide el historial que falta al principio, la cola nueva al final
+        (re-descargando la vela aún abierta) y los huecos intermedios.
+        """
+        paso = INTERVALO_MS[interval]
+        min_ot, max_ot, cobertura_ms = self._rango_guardado(symbol, interval)
+        limite_fin = fin_ms if fin_ms is not None else _ahora_ms()
+
+        if max_ot is None or max_ot < inicio_ms:
+            # Nada útil guardado: descarga completa del rango
+            self._descargar(client, symbol, interval, inicio_ms, fin_ms)
+            self._registrar_cobertura(symbol, interval, inicio_ms)
+            return
+
+        if inicio_ms < min_ot and (cobertura_ms is None or inicio_ms < cobertura_ms):
+            self._descargar(client, symbol, interval, inicio_ms, min_ot - 1)
+            self._registrar_cobertura(symbol, interval, inicio_ms)
+
+        # Cola: desde la primera vela no cerrada (o la siguiente a la última guardada)
+        primera_abierta = self._primera_abierta(symbol, interval)
+        desde = primera_abierta if primera_abierta is not None else max_ot + paso
+        if desde <= limite_fin:
+            self._descargar(client, symbol, interval, desde, fin_ms)
+
+        self._rellenar_huecos(client, symbol, interval, inicio_ms, limite_fin)
+
+    def obtener_rango(self, client, symbol, interval, inicio_ms, fin_ms=None):
+        """Sincroniza con la API solo lo que falta y devuelve la ventana OHLCV [inicio_ms, fin_ms]."""
+        self.sincronizar(client, symbol, interval, inicio_ms, fin_ms)
+        return self.leer_rango(symbol, interval, inicio_ms, fin_ms)
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Control del peso de peticiones a la API de Binance Futures.
+
+LimitadorPeso es un token bucket que se recarga al ritmo del límite por minuto
+de Binance y se re-sincroniza con la cabecera X-MBX-USED-WEIGHT-1M de cada
+respuesta. ClienteLimitado envuelve un Client de python-binance y descuenta el
+peso de cada llamada antes de hacerla, de forma segura entre hilos. Con un
+RegistroMetricas (metricas.py) cuenta además llamadas, errores, duración y el
+último peso usado que informa Binance.
+"""
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+PESO_MAX_POR_MINUTO = 2400  # Límite de Binance Futures (IP)
+
+# Peso fijo por método del cliente (los no listados cuentan 1)
+PESO_POR_METODO = {
+    'futures_ticker': 40,          # Todos los símbolos
+    'futures_symbol_ticker': 2,    # Todos los símbolos (1 si se pasa symbol)
+    'futures_mark_price': 10,      # Todos los símbolos (1 si se pasa symbol)
+    'futures_exchange_info': 1,
+    'futures_time': 1,
+    'futures_ping': 1,
+}
+
+
+def peso_klines(limit):
+    """Peso de /fapi/v1/klines según el parámetro 'limit'."""
+    limit = limit or 500
+    if limit < 100: return 1
+    if limit < 500: return 2
+    if limit <= 1000: return 5
+    return 10
+
+
+def peso_peticion(metodo, kwargs):
+    """Estimación del peso que consumirá una llamada del cliente."""
+    if metodo in ('futures_klines', 'futures_historical_klines'):
+        return peso_klines(kwargs.get('limit'))
+    if metodo in ('futures_symbol_ticker', 'futures_mark_price', 'futures_ticker') and kwargs.get('symbol'):
+        return 1
+    return PESO_POR_METODO.get(metodo, 1)
+
+
+class LimitadorPeso:
+    """Token bucket del peso de API por minuto, compartido entre hilos."""
+
+    def __init__(self, peso_por_minuto=PESO_MAX_POR_MINUTO):
+        self.capacidad = float(peso_por_minuto)
+        self.tasa = self.capacidad / 60.0
+        self.tokens = self.capacidad
+        self._ultimo = time.monotonic()
+        self._cond = threading.Condition()
+
+    def _recargar(self):
+        ahora = time.monotonic()
+        self.tokens = min(self.capacidad, self.tokens + (ahora - self._ultimo) * self.tasa)
+        self._ultimo = ahora
+
+    def consumir(self, peso=1):
+        """Bloquea hasta que haya 'peso' disponible y lo descuenta."""
+        peso = min(float(peso), self.capacidad)
+        with self._cond:
+            while True:
+                self._recargar()
+                if self.tokens >= peso:
+                    self.tokens -= peso
+                    return
+                espera = (peso - self.tokens) / self.tasa
+                self._cond.wait(timeout=espera)
+
+    def registrar_peso_usado(self, usado):
+        """Ajusta el bucket al peso que Binance dice que ya llevamos usado en el minuto."""
+        with self._cond:
+            self._recargar()
+            self.tokens = min(self.tokens, max(0.0, self.capacidad - float(usado)))
+
+
+class ClienteLimitado:
+    """Envuelve un binance.client.Client descontando el peso de cada llamada en el limitador."""
+
+    def __init__(self, client, limitador, metricas=None):
+        self._client = client
+        self.limitador = limitador
+        self.metricas = metricas
+        self._peso_lock = threading.Lock()
+        self._peso_minuto, self._peso_usado = None, 0  # Máximo X-MBX-USED-WEIGHT-1M aceptado en el minuto actual
+
+    def _aceptar_peso_usado(self, usado):
+        """
+        True si 'usado' es mayor que el último aceptado en el minuto (o si empezó otro minuto).
+        Limitación: el Client de python-binance guarda en .response solo la ÚLTIMA respuesta y se
+        comparte entre hilos, así que con SCAN_WORKERS > 1 la cabecera leída puede ser la de la
+        petición de otro hilo. Como el peso usado solo crece dentro del minuto, aceptar únicamente
+        valores crecientes descarta las lecturas atrasadas; el valor puede ir una petición por detrás.
+        """
+        minuto = int(time.time() // 60)
+        with self._peso_lock:
+            if minuto == self._peso_minuto and usado <= self._peso_usado: return False
+            self._peso_minuto, self._peso_usado = minuto, usado
+            return True
+
+    def __getattr__(self, nombre):
+        atributo = getattr(self._client, nombre)
+        if not callable(atributo) or nombre.startswith('_'):
+            return atributo
+
+        def llamada(*args, **kwargs):
+            self.limitador.consumir(peso_peticion(nombre, kwargs))
+            t0 = time.perf_counter()
+            try: resultado = atributo(*args, **kwargs)
+            except Exception:
+                if self.metricas: self.metricas.incrementar('binance_errores_total', metodo=nombre)
+                raise
+            finally:
+                if self.metricas:
+                    self.metricas.observar('binance_peticion_segundos', time.perf_counter() - t0, metodo=nombre)
+                    self.metricas.incrementar('binance_peticiones_total', metodo=nombre)
+            respuesta = getattr(self._client, 'response', None)
+            usado = respuesta.headers.get('X-MBX-USED-WEIGHT-1M') if respuesta is not None else None
+            if usado is not None:
+                try: usado = int(usado)
+                except ValueError: usado = None
+                if usado is not None and self._aceptar_peso_usado(usado):
+                    self.limitador.registrar_peso_usado(usado)
+                    if self.metricas: self.metricas.fijar('binance_peso_usado_1m', usado)
+            return resultado
+        return llamada
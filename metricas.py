@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+Métricas internas del bot: contadores, gauges e histogramas con etiquetas.
+
+Se exponen en formato de texto de Prometheus (GET /metrics) y como JSON
+(GET /metrics.json) desde un servidor HTTP local en un hilo propio, y se pueden
+volcar a METRICAS_JSON_FILE al final de cada ciclo. No depende de
+prometheus_client: el formato de texto es el estándar 0.0.4.
+
+Uso:
+    metricas = RegistroMetricas()
+    with metricas.cronometro('bot_etapa_segundos', etapa='detect_new_signals'): ...
+    metricas.incrementar('binance_peticiones_total', metodo='futures_klines')
+    ServidorMetricas(metricas, puerto=9108).iniciar()
+"""
+import json
+import os
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+logger = logging.getLogger(__name__)
+
+METRICAS_JSON_FILE = 'metricas.json'
+# Límites (segundos) por defecto de los histogramas: de milisegundos a un ciclo completo de 15 minutos
+LIMITES_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 900)
+
+# Descripción de las métricas conocidas (la línea # HELP del formato Prometheus)
+DESCRIPCIONES = {
+    'bot_ciclo_segundos': "Duración de cada ciclo de monitoreo",
+    'bot_etapa_segundos': "Duración por etapa del ciclo (pivotes, chequeo de trades, escaneo...)",
+    'bot_simbolo_segundos': "Duración por símbolo de la descarga de datos y del cálculo de la señal",
+    'bot_senales_total': "Señales de entrada dadas de alta",
+    'bot_senales_ultimo_ciclo': "Señales de entrada del último ciclo",
+    'bot_alertas_total': "Alertas de salida (SL / TP1 / TP2)",
+    'bot_latencia_segundos': "Latencia desde el cierre de vela hasta cada señal o alerta",
+    'bot_ciclos_saltados_total': "Ciclos perdidos por un ciclo anterior demasiado largo",
+    'bot_universo_simbolos': "Símbolos del universo por nivel de escaneo",
+    'bot_embudo_descartes_total': "Símbolos descartados por cada etapa del embudo de señales",
+    'bot_embudo_pasan': "Símbolos que superaron cada etapa del embudo en el último escaneo",
+    'bot_simbolos_escaneados': "Símbolos evaluados en el último escaneo de señales",
+    'binance_peticiones_total': "Llamadas a la API de Binance por método",
+    'binance_errores_total': "Llamadas a la API de Binance que lanzaron una excepción",
+    'binance_peticion_segundos': "Duración de las llamadas a la API de Binance",
+    'binance_peso_usado_1m': "Último X-MBX-USED-WEIGHT-1M recibido de Binance",
+    'telegram_envio_segundos': "Duración de cada envío a Telegram",
+    'telegram_mensajes_total': "Envíos a Telegram por resultado",
+    'telegram_cola': "Mensajes pendientes en la cola de Telegram",
+}
+
+
+def _etiquetas(etiquetas):
+    return tuple(sorted((k, str(v)) for k, v in etiquetas.items()))
+
+
+def _texto_etiquetas(etiquetas, extra=()):
+    pares = list(etiquetas) + list(extra)
+    if not pares: return ""
+    return "{" + ",".join(f'{k}="{v}"'.replace('\n', ' ') for k, v in pares) + "}"
+
+
+def _numero(valor):
+    if valor == float('inf'): return "+Inf"
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class RegistroMetricas:
+    """Almacén de métricas seguro entre hilos. Los nombres siguen la convención de Prometheus."""
+
+    def __init__(self, limites=LIMITES_SEGUNDOS):
+        self.limites = tuple(limites)
+        self._lock = threading.Lock()
+        self._contadores = {}    # nombre -> {etiquetas: valor}
+        self._gauges = {}        # nombre -> {etiquetas: valor}
+        self._histogramas = {}   # nombre -> {etiquetas: [cuentas por límite..., suma, n]}
+        self.inicio = time.time()
+
+    # --------------------------------------------------------------------------
+    # Registro
+    # --------------------------------------------------------------------------
+
+    def incrementar(self, nombre, valor=1, **etiquetas):
+        clave = _etiquetas(etiquetas)
+        with self._lock:
+            serie = self._contadores.setdefault(nombre, {})
+            serie[clave] = serie.get(clave, 0) + valor
+
+    def fijar(self, nombre, valor, **etiquetas):
+        with self._lock:
+            self._gauges.setdefault(nombre, {})[_etiquetas(etiquetas)] = valor
+
+    def observar(self, nombre, valor, **etiquetas):
+        clave = _etiquetas(etiquetas)
+        with self._lock:
+            datos = self._histogramas.setdefault(nombre, {}).get(clave)
+            if datos is None:
+                datos = self._histogramas[nombre][clave] = [0] * len(self.limites) + [0.0, 0]
+            for i, limite in enumerate(self.limites):
+                if valor <= limite: datos[i] += 1
+            datos[-2] += valor
+            datos[-1] += 1
+
+    @contextmanager
+    def cronometro(self, nombre, **etiquetas):
+        """Observa en el histograma 'nombre' la duración (s) del bloque, aunque lance una excepción."""
+        t0 = time.perf_counter()
+        try: yield
+        finally: self.observar(nombre, time.perf_counter() - t0, **etiquetas)
+
+    # --------------------------------------------------------------------------
+    # Exportación
+    # --------------------------------------------------------------------------
+
+    def como_dict(self):
+        """Instantánea JSON-serializable: contadores, gauges e histogramas (con media y cuentas por límite)."""
+        def series(d, convertir):
+            return {nombre: [dict(etiquetas=dict(k), **convertir(v)) for k, v in valores.items()]
+                    for nombre, valores in d.items()}
+        with self._lock:
+            contadores = series(self._contadores, lambda v: {'valor': v})
+            gauges = series(self._gauges, lambda v: {'valor': v})
+            histogramas = series(self._histogramas, lambda v: {
+                'n': v[-1], 'suma': v[-2], 'media': v[-2] / v[-1] if v[-1] else None,
+                'limites': {str(l): c for l, c in zip(self.limites, v[:-2])}})
+        return {'timestamp': time.time(), 'uptime_segundos': time.time() - self.inicio,
+                'contadores': contadores, 'gauges': gauges, 'histogramas': histogramas}
+
+    def texto_prometheus(self):
+        """Todas las métricas en el formato de texto de Prometheus (version=0.0.4)."""
+        lineas = []
+        with self._lock:
+            for tipo, datos in (('counter', self._contadores), ('gauge', self._gauges)):
+                for nombre in sorted(datos):
+                    if nombre in DESCRIPCIONES: lineas.append(f"# HELP {nombre} {DESCRIPCIONES[nombre]}")
+                    lineas.append(f"# TYPE {nombre} {tipo}")
+                    for etiquetas, valor in sorted(datos[nombre].items()):
+                        lineas.append(f"{nombre}{_texto_etiquetas(etiquetas)} {_numero(valor)}")
+            for nombre in sorted(self._histogramas):
+                if nombre in DESCRIPCIONES: lineas.append(f"# HELP {nombre} {DESCRIPCIONES[nombre]}")
+                lineas.append(f"# TYPE {nombre} histogram")
+                for etiquetas, datos in sorted(self._histogramas[nombre].items()):
+                    for limite, cuenta in zip(self.limites + (float('inf'),), datos[:-2] + [datos[-1]]):
+                        lineas.append(f"{nombre}_bucket{_texto_etiquetas(etiquetas, [('le', _numero(float(limite)))])} {cuenta}")
+                    lineas.append(f"{nombre}_sum{_texto_etiquetas(etiquetas)} {_numero(datos[-2])}")
+                    lineas.append(f"{nombre}_count{_texto_etiquetas(etiquetas)} {datos[-1]}")
+        return "\n".join(lineas) + "\n"
+
+    def volcar_json(self, path=METRICAS_JSON_FILE):
+        """Escribe como_dict() en 'path' (escritura atómica)."""
+        try:
+            temp_file = path + ".tmp"
+            with open(temp_file, 'w') as f: json.dump(self.como_dict(), f, indent=2)
+            os.replace(temp_file, path)
+        except OSError as e:
+            logger.error(f"Error al volcar métricas en {path}: {e}")
+
+
+class ServidorMetricas:
+    """Servidor HTTP local (hilo daemon): /metrics en formato Prometheus y /metrics.json."""
+
+    def __init__(self, registro, host='127.0.0.1', puerto=9108):
+        self.registro, self.host, self.puerto = registro, host, puerto
+        self._servidor = None
+
+    def iniciar(self):
+        registro = self.registro
+
+        class Manejador(BaseHTTPRequestHandler):
+            def log_message(self, *args): pass
+
+            def do_GET(self):
+                if self.path.split('?')[0] == '/metrics':
+                    cuerpo, tipo = registro.texto_prometheus().encode(), 'text/plain; version=0.0.4; charset=utf-8'
+                elif self.path.split('?')[0] == '/metrics.json':
+                    cuerpo, tipo = json.dumps(registro.como_dict()).encode(), 'application/json'
+                else:
+                    self.send_error(404); return
+                self.send_response(200)
+                self.send_header('Content-Type', tipo)
+                self.send_header('Content-Length', str(len(cuerpo)))
+                self.end_headers()
+                self.wfile.write(cuerpo)
+
+        self._servidor = ThreadingHTTPServer((self.host, self.puerto), Manejador)
+        self._servidor.daemon_threads = True
+        self.puerto = self._servidor.server_address[1]
+        threading.Thread(target=self._servidor.serve_forever, name='metricas', daemon=True).start()
+        logger.info(f"Métricas disponibles en http://{self.host}:{self.puerto}/metrics")
+        return self
+
+    def detener(self):
+        if self._servidor is not None:
+            self._servidor.shutdown(); self._servidor.server_close(); self._servidor = None
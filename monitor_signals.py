@@ -4,12 +4,36 @@ import numpy as np
 from binance.client import Client
 import json
 import time
-import requests
 from datetime import datetime, timezone
 from dotenv import load_dotenv
 import os
 import traceback # Para depuración
 import logging # ### CAMBIO: Importar logging
+import itertools
+import threading
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from kline_store import KlineStore, KLINES_DB_FILE
+from limitador_api import LimitadorPeso, ClienteLimitado
+from stream_klines import StreamKlines, WS_URL_BASE
+from indicadores import (apilar_ventanas, calcular_indicadores_lote, fila_indicadores, ema_lote)
+from indicadores_incrementales import (EstadoIndicadoresM15, guardar_snapshot, cargar_snapshot,
+                                       INDICADORES_SNAPSHOT_FILE)
+from estrategia import (calcular_pivotes_lote, reglas_entrada, calcular_vol_ratio, evaluar_salida, ultimo_cruce, en_zona_pivotes,
+                        precio_salida, horario_operativo, contexto_diario_lote, rsi_diario_actual, favorable_long_diario, INDICADORES_REQUERIDOS, NIVELES_TRADE, PARAMETROS_DEFECTO)
+from precios import InstantaneaPrecios
+from remuestreo import RemuestreadorIncremental
+from notificaciones import DespachadorTelegram, TELEGRAM_API_URL, TELEGRAM_PENDIENTES_FILE
+from planificador import PlanificadorVelas, RelojServidor, RegistroLatencias
+from metricas import RegistroMetricas, ServidorMetricas, METRICAS_JSON_FILE
+from transporte import cliente_binance, GRABACION_DIR
+from embudo import EmbudoFiltros
+from universo import (UNIVERSO_FILE, NIVELES, CADENCIA_LATENTE, cargar as cargar_universo, escanear as escanear_universo,
+                      antiguedad_horas, toca_escanear, barras_a_revisar, resumen_diferencias)
+from trade_store import TradeStore, TRADES_DB_FILE
+from analitica import resumen_telegram, rango_semana
+from cuentas import Cuenta, CUENTA_PRINCIPAL, cargar_cuentas, nombres_cuentas, con_sufijo
+from registro import configurar_logging, DiarioEventos, valores_indicadores, LOG_FILE, EVENTOS_FILE, LOG_MAX_MB, LOG_COPIAS
 
 load_dotenv()
 # ==============================================================================
@@ -17,12 +41,20 @@ load_dotenv()
 # ==============================================================================
 ### CAMBIO: Configurar el logging para guardar en archivo
 log_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
-log_handler = logging.FileHandler('bot_activity.log', mode='a') # 'a' para añadir al archivo existente
-log_handler.setFormatter(log_formatter)
+LOG_ROTACION = os.getenv("LOG_ROTACION", "tamano") # 'tamano' (LOG_MAX_MB por archivo) o 'diaria' (medianoche UTC)
+LOG_MAX_MB_ARCHIVO = float(os.getenv("LOG_MAX_MB", str(LOG_MAX_MB)))
+LOG_COPIAS_ARCHIVO = int(os.getenv("LOG_COPIAS", str(LOG_COPIAS)))
 
 logger = logging.getLogger()
-logger.setLevel(logging.INFO) # Nivel mínimo de mensajes a registrar (INFO, WARNING, ERROR, DEBUG)
-logger.addHandler(log_handler)
+# Los hilos del bot solo encolan; un hilo propio escribe y rota bot_activity.log (ver registro.py)
+log_listener = configurar_logging(LOG_FILE, log_formatter, logging.INFO, LOG_ROTACION, LOG_MAX_MB_ARCHIVO, LOG_COPIAS_ARCHIVO)
+
+# Diario de eventos en JSONL (señales evaluadas y disparadas, TP1/TP2/SL, resumen de ciclo) para
+# consultarlo con registro.leer_eventos sin parsear el log de texto. Vacío = sin diario
+diario_eventos = DiarioEventos(os.getenv("EVENTOS_FILE", EVENTOS_FILE), LOG_ROTACION, LOG_MAX_MB_ARCHIVO, LOG_COPIAS_ARCHIVO)
+# Indicadores de la vela de entrada que acompañan a cada señal evaluada
+INDICADORES_EVENTO = ['Close', 'RSI', 'ADX', 'DI_plus', 'DI_minus', 'MACD_hist', 'BB_upper', 'BB_lower',
+                      'EMA8', 'EMA24', 'EMA50', 'EMA100', 'EMA200', 'Efficiency_Ratio', 'Volume', 'Volume_MA20']
 
 # Opcional: Si también quieres ver los logs en consola mientras pruebas
 # console_handler = logging.StreamHandler()
@@ -37,123 +69,210 @@ API_KEY = os.getenv("API_KEY")
 SECRET_KEY = os.getenv("SECRET_KEY")
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
+TELEGRAM_URL = os.getenv("TELEGRAM_API_URL", TELEGRAM_API_URL) # Permite apuntar a un servidor HTTP local de pruebas
+TELEGRAM_AGRUPAR_SEG = float(os.getenv("TELEGRAM_AGRUPAR_SEG", "2")) # Ventana para unir alertas de un mismo ciclo
+
+MODO_TRANSPORTE = os.getenv("BINANCE_TRANSPORTE", "directo") # 'directo', 'grabar' o 'reproducir' (sin red, ver transporte.py)
+BINANCE_GRABACION_DIR = os.getenv("BINANCE_GRABACION_DIR", GRABACION_DIR)
 
-if not API_KEY or not SECRET_KEY:
+if (not API_KEY or not SECRET_KEY) and MODO_TRANSPORTE != 'reproducir':
     logger.error("Las claves API_KEY o SECRET_KEY no se encontraron en el archivo .env.") # ### CAMBIO: Usar logger.error
     raise ValueError("ERROR: Las claves API_KEY o SECRET_KEY no se encontraron en el archivo .env.")
+SCAN_WORKERS = int(os.getenv("SCAN_WORKERS", "1")) # >1 activa el escaneo paralelo de símbolos
+PESO_API_POR_MINUTO = int(os.getenv("PESO_API_POR_MINUTO", "2000")) # Margen bajo el límite de 2400 de Binance
+PIVOTES_WORKERS = int(os.getenv("PIVOTES_WORKERS", "8")) # Descargas paralelas de velas diarias en el cambio de día
+METRICAS_PUERTO = os.getenv("METRICAS_PUERTO", "9108") # Endpoint local /metrics y /metrics.json (vacío = desactivado)
+
+# Métricas de duración por etapa, llamadas a la API, Telegram y señales (ver metricas.py)
+metricas = RegistroMetricas()
+
 # Ajustar timeout para llamadas a la API (ej. 60 segundos)
-client = Client(API_KEY, SECRET_KEY, {"timeout": 60})
+# El cliente descuenta el peso de cada petición de un token bucket compartido por todos los hilos
+limitador_api = LimitadorPeso(PESO_API_POR_MINUTO)
+client = ClienteLimitado(cliente_binance(API_KEY, SECRET_KEY, {"timeout": 60}, MODO_TRANSPORTE, BINANCE_GRABACION_DIR,
+                                         'monitor_signals'), limitador_api, metricas)
+
+# Almacén local de velas: solo se descarga la cola que falta en cada ciclo
+kline_store = KlineStore(KLINES_DB_FILE)
+
+# Serializa los chequeos de salida entre el ciclo principal, el monitor rápido de salidas
+# y los hilos que procesan cierres de vela (modo stream)
+trades_lock = threading.Lock()
+
+# Pivotes y contexto diario (RSI diario) del día en memoria: solo se recalculan
+# (o se releen de PIVOTS_FILE) cuando cambia la fecha UTC
+tabla_diaria = {'fecha': None, 'pivots': {}, 'contexto': {}}
+pivotes_lock = threading.Lock()
+
+# Velas H1 derivadas de las M15 del almacén (sin pedir la serie H1 a la API)
+series_h1 = RemuestreadorIncremental(Client.KLINE_INTERVAL_1HOUR)
+
+# Las notificaciones se encolan y las envía un hilo propio (agrupadas, con reintentos)
+despachador_telegram = DespachadorTelegram(TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID, url_base=TELEGRAM_URL,
+                                           ventana_agrupado=TELEGRAM_AGRUPAR_SEG, metricas=metricas)
+
+# Hora del servidor de Binance (alinea los ciclos al cierre de vela) y latencias cierre -> señal / alerta
+reloj_servidor = RelojServidor(client)
+latencias = RegistroLatencias(reloj_servidor, metricas=metricas)
 
+# Último precio y extremos intravela de cada símbolo (una petición masiva por ciclo, o el stream)
+instantanea_precios = InstantaneaPrecios()
 
 # Nombres de archivos
 SYMBOLS_FILE = 'top_100_symbols.json'
 PIVOTS_FILE = 'daily_pivots.json'
-TRADES_FILE = 'active_trades.json'
-CLOSED_TRADES_FILE = 'closed_trades.json'
+TRADES_FILE = 'active_trades.json'        # Solo para la importación inicial al almacén de trades
+CLOSED_TRADES_FILE = 'closed_trades.json' # Ídem
 HISTORICO_CSV_FILE = 'historico_trades.csv'
+HISTORICO_PARQUET_DIR = os.getenv("HISTORICO_PARQUET_DIR", "") # Vacío = sin exportación Parquet
+UNIVERSO_REFRESCO_HORAS = float(os.getenv("UNIVERSO_REFRESCO_HORAS", "6")) # Re-escaneo del universo por liquidez (0 = nunca)
+CADENCIA_LATENTE_BARRAS = int(os.getenv("CADENCIA_LATENTE", str(CADENCIA_LATENTE))) # Símbolos latentes: una vela de cada N
+
+# Universo clasificado por liquidez y volatilidad (ver universo.py). Vacío = solo SYMBOLS_FILE, todos en cada vela
+universo_actual = {'fecha': None, 'simbolos': {}}
+universo_actual.update(cargar_universo(UNIVERSO_FILE) or {})
+
+# Trades abiertos y cerrados en SQLite; los JSON antiguos se importan una sola vez
+trade_store = TradeStore(TRADES_DB_FILE)
+trade_store.importar_json(TRADES_FILE, CLOSED_TRADES_FILE, HISTORICO_CSV_FILE)
+
+# Cuenta principal y cuentas adicionales de CUENTAS (ver cuentas.py): velas, precios y señales se
+# calculan una sola vez y cada cuenta solo aporta sus trades, su chat y su cliente (peso por clave)
+cuenta_principal = Cuenta(CUENTA_PRINCIPAL, trade_store, despachador_telegram, client=client,
+                          historico_csv=HISTORICO_CSV_FILE, parquet_dir=HISTORICO_PARQUET_DIR)
+cuentas = [cuenta_principal] + cargar_cuentas(
+    nombres_cuentas(os.getenv("CUENTAS")), TradeStore,
+    lambda token, chat_id: DespachadorTelegram(token, chat_id, url_base=TELEGRAM_URL, ventana_agrupado=TELEGRAM_AGRUPAR_SEG,
+                                               archivo_pendientes=con_sufijo(TELEGRAM_PENDIENTES_FILE, str(chat_id)),
+                                               metricas=metricas),
+    lambda nombre, api_key, api_secret: cliente_binance(api_key, api_secret, {"timeout": 60}, MODO_TRANSPORTE,
+                                                        BINANCE_GRABACION_DIR, f'monitor_signals_{nombre}'),
+    TRADES_DB_FILE, HISTORICO_CSV_FILE, HISTORICO_PARQUET_DIR, PESO_API_POR_MINUTO, metricas,
+    despachadores={(TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID): despachador_telegram})
+if len(cuentas) > 1: logger.info(f"Cuentas: {', '.join(c.nombre for c in cuentas)}")
 
 INTERVALO_MONITOREO_SEG = 900 # 15 minutos
-EFFICIENCY_RATIO_PERIOD = 20 # Periodo para el Ratio de Eficiencia
+RETARDO_CIERRE_SEG = float(os.getenv("RETARDO_CIERRE_SEG", "3")) # Segundos tras el cierre de vela para empezar el ciclo
+MODO_INGESTA = os.getenv("MODO_INGESTA", "rest") # 'rest' (polling) o 'stream' (websocket, evalúa al cierre de vela)
+BINANCE_WS_URL = os.getenv("BINANCE_WS_URL", WS_URL_BASE)
+SALIDAS_INTERVALO_SEG = float(os.getenv("SALIDAS_INTERVALO_SEG", "5")) # Monitor rápido de SL/TP de los trades abiertos (0 = solo en cada ciclo)
+DIAS_CONTEXTO_DIARIO = 30 # Velas diarias para el RSI diario (igual que el antiguo "30 day ago UTC")
+VENTANA_H1_DIAS = 5 # Historial H1 del filtro de tendencia (igual que el antiguo "5 day ago UTC")
+VENTANA_M15_HORAS = 55 # Historial M15 usado para los indicadores (igual que el antiguo "55 hour ago UTC")
 
 # ==============================================================================
 # 2. 🧮 FÓRMULAS Y UTILIDADES
 # ==============================================================================
 
-def calculate_pivots_fibonacci(high, low, close):
-    # Asegurarse de que high >= low
-    if high < low: high, low = low, high
-    rango = high - low
-    PP = (high + low + close) / 3
-    FIB_382, FIB_618, FIB_100 = 0.382, 0.618, 1.000
-    R1 = PP + (rango * FIB_382); R2 = PP + (rango * FIB_618); R3 = PP + (rango * FIB_100)
-    S1 = PP - (rango * FIB_382); S2 = PP - (rango * FIB_618); S3 = PP - (rango * FIB_100)
-    return {k: round(v, 4) for k, v in {'PP': PP, 'R1': R1, 'R2': R2, 'R3': R3, 'S1': S1, 'S2': S2, 'S3': S3}.items()}
-
 def enviar_telegram(mensaje):
-    if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHAT_ID: return
-    url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
-    payload = {'chat_id': TELEGRAM_CHAT_ID, 'text': mensaje, 'parse_mode': 'Markdown'}
-    try: requests.post(url, data=payload, timeout=10)
-    except Exception as e: logger.error(f"Error al enviar mensaje a Telegram: {e}") # ### CAMBIO: Usar logger.error
-
-# Funciones de persistencia de estado de operaciones
-
-def load_active_trades():
+    """No bloquea: el mensaje se encola en despachador_telegram (ver notificaciones.py)."""
+    despachador_telegram.enviar(mensaje)
+
+# Funciones de persistencia de estado de operaciones (SQLite, ver trade_store.py)
+
+def activos_por_cuenta():
+    """[(cuenta, {symbol: trade})] de las cuentas con algún trade abierto (una consulta SQLite por cuenta)."""
+    return [(cuenta, activos) for cuenta in cuentas for activos in (cuenta.activos(),) if activos]
+
+
+def simbolos_abiertos_en_todas():
+    """Símbolos con trade abierto en todas las cuentas: solo esos se dejan de escanear."""
+    abiertos = None
+    for cuenta in cuentas:
+        activos = set(cuenta.activos())
+        abiertos = activos if abiertos is None else abiertos & activos
+        if not abiertos: return set()
+    return abiertos
+
+
+def abrir_en_cuentas(symbol, new_trade_data, mensaje, cierre_ms=None):
+    """Da de alta la señal en cada cuenta que no tenga ya el símbolo abierto. Devuelve en cuántas."""
+    abiertas = []
+    for cuenta in cuentas:
+        # El índice único de trades abiertos descarta un alta duplicada del mismo símbolo
+        if not cuenta.trade_store.abrir(symbol, dict(new_trade_data)): continue
+        cuenta.enviar(mensaje); abiertas.append(cuenta.nombre)
+    if abiertas:
+        # Las salidas del trade se juzgan desde el precio de entrada, no con los extremos de antes
+        instantanea_precios.seguir(symbol, new_trade_data['entry_price'])
+        diario_eventos.registrar('senal', symbol=symbol, entry_type=new_trade_data['entry_type'], cierre_ms=cierre_ms,
+                                 cuentas=abiertas, trade=dict(new_trade_data))
+    return len(abiertas)
+
+
+def registrar_evaluacion(symbol, last, entry_type, cierre_ms=None):
+    """Evento 'senal_evaluada': resultado de las reglas de entrada y los indicadores de la vela."""
+    diario_eventos.registrar('senal_evaluada', symbol=symbol, resultado=entry_type, cierre_ms=cierre_ms,
+                             indicadores=valores_indicadores(dict(last, vol_ratio=calcular_vol_ratio(last)),
+                                                             INDICADORES_EVENTO + ['vol_ratio']))
+
+
+def exportar_historico(cuenta=None):
+    """Añade al CSV (y al directorio Parquet, si está configurado) solo los trades cerrados aún no exportados."""
+    cuenta = cuenta or cuenta_principal
     try:
-        if os.path.exists(TRADES_FILE) and os.path.getsize(TRADES_FILE) > 0:
-            with open(TRADES_FILE, 'r') as f: return json.load(f)
-        return {}
-    except json.JSONDecodeError:
-        logger.warning(f"Error al decodificar {TRADES_FILE}. Archivo corrupto?. Usando diccionario vacío.") # ### CAMBIO: Usar logger.warning
-        return {}
+        nuevos = cuenta.trade_store.exportar_csv(cuenta.historico_csv)
+        if nuevos: logger.info(f"Historial actualizado en {cuenta.historico_csv} ({nuevos} trades)")
     except Exception as e:
-        logger.error(f"Error al cargar {TRADES_FILE}: {e}") # ### CAMBIO: Usar logger.error
-        return {}
+        logger.error(f"Error al guardar historial en CSV: {e}")
+    if cuenta.parquet_dir:
+        try: cuenta.trade_store.exportar_parquet(cuenta.parquet_dir)
+        except Exception as e: logger.error(f"Error al exportar historial a Parquet: {e}")
 
+# ==============================================================================
+# 3. 💾 FUNCIÓN DE ACTUALIZACIÓN DIARIA DE PIVOTES Y RESUMEN
+# ==============================================================================
 
-def save_active_trades(trades):
-    def enhanced_json_converter(obj):
-        if isinstance(obj, np.integer): return int(obj)
-        if isinstance(obj, np.floating): return float(obj)
-        if isinstance(obj, np.bool_): return bool(obj)
-        if isinstance(obj, (datetime, pd.Timestamp)): return obj.isoformat()
-        raise TypeError(f'Object of type {obj.__class__.__name__} is not JSON serializable')
-    try:
-        temp_file = TRADES_FILE + ".tmp"
-        with open(temp_file, 'w') as f: json.dump(trades, f, indent=4, default=enhanced_json_converter)
-        os.replace(temp_file, TRADES_FILE)
-    except Exception as e:
-        logger.error(f"Error al guardar {TRADES_FILE}: {e}") # ### CAMBIO: Usar logger.error
-        if os.path.exists(temp_file):
-            try: os.remove(temp_file)
-            except Exception as rem_e: logger.error(f"No se pudo eliminar archivo temporal {temp_file}: {rem_e}") # ### CAMBIO: Usar logger.error
-
-def load_closed_trades():
-    try:
-        if os.path.exists(CLOSED_TRADES_FILE) and os.path.getsize(CLOSED_TRADES_FILE) > 0:
-            with open(CLOSED_TRADES_FILE, 'r') as f: return json.load(f)
-        return []
-    except json.JSONDecodeError:
-        logger.warning(f"Error al decodificar {CLOSED_TRADES_FILE}. Archivo corrupto?. Usando lista vacía.") # ### CAMBIO: Usar logger.warning
-        return []
-    except Exception as e:
-        logger.error(f"Error al cargar {CLOSED_TRADES_FILE}: {e}") # ### CAMBIO: Usar logger.error
-        return []
-
-def save_closed_trades(trades_list):
-    """Guarda el historial en JSON y también en un archivo CSV para análisis en Excel."""
+def descargar_velas_diarias(symbols):
+    """
+    Velas diarias de los últimos DIAS_CONTEXTO_DIARIO días por símbolo (la última es la de hoy, aún abierta).
+    Se descargan en paralelo (el limitador de peso reparte el ritmo entre hilos); sin pausas por error.
+    """
+    inicio_ms = int((datetime.now(timezone.utc) - pd.Timedelta(days=DIAS_CONTEXTO_DIARIO)).timestamp() * 1000)
+    with ThreadPoolExecutor(max_workers=max(1, PIVOTES_WORKERS), thread_name_prefix='diario') as pool:
+        futuros = {symbol: pool.submit(kline_store.obtener_rango, client, symbol, Client.KLINE_INTERVAL_1DAY, inicio_ms)
+                   for symbol in symbols}
+    velas = {}
+    for symbol, futuro in futuros.items():
+        try: velas[symbol] = futuro.result()
+        except Exception as e: logger.warning(f"Error descargando velas diarias de {symbol}: {e}")
+    return velas
+
+
+def construir_contexto_diario(velas):
+    """
+    Tabla symbol -> parte fija del día del filtro top-down (RSI diario de los cierres previos),
+    calculada para todo el universo en una sola pasada vectorizada. Ver get_market_condition.
+    """
+    symbols = [symbol for symbol, df in velas.items() if len(df) >= 2]
+    if not symbols: return {}
+    cierres = np.full((len(symbols), DIAS_CONTEXTO_DIARIO), np.nan)
+    for i, symbol in enumerate(symbols):
+        previos = velas[symbol]['Close'].to_numpy(dtype=float)[:-1][-DIAS_CONTEXTO_DIARIO:]
+        cierres[i, DIAS_CONTEXTO_DIARIO - len(previos):] = previos
+    ctx = contexto_diario_lote(cierres, [len(velas[symbol]) for symbol in symbols])
+    return {symbol: {k: v[i].item() for k, v in ctx.items()} for i, symbol in enumerate(symbols)}
+
+
+def pivotes_de_velas(velas, fecha):
+    """Pivotes del día 'fecha' de todos los símbolos en una sola pasada vectorizada (vela de ayer = penúltima)."""
+    validos = [symbol for symbol, df in velas.items() if len(df) >= 2]
+    if not validos: return {}
+    high_d, low_d, close_d = np.array([[float(velas[symbol].iloc[-2][c]) for c in ['High', 'Low', 'Close']]
+                                       for symbol in validos]).T
+    niveles = calcular_pivotes_lote(high_d, low_d, close_d)
+    return {symbol: {'date': fecha, 'levels': {k: float(v[n]) for k, v in niveles.items()}}
+            for n, symbol in enumerate(validos)}
+
+
+def guardar_pivotes(all_pivots):
     try:
-        temp_file_json = CLOSED_TRADES_FILE + ".tmp"
-        with open(temp_file_json, 'w') as f: json.dump(trades_list, f, indent=4, default=str)
-        os.replace(temp_file_json, CLOSED_TRADES_FILE)
+        # El archivo solo sirve para no recalcular tras un reinicio el mismo día
+        with open(PIVOTS_FILE, 'w') as f: json.dump(all_pivots, f, indent=4)
+        logger.info(f"{len(all_pivots)} Pivotes guardados en {PIVOTS_FILE}") # ### CAMBIO: Usar logger.info
     except Exception as e:
-        logger.error(f"Error al guardar {CLOSED_TRADES_FILE}: {e}") # ### CAMBIO: Usar logger.error
-        if os.path.exists(temp_file_json):
-            try: os.remove(temp_file_json)
-            except Exception as rem_e: logger.error(f"No se pudo eliminar archivo temporal {temp_file_json}: {rem_e}") # ### CAMBIO: Usar logger.error
-
-
-    if trades_list:
-        try:
-            df = pd.DataFrame(trades_list)
-
-            ### AJUSTE 4: GUARDADO COMPLETO DEL CSV (CORREGIDO) ###
-            # Guarda todas las columnas del DataFrame, en lugar de una lista fija.
-            df_ordered = df
+        logger.error(f"Error al guardar {PIVOTS_FILE}: {e}") # ### CAMBIO: Usar logger.error
 
-            temp_file_csv = HISTORICO_CSV_FILE + ".tmp"
-            df_ordered.to_csv(temp_file_csv, index=False, mode='w')
-            os.replace(temp_file_csv, HISTORICO_CSV_FILE)
-            logger.info(f"Historial actualizado en {HISTORICO_CSV_FILE}") # ### CAMBIO: Usar logger.info
-        except Exception as e:
-            logger.error(f"Error al guardar historial en CSV: {e}") # ### CAMBIO: Usar logger.error
-            if os.path.exists(temp_file_csv):
-                 try: os.remove(temp_file_csv)
-                 except Exception as rem_e: logger.error(f"No se pudo eliminar archivo temporal {temp_file_csv}: {rem_e}") # ### CAMBIO: Usar logger.error
-
-# ==============================================================================
-# 3. 💾 FUNCIÓN DE ACTUALIZACIÓN DIARIA DE PIVOTES Y RESUMEN
-# ==============================================================================
 
 def actualizar_pivotes_diarios():
     """Calcula Pivotes y envía resumen diario sin borrar el historial."""
@@ -165,43 +284,35 @@ def actualizar_pivotes_diarios():
              logger.error(f"Archivo {SYMBOLS_FILE} está vacío."); return False # ### CAMBIO: Usar logger.error
     except (json.JSONDecodeError, Exception) as e:
          logger.error(f"Error al leer {SYMBOLS_FILE}: {e}"); return False # ### CAMBIO: Usar logger.error
+    # Los símbolos que salieron del universo con un trade abierto conservan sus pivotes
+    for _, activos in activos_por_cuenta():
+        symbols += [symbol for symbol in activos if symbol not in symbols]
 
-    all_closed_trades = load_closed_trades()
     yesterday_utc_str = (datetime.now(timezone.utc) - pd.Timedelta(days=1)).strftime("%Y-%m-%d")
-    trades_de_ayer = [t for t in all_closed_trades if isinstance(t.get('close_date'), str) and t['close_date'].startswith(yesterday_utc_str)]
-
-    if trades_de_ayer:
-        ganadoras = sum(1 for t in trades_de_ayer if t.get('status') == 'CLOSED_TP')
-        perdedoras = sum(1 for t in trades_de_ayer if t.get('status') == 'CLOSED_SL')
-        mensaje = (f"📊 **RESUMEN ({yesterday_utc_str})** 📊\n"
-                   f"G: {ganadoras} | P: {perdedoras} | T: {len(trades_de_ayer)}")
-        enviar_telegram(mensaje)
+    today_utc_str = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    # Resumen de ayer (y los lunes, de la semana anterior) de cada cuenta, en su propio chat.
+    # Sale de los agregados que actualiza cada cierre (ver analitica.py): no recorre el histórico
+    semana = rango_semana(today_utc_str) if datetime.now(timezone.utc).weekday() == 0 else None
+    for cuenta in cuentas:
+        try:
+            mensaje = resumen_telegram(cuenta.trade_store.estadisticas(desde=yesterday_utc_str, hasta=today_utc_str),
+                                       f"RESUMEN ({yesterday_utc_str})")
+            if mensaje: cuenta.enviar(mensaje)
+            if semana:
+                mensaje = resumen_telegram(cuenta.trade_store.estadisticas(*semana), f"RESUMEN SEMANAL ({semana[0]} → {semana[1]})")
+                if mensaje: cuenta.enviar(mensaje)
+        except Exception as e: logger.error(f"Error en el resumen de la cuenta {cuenta.nombre}: {e}")
 
-    all_pivots = {}
     today_utc = datetime.now(timezone.utc).strftime("%Y-%m-%d")
     logger.info(f"Iniciando cálculo de Pivotes para {today_utc}") # ### CAMBIO: Usar logger.info
-    symbols_processed = 0
-    for symbol in symbols:
-        try:
-            klines_daily = client.futures_historical_klines(symbol, Client.KLINE_INTERVAL_1DAY, "2 day ago UTC", limit=2)
-            if len(klines_daily) < 2: continue
-            high_d, low_d, close_d = [float(klines_daily[-2][i]) for i in [2, 3, 4]]
-            pivotes = calculate_pivots_fibonacci(high_d, low_d, close_d)
-            all_pivots[symbol] = {'date': today_utc, 'levels': pivotes}
-            symbols_processed += 1
-            if symbols_processed % 50 == 0: logger.info(f"   ...Calculando Pivotes {symbols_processed}/{len(symbols)}") # ### CAMBIO: Usar logger.info
-        except Exception as e:
-            logger.warning(f"Error calculando Pivotes para {symbol}: {e}") # ### CAMBIO: Usar logger.warning
-            time.sleep(1)
+    velas = descargar_velas_diarias(symbols)
+
+    all_pivots = pivotes_de_velas(velas, today_utc)
 
     if all_pivots:
-        try:
-            with open(PIVOTS_FILE, 'w') as f: json.dump(all_pivots, f, indent=4)
-            logger.info(f"{len(all_pivots)} Pivotes guardados en {PIVOTS_FILE}") # ### CAMBIO: Usar logger.info
-            enviar_telegram(f"⭐️ **PIVOTES ACTUALIZADOS** {today_utc} ({len(all_pivots)} pares).")
-        except Exception as e:
-            logger.error(f"Error al guardar {PIVOTS_FILE}: {e}") # ### CAMBIO: Usar logger.error
-            return False
+        tabla_diaria.update(fecha=today_utc, pivots=all_pivots, contexto=construir_contexto_diario(velas))
+        guardar_pivotes(all_pivots)
+        enviar_telegram(f"⭐️ **PIVOTES ACTUALIZADOS** {today_utc} ({len(all_pivots)} pares).")
     else:
         logger.warning(f"No se calcularon pivotes para {today_utc}") # ### CAMBIO: Usar logger.warning
         enviar_telegram(f"⚠️ **ERROR PIVOTES:** No se pudieron calcular los pivotes para {today_utc}.")
@@ -209,14 +320,21 @@ def actualizar_pivotes_diarios():
     return True
 
 def verificar_y_actualizar_pivotes():
+    """
+    Deja en tabla_diaria los pivotes y el contexto diario del día UTC. Mientras la fecha no
+    cambie no se toca disco ni la API; tras un reinicio se reutiliza PIVOTS_FILE si ya es de hoy.
+    """
     today_utc = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    if tabla_diaria['fecha'] == today_utc: return True
     try:
         if os.path.exists(PIVOTS_FILE) and os.path.getsize(PIVOTS_FILE) > 0:
             with open(PIVOTS_FILE, 'r') as f:
                 try:
                     daily_data = json.load(f)
                     if daily_data and any(data.get('date') == today_utc for data in daily_data.values()):
-                         # logger.info(f"Pivotes para {today_utc} ya existen.") # Opcional: menos verboso
+                         contexto = construir_contexto_diario(descargar_velas_diarias(list(daily_data)))
+                         tabla_diaria.update(fecha=today_utc, pivots=daily_data, contexto=contexto)
+                         logger.info(f"Pivotes de {today_utc} cargados desde {PIVOTS_FILE}")
                          return True
                 except json.JSONDecodeError:
                     logger.warning(f"Archivo {PIVOTS_FILE} corrupto. Recalculando...") # ### CAMBIO: Usar logger.warning
@@ -227,119 +345,214 @@ def verificar_y_actualizar_pivotes():
         logger.error(f"Error inesperado al verificar pivotes: {e}. Intentando calcular...") # ### CAMBIO: Usar logger.error
         return actualizar_pivotes_diarios()
 
+def agregar_pivotes(symbols):
+    """Pivotes y contexto diario de los símbolos que entran al universo a mitad de día (sin resumen ni aviso)."""
+    with pivotes_lock:
+        fecha = tabla_diaria['fecha']
+        nuevos = [symbol for symbol in symbols if symbol not in tabla_diaria['pivots']]
+        # Sin tabla del día se calculará completa (con SYMBOLS_FILE ya actualizado) en cargar_pivotes
+        if fecha is None or not nuevos: return
+        velas = descargar_velas_diarias(nuevos)
+        tabla_diaria['pivots'].update(pivotes_de_velas(velas, fecha))
+        tabla_diaria['contexto'].update(construir_contexto_diario(velas))
+        guardar_pivotes(tabla_diaria['pivots'])
+
+
+def refrescar_universo():
+    """
+    Re-escanea el universo (una llamada a futures_ticker) si tiene más de UNIVERSO_REFRESCO_HORAS.
+    Los símbolos que entran reciben al momento sus pivotes del día; los que salen dejan de
+    escanearse (sus pivotes se conservan hasta el cambio de día por si tienen un trade abierto).
+    Devuelve las diferencias con el universo anterior (None si no tocaba re-escanear o falló).
+    """
+    if UNIVERSO_REFRESCO_HORAS <= 0 or antiguedad_horas(universo_actual) < UNIVERSO_REFRESCO_HORAS: return None
+    habia_universo = bool(universo_actual['simbolos'])
+    try: nuevo, dif = escanear_universo(client, universo_actual, UNIVERSO_FILE, SYMBOLS_FILE)
+    except Exception as e:
+        logger.warning(f"Error re-escaneando el universo: {e}")
+        return None
+    universo_actual.update(nuevo)
+    for nivel in NIVELES:
+        metricas.fijar('bot_universo_simbolos', sum(1 for i in nuevo['simbolos'].values() if i['nivel'] == nivel), nivel=nivel)
+    if habia_universo and (dif['altas'] or dif['bajas']):
+        enviar_telegram(f"🔄 *Universo actualizado*: {resumen_diferencias(dif)}")
+    if dif['altas']: agregar_pivotes(dif['altas'])
+    return dif
+
+
+def simbolos_stream():
+    """Universo (SYMBOLS_FILE) más los símbolos con trade abierto en alguna cuenta: sus salidas usan el precio del stream."""
+    with open(SYMBOLS_FILE, 'r') as f: symbols = json.load(f)
+    for _, activos in activos_por_cuenta(): symbols += [symbol for symbol in activos if symbol not in symbols]
+    return symbols
+
+
+def debe_escanear(symbol, cierre_ms):
+    """Nivel de escaneo: fuera del universo no se escanea; los latentes, una vela de cada CADENCIA_LATENTE_BARRAS."""
+    simbolos = universo_actual['simbolos']
+    if not simbolos: return True
+    if symbol not in simbolos: return False
+    return toca_escanear(symbol, simbolos[symbol], cierre_ms, INTERVALO_MONITOREO_SEG * 1000, CADENCIA_LATENTE_BARRAS)
+
+
+def barras_desde_escaneo(symbol):
+    """Velas en las que buscar el cruce de entrada: las que se saltó el símbolo desde su escaneo anterior, más la última."""
+    simbolos = universo_actual['simbolos']
+    return barras_a_revisar(simbolos.get(symbol), CADENCIA_LATENTE_BARRAS) if simbolos else 1
+
 # ==============================================================================
 # 4. 📈 LÓGICA DE SEGUIMIENTO DE OPERACIONES (TP/SL)
 # ==============================================================================
 
-def check_active_trades(all_pivots):
-    active_trades = load_active_trades()
-    if not active_trades: return
+def check_active_trades(all_pivots, actualizar_precios=True, cierre_ms=None):
+    """
+    Chequea SL / TP de los trades abiertos de todas las cuentas con la instantánea de precios compartida.
+    'actualizar_precios' hace la petición masiva de precios; en modo stream la
+    instantánea ya la alimenta el websocket y no hace falta.
+    'cierre_ms' es el cierre de vela que disparó el ciclo (para medir la latencia de las alertas).
+    """
+    por_cuenta = activos_por_cuenta()
+    if not por_cuenta:
+        instantanea_precios.sincronizar_seguidos(())
+        return
+
+    if actualizar_precios:
+        try: instantanea_precios.actualizar(client)
+        except Exception as e: logger.warning(f"Error obteniendo la instantánea de precios: {e}")
+
+    # Cada símbolo se consume una vez (consumir reinicia los extremos) y se evalúa en todas las cuentas que lo tienen
+    abiertos = {}
+    for cuenta, active_trades in por_cuenta:
+        for symbol, trade in active_trades.items():
+            if trade.get('status') == 'OPEN': abiertos.setdefault(symbol, []).append((cuenta, trade))
+    # Solo los símbolos con trade abierto acumulan extremos (los recuperados tras un reinicio empiezan ahora)
+    instantanea_precios.sincronizar_seguidos(abiertos)
+
+    cuentas_con_cierres = []
+    for symbol, trades in abiertos.items():
+        try:
+            precio = instantanea_precios.consumir(symbol)
+            if not precio:
+                # Símbolo ausente de la instantánea: precio individual (peso 1) con el cliente de la cuenta
+                # que tiene el trade, para que cuente en el presupuesto de su clave
+                cliente_cuenta = trades[0][0].client or client
+                instantanea_precios.registrar_precio(symbol, float(cliente_cuenta.futures_symbol_ticker(symbol=symbol)['price']))
+                precio = instantanea_precios.consumir(symbol)
+        except Exception as e:
+            logger.error(f"Error obteniendo el precio de {symbol}: {e}\n{traceback.format_exc()}")
+            continue
+        pivotes = all_pivots.get(symbol, {}).get('levels', {})
+        for cuenta, trade in trades:
+            try:
+                if procesar_salida(cuenta, symbol, trade, precio, pivotes, cierre_ms) and cuenta not in cuentas_con_cierres:
+                    cuentas_con_cierres.append(cuenta)
+            except Exception as e: logger.error(f"Error chequeando trade activo {symbol}: {e}\n{traceback.format_exc()}") # ### CAMBIO: Usar logger.error con traceback
+
+    for cuenta in cuentas_con_cierres: exportar_historico(cuenta)
+
+
+def procesar_salida(cuenta, symbol, trade, precio, pivotes, cierre_ms=None):
+    """Aplica SL / TP2 / TP1 a un trade de 'cuenta' con el precio del ciclo. Devuelve True si el trade se cerró."""
+    price, high, low = precio['price'], precio['high'], precio['low']
+    required_keys = [trade.get('tp1_key'), trade.get('tp2_key'), trade.get('sl_key')]
+    if not pivotes or not all(key and key in pivotes for key in required_keys):
+         logger.warning(f"Faltan niveles de pivote o claves para {symbol}. Trade: {trade.get('entry_date')}") # ### CAMBIO: Usar logger.warning
+         return False
+    cuenta_log = '' if cuenta.nombre == CUENTA_PRINCIPAL else f" [{cuenta.nombre}]"
+
+    # Se juzga el recorrido desde el último chequeo (high/low), no solo el último precio
+    evento, nivel = evaluar_salida(trade, price, pivotes, high, low)
+    if evento:
+        metricas.incrementar('bot_alertas_total', evento=evento)
+        latencias.registrar('alerta', cierre_ms, symbol)
+        if evento != 'TP1' or not trade.get('tp1_hit'):
+            diario_eventos.registrar('salida', symbol=symbol, evento=evento, cuenta=cuenta.nombre, price=price, high=high,
+                                     low=low, nivel=nivel, cierre_ms=cierre_ms, trade=dict(trade))
+
+    # SL Check (tras TP1 el SL ya está en break-even, ver evaluar_salida)
+    if evento == 'SL':
+        sl_level = nivel
+        mensaje = f"🛑 *SL {trade['entry_type']} {symbol}* | P: {price:.4f} SL: {sl_level:.4f}"
+        cuenta.enviar(mensaje)
+        logger.info(f"SL alcanzado para {symbol} ({trade['entry_type']}) a {price:.4f}{cuenta_log}") # ### CAMBIO: Usar logger.info
+        trade.update({'status': 'CLOSED_SL', 'close_price': precio_salida(trade['entry_type'], evento, nivel, price), 'close_date': datetime.now(timezone.utc).isoformat(), 'symbol': symbol})
+        cuenta.trade_store.cerrar(symbol, trade); return True
+
+    # TP2 Check
+    if evento == 'TP2':
+        tp2_level = nivel
+        if not trade.get('tp1_hit'):
+             trade['tp1_hit'] = True
+        mensaje = f"🎯 *TP2 {trade['entry_type']} {symbol}* | P: {price:.4f} TP2: {tp2_level:.4f}"
+        cuenta.enviar(mensaje)
+        logger.info(f"TP2 alcanzado para {symbol} ({trade['entry_type']}) a {price:.4f}{cuenta_log}") # ### CAMBIO: Usar logger.info
+        trade.update({'status': 'CLOSED_TP', 'tp2_hit': True, 'close_price': precio_salida(trade['entry_type'], evento, nivel, price), 'close_date': datetime.now(timezone.utc).isoformat(), 'symbol': symbol})
+        cuenta.trade_store.cerrar(symbol, trade); return True
+
+    # TP1 Check
+    if evento == 'TP1':
+        tp1_level = nivel
+        if not trade.get('tp1_hit'):
+            mensaje = f"✅ *TP1 {trade['entry_type']} {symbol}* | P: {price:.4f} TP1: {tp1_level:.4f}"
+            cuenta.enviar(mensaje); trade['tp1_hit'] = True
+            cuenta.trade_store.actualizar(symbol, trade)
+            logger.info(f"TP1 alcanzado para {symbol} ({trade['entry_type']}) a {price:.4f}{cuenta_log}") # ### CAMBIO: Usar logger.info
+    return False
+
+
+def chequeo_rapido_salidas(actualizar_precios=True):
+    """
+    Una pasada del monitor rápido de salidas: check_active_trades solo sobre los trades abiertos,
+    con los pivotes del día ya en memoria (el cambio de día lo resuelve el ciclo principal).
+    """
+    if tabla_diaria['fecha'] != datetime.now(timezone.utc).strftime("%Y-%m-%d"): return
+    with trades_lock, metricas.cronometro('bot_etapa_segundos', etapa='salidas_rapidas'):
+        check_active_trades(tabla_diaria['pivots'], actualizar_precios=actualizar_precios)
 
-    updated_trades = active_trades.copy()
-    closed_trades_list = load_closed_trades()
-    trades_closed_in_cycle = False
 
-    for symbol, trade in active_trades.items():
-        if trade.get('status') != 'OPEN': continue
-        try:
-            klines_15m = client.futures_historical_klines(symbol, Client.KLINE_INTERVAL_15MINUTE, "15m ago UTC", limit=1)
-            if not klines_15m: continue
-            price = float(klines_15m[-1][4])
-            pivotes = all_pivots.get(symbol, {}).get('levels', {})
-            required_keys = [trade.get('tp1_key'), trade.get('tp2_key'), trade.get('sl_key')]
-            if not pivotes or not all(key and key in pivotes for key in required_keys):
-                 logger.warning(f"Faltan niveles de pivote o claves para {symbol}. Trade: {trade.get('entry_date')}") # ### CAMBIO: Usar logger.warning
-                 continue
-
-            tp1_level, tp2_level, sl_level = pivotes[trade['tp1_key']], pivotes[trade['tp2_key']], pivotes[trade['sl_key']]
-            is_long = trade['entry_type'] == 'LONG'
-
-            ### AJUSTE 1 (DATO-CRÍTICO): MOVER SL A BREAK-EVEN EN TP1 ###
-            if trade.get('tp1_hit', False):
-                sl_level = trade['entry_price']
-            #############################################
-
-            # SL Check
-            if (is_long and price < sl_level) or (not is_long and price > sl_level):
-                mensaje = f"🛑 *SL {trade['entry_type']} {symbol}* | P: {price:.4f} SL: {sl_level:.4f}"
-                enviar_telegram(mensaje)
-                logger.info(f"SL alcanzado para {symbol} ({trade['entry_type']}) a {price:.4f}") # ### CAMBIO: Usar logger.info
-                trade.update({'status': 'CLOSED_SL', 'close_price': price, 'close_date': datetime.now(timezone.utc).isoformat(), 'symbol': symbol})
-                closed_trades_list.append(trade); del updated_trades[symbol]; trades_closed_in_cycle = True; continue
-
-            # TP2 Check
-            if (is_long and price > tp2_level) or (not is_long and price < tp2_level):
-                if symbol in updated_trades and not updated_trades[symbol].get('tp1_hit'):
-                     updated_trades[symbol]['tp1_hit'] = True
-                mensaje = f"🎯 *TP2 {trade['entry_type']} {symbol}* | P: {price:.4f} TP2: {tp2_level:.4f}"
-                enviar_telegram(mensaje)
-                logger.info(f"TP2 alcanzado para {symbol} ({trade['entry_type']}) a {price:.4f}") # ### CAMBIO: Usar logger.info
-                trade.update({'status': 'CLOSED_TP', 'tp2_hit': True, 'close_price': price, 'close_date': datetime.now(timezone.utc).isoformat(), 'symbol': symbol})
-                closed_trades_list.append(trade); del updated_trades[symbol]; trades_closed_in_cycle = True; continue
-
-            # TP1 Check
-            if (is_long and price > tp1_level) or (not is_long and price < tp1_level):
-                if symbol in updated_trades and not updated_trades[symbol].get('tp1_hit'):
-                    mensaje = f"✅ *TP1 {trade['entry_type']} {symbol}* | P: {price:.4f} TP1: {tp1_level:.4f}"
-                    enviar_telegram(mensaje); updated_trades[symbol]['tp1_hit'] = True
-                    logger.info(f"TP1 alcanzado para {symbol} ({trade['entry_type']}) a {price:.4f}") # ### CAMBIO: Usar logger.info
-        except Exception as e: logger.error(f"Error chequeando trade activo {symbol}: {e}\n{traceback.format_exc()}") # ### CAMBIO: Usar logger.error con traceback
-
-    save_active_trades(updated_trades)
-    if trades_closed_in_cycle:
-        current_closed = load_closed_trades()
-        existing = {(t.get('symbol'), t.get('entry_date')) for t in current_closed}
-        newly_closed = [t for t in closed_trades_list if t.get('status','').startswith('CLOSED') and (t.get('symbol'), t.get('entry_date')) not in existing]
-        if newly_closed:
-            current_closed.extend(newly_closed)
-            save_closed_trades(current_closed)
+def monitor_salidas(actualizar_precios, parar):
+    """Bucle del hilo de salidas: cada SALIDAS_INTERVALO_SEG, hasta que se active 'parar'."""
+    while not parar.wait(SALIDAS_INTERVALO_SEG):
+        try: chequeo_rapido_salidas(actualizar_precios)
+        except Exception as e: logger.error(f"Error en el monitor rápido de salidas: {e}\n{traceback.format_exc()}")
+
+
+def iniciar_monitor_salidas(actualizar_precios=True):
+    """
+    Arranca el hilo que vigila SL / TP2 / TP1 de los trades abiertos cada pocos segundos, sin esperar
+    al ciclo de 15 minutos. Modo REST: una petición masiva de precios (peso 2) por pasada, y ninguna
+    si no hay trades abiertos; modo stream: los precios intravela del websocket, sin API.
+    Devuelve el Event que lo detiene (None si SALIDAS_INTERVALO_SEG es 0).
+    """
+    if SALIDAS_INTERVALO_SEG <= 0: return None
+    parar = threading.Event()
+    threading.Thread(target=monitor_salidas, args=(actualizar_precios, parar), name='salidas', daemon=True).start()
+    logger.info(f"Monitor rápido de salidas activo (cada {SALIDAS_INTERVALO_SEG:g}s).")
+    return parar
 
 
 # ==============================================================================
 # 5. 🚦 DETECCIÓN DE NUEVAS SEÑALES (CON LÓGICA MEJORADA)
 # ==============================================================================
 
-def calculate_adx(df, period=14):
-    df['Prev_Close'] = df['Close'].shift(1); df['Prev_High'] = df['High'].shift(1); df['Prev_Low'] = df['Low'].shift(1)
-    df['High-Low'] = df['High'] - df['Low']
-    df['High-PrevClose'] = abs(df['High'] - df['Prev_Close'])
-    df['Low-PrevClose'] = abs(df['Low'] - df['Prev_Close'])
-    df['TR'] = df[['High-Low', 'High-PrevClose', 'Low-PrevClose']].max(axis=1).fillna(0)
-    move_up = df['High'] - df['Prev_High']; move_down = df['Prev_Low'] - df['Low']
-    df['+DM'] = np.where((move_up > move_down) & (move_up > 0), move_up, 0)
-    df['-DM'] = np.where((move_down > move_up) & (move_down > 0), move_down, 0)
-    alpha = 1 / period
-    TR_smooth = df['TR'].ewm(alpha=alpha, adjust=False).mean()
-    DM_plus_smooth = df['+DM'].ewm(alpha=alpha, adjust=False).mean(); DM_minus_smooth = df['-DM'].ewm(alpha=alpha, adjust=False).mean()
-    df['DI_plus'] = np.where(TR_smooth != 0, (DM_plus_smooth / TR_smooth) * 100, 0)
-    df['DI_minus'] = np.where(TR_smooth != 0, (DM_minus_smooth / TR_smooth) * 100, 0)
-    DI_diff = abs(df['DI_plus'] - df['DI_minus']); DI_sum = df['DI_plus'] + df['DI_minus']
-    df['DX'] = np.where(DI_sum != 0, (DI_diff / DI_sum) * 100, 0)
-    df['ADX'] = df['DX'].ewm(alpha=alpha, adjust=False).mean()
-    df.drop(columns=['Prev_Close', 'Prev_High', 'Prev_Low', 'High-Low', 'High-PrevClose', 'Low-PrevClose', 'TR', '+DM', '-DM', 'DX'], inplace=True, errors='ignore') # errors='ignore'
-    return df
-
-
-def calculate_efficiency_ratio(series, period):
-    """Calcula el Ratio de Eficiencia."""
-    if not isinstance(series, pd.Series): series = pd.Series(series) # Asegurar que es Series
-    if series.isnull().any() or len(series) < period + 1: return np.nan
-    net_change = abs(series.iloc[-1] - series.iloc[-(period + 1)])
-    sum_of_moves = abs(series.diff()).iloc[-period:].sum()
-    return net_change / sum_of_moves if sum_of_moves != 0 else 0
-
-
 def get_h1_trend_alignment(symbol, entry_type):
-    """Verifica si la tendencia H1 se alinea con la señal M15."""
+    """
+    Verifica si la tendencia H1 se alinea con la señal M15.
+    Las velas H1 se remuestrean de las M15 del almacén local (la última, a medias, como
+    la vela abierta de la API); solo la primera vez por símbolo se completa el historial.
+    """
     try:
-        klines_h1 = client.futures_historical_klines(symbol, Client.KLINE_INTERVAL_1HOUR, "5 day ago UTC", limit=100)
-        if len(klines_h1) < 51: return None # Aumentar si se necesita más historial para EMAs/MACD
-
-        df_h1 = pd.DataFrame(klines_h1, columns=['open_time','O','H','L','C','V','ct','qav','nt','tbbav','tbqav','ig'])
-        df_h1.rename(columns={'C': 'Close'}, inplace=True)
-        df_h1['Close'] = df_h1['Close'].astype(float)
-        df_h1.dropna(subset=['Close'], inplace=True)
-        if df_h1.empty or len(df_h1) < 51: return None
+        inicio_ms = int((datetime.now(timezone.utc) - pd.Timedelta(days=VENTANA_H1_DIAS)).timestamp() * 1000)
+        desde_ms = series_h1.pendiente_desde(symbol)
+        if desde_ms is None or desde_ms < inicio_ms:
+            series_h1.descartar(symbol)
+            df_m15 = kline_store.obtener_rango(client, symbol, Client.KLINE_INTERVAL_15MINUTE, inicio_ms)
+        else:
+            # La cola M15 ya se sincronizó al preparar el símbolo: basta leer el almacén
+            df_m15 = kline_store.leer_rango(symbol, Client.KLINE_INTERVAL_15MINUTE, desde_ms)
+        df_h1 = series_h1.actualizar(symbol, df_m15)
+        df_h1 = df_h1[df_h1['open_time'] >= inicio_ms].reset_index(drop=True)
+        if len(df_h1) < 51: return None # Aumentar si se necesita más historial para EMAs/MACD
 
         df_h1['EMA50_H1'] = df_h1['Close'].ewm(span=50, adjust=False).mean()
         ema12_h1 = df_h1['Close'].ewm(span=12, adjust=False).mean(); ema26_h1 = df_h1['Close'].ewm(span=26, adjust=False).mean()
@@ -364,255 +577,461 @@ def get_h1_trend_alignment(symbol, entry_type):
 ### ===========================================================================
 ### ### NUEVA FUNCIÓN (Punto 4 + 1): Filtro de Horario y Top-Down (RSI Diario)
 ### ===========================================================================
-def get_market_condition(symbol):
+def get_market_condition(symbol, precio):
     """
-    Evalúa condiciones generales del mercado para el par:
-    1. Filtro de Horario: No operar después de las 17:00 UTC.
-    2. Filtro Top-Down: No comprar (LONG) si el RSI Diario > 75.
+    Filtro Top-Down (Punto 4): no comprar (LONG) si el RSI Diario > 75.
+    Consulta O(1) a la tabla de contexto diario, construida una vez al cambiar el día
+    (ver construir_contexto_diario); el RSI se completa con el precio actual como
+    cierre de la vela de hoy. El filtro de horario se aplica antes, una vez por ciclo.
+    Solo se consulta para los símbolos cuyas reglas técnicas ya dan un LONG.
     Retorna (favorable_para_long, favorable_para_short)
     """
+    ctx = tabla_diaria['contexto'].get(symbol)
+    if ctx is None: return True, True # Favorable si no hay datos suficientes
+    rsi_diario = np.float64(np.nan)
+    if ctx['completo']:
+        rsi_diario = rsi_diario_actual(ctx['ganancia_previa'], ctx['perdida_previa'], ctx['cierre_previo'], precio)
+    if not favorable_long_diario(rsi_diario, ctx['pocos_dias']):
+        logger.info(f"Descartando LONG en {symbol} - RSI Diario muy alto ({rsi_diario:.1f})")
+        return False, True # Desfavorable para LONG, ok para SHORT
+    return True, True # Favorable para ambos
+
+
+def preparar_simbolo(symbol, all_pivots, df=None, cierre_ms=None):
+    """
+    Etapa de datos de la evaluación: pivotes y ventana M15.
+    'df' permite pasar una ventana M15 ya disponible (p. ej. del stream); si es None se lee del almacén,
+    hasta la vela que cerró en 'cierre_ms' (la vela en curso no se evalúa) o hasta ahora si no se indica.
+    Retorna un dict con lo necesario para evaluar_entrada, o None si el símbolo se descarta.
+    No modifica el estado de operaciones: es seguro ejecutarla en paralelo.
+    """
+    pivot_data = all_pivots.get(symbol)
+    if not pivot_data: return None
+    pivotes = pivot_data.get('levels')
+    if not pivotes or not all(k in pivotes for k in ['R1', 'R2', 'R3', 'S1', 'PP']): return None
+
     try:
-        # --- 1. FILTRO DE HORARIO ---
-        hora_actual_utc = datetime.now(timezone.utc).hour
-        if hora_actual_utc >= 17: # 17:00 UTC
-            logger.info(f"Filtro de horario: Pausando nuevas señales para {symbol} (después de las 17:00 UTC).")
-            return False, False # Desfavorable para ambos
-
-        # --- 2. FILTRO RSI DIARIO (Top-Down) ---
-        klines_daily = client.futures_historical_klines(symbol, Client.KLINE_INTERVAL_1DAY, "30 day ago UTC", limit=30)
-        if len(klines_daily) < 20: 
-            return True, True # Favorable si no hay datos suficientes
-
-        df_daily = pd.DataFrame(klines_daily, columns=['ot','O','H','L','C','V','ct','qav','nt','tbbav','tbqav','ig'])
-        df_daily[['Close']] = df_daily[['C']].astype(float)
-        
-        # RSI diario
-        delta = df_daily['Close'].diff()
-        gain = (delta.where(delta > 0, 0)).rolling(window=14).mean()
-        loss = (-delta.where(delta < 0, 0)).rolling(window=14).mean()
-        rs = gain / loss
-        rsi_daily = 100 - (100 / (1 + rs))
-        
-        last_rsi_daily = rsi_daily.iloc[-1]
+        if df is None:
+            # Ventana M15 desde el almacén local (solo se pide a la API la cola que falta)
+            referencia_ms = cierre_ms if cierre_ms is not None else int(time.time() * 1000)
+            inicio_ms = referencia_ms - VENTANA_M15_HORAS * 3_600_000
+            fin_ms = cierre_ms - 1 if cierre_ms is not None else None
+            with metricas.cronometro('bot_simbolo_segundos', fase='datos'):
+                df = kline_store.obtener_rango(client, symbol, Client.KLINE_INTERVAL_15MINUTE, inicio_ms, fin_ms)
+        if len(df) < 201: return None
+        df.dropna(subset=['Close'], inplace=True)
+        if len(df) < 201: return None
+        return {'pivotes': pivotes, 'df': df}
+    except Exception as e:
+         logger.error(f"Error obteniendo datos para {symbol}: {e}\n{traceback.format_exc()}")
+    return None
+
+
+def evaluar_entrada(symbol, preparado, ind, i, entry_type=None, cierre_ms=None):
+    """
+    Reglas de entrada sobre la fila 'i' del lote de indicadores (ver calcular_indicadores_lote).
+    Si 'entry_type' llega ya filtrado por el embudo de detect_new_signals, solo se arma la señal.
+    Retorna (new_trade_data, mensaje, log_msg) si hay señal, o None.
+    """
+    pivotes = preparado['pivotes']
+    R1, R2 = pivotes['R1'], pivotes['R2']  # Zona del SHORT en el mensaje
+
+    try:
+        # --- DATOS DE LA ÚLTIMA VELA ---
+        last, prev = fila_indicadores(ind, i, -1), fila_indicadores(ind, i, -2)
+        if any(pd.isna(last[k]) for k in INDICADORES_REQUERIDOS): return None
+
+        price_last_closed = last['Close']; bb_upper_actual = last['BB_upper']; adx_actual = last['ADX']
+        rsi_actual = last['RSI']; macd_hist_actual = last['MACD_hist']; ema8_below_24 = last['EMA8'] < last['EMA24']
+        efficiency_ratio_actual = last['Efficiency_Ratio']
         
-        # No operar LONG si RSI diario > 75 (sobrecompra extrema)
-        if last_rsi_daily > 75:
-            logger.info(f"Descartando LONG en {symbol} - RSI Diario muy alto ({last_rsi_daily:.1f})")
-            return False, True # Desfavorable para LONG, ok para SHORT
+        # Calcular vol_ratio (Punto 2)
+        vol_ratio = calcular_vol_ratio(last)
+
+        # --- LÓGICA DE ENTRADA CON FILTROS ACTIVOS (compartida con el backtester, ver estrategia.py) ---
+        if entry_type is None:
+            # El filtro top-down solo se consulta si hay LONG (el cruce alcista excluye el SHORT)
+            entry_type = reglas_entrada(last, prev, pivotes, True, True)
+            if entry_type == 'LONG' and not get_market_condition(symbol, price_last_closed)[0]: entry_type = None
+            registrar_evaluacion(symbol, last, entry_type, cierre_ms)
+        entry_signal = entry_type is not None
+
+        # Si se detectó una señal válida, obtener datos adicionales y guardar
+        if entry_signal:
+            h1_aligned = get_h1_trend_alignment(symbol, entry_type)
+
+            vol_hora_ant = np.mean(ind['Volume'][i, -5:-1])
+            vol_pct_change = ((last['Volume'] - vol_hora_ant) / vol_hora_ant) * 100 if vol_hora_ant > 0 else 0
+            
+            short_zone = None # short_zone se define aquí para que exista siempre
+            if entry_type == 'SHORT':
+                if price_last_closed > R2: short_zone = "Above R2"
+                elif price_last_closed > R1: short_zone = "Above R1"
+
+            # Guardar TODOS los datos calculados, independientemente de si se usaron como filtro
+            new_trade_data = {
+                'status': 'OPEN', 'entry_price': price_last_closed,
+                'tp1_hit': False, 'tp2_hit': False, 'entry_date': datetime.now(timezone.utc).isoformat(),
+                'vol_pct_change_entry': round(vol_pct_change, 2),
+                'ema_100_context': price_last_closed > last['EMA100'],
+                'ema_200_context': price_last_closed > last['EMA200'],
+                'vol_ratio_entry': round(vol_ratio, 2),
+                'rsi_entry': round(rsi_actual, 2),
+                'macd_hist_entry': round(macd_hist_actual, 6),
+                'bb_upper_entry': round(bb_upper_actual, 4),
+                'bb_lower_entry': round(last['BB_lower'], 4) if pd.notna(last['BB_lower']) else None,
+                'adx_entry': round(adx_actual, 2),
+                'plus_di_entry': round(last['DI_plus'], 2) if pd.notna(last['DI_plus']) else None,
+                'minus_di_entry': round(last['DI_minus'], 2) if pd.notna(last['DI_minus']) else None,
+                'ema_8_below_24_entry': ema8_below_24,
+                'short_entry_zone': short_zone,
+                'efficiency_ratio_entry': round(efficiency_ratio_actual, 3),
+                'h1_trend_aligned_entry': h1_aligned,
+                'entry_type': entry_type
+            }
+
+            if entry_type == 'LONG':
+                new_trade_data.update(NIVELES_TRADE['LONG'])
+                mensaje = (f"🚀 *Compra {symbol}* | P:{price_last_closed:.4f} RSI:{rsi_actual:.1f} ADX:{adx_actual:.1f} VolR:{vol_ratio:.1f}")
+                log_msg = f"Nueva COMPRA detectada: {symbol} @ {price_last_closed:.4f}"
             
-        return True, True # Favorable para ambos
+            elif entry_type == 'SHORT':
+                new_trade_data.update(NIVELES_TRADE['SHORT'])
+                mensaje = (f"🔻 *Venta {symbol}* | P:{price_last_closed:.4f} RSI:{rsi_actual:.1f} ADX:{adx_actual:.1f} Z:{short_zone}")
+                log_msg = f"Nueva VENTA detectada: {symbol} @ {price_last_closed:.4f} (Zona: {short_zone})"
+
+            return new_trade_data, mensaje, log_msg
 
     except Exception as e:
-        logger.warning(f"Error evaluando condición de mercado para {symbol}: {e}")
-        return True, True # Ser permisivo si la API falla
+         logger.error(f"Error procesando señal para {symbol}: {e}\n{traceback.format_exc()}") # ### CAMBIO: Usar logger.error con traceback
+    return None
 
 
-def detect_new_signals(all_pivots):
-    active_trades = load_active_trades()
-    symbols_to_check = list(all_pivots.keys())
+# --- Etapas del embudo de señales (de la más barata y selectiva a la más cara, ver embudo.py) ---
+# Cada etapa recibe la lista de candidatos {'symbol', 'preparado', ...} que pasaron las anteriores.
 
-    for symbol in symbols_to_check:
-        if symbol in active_trades: continue
-        
-        ### ====================================================== ###
-        ### ### NUEVO FILTRO DE HORARIO Y TOP-DOWN (Punto 1 y 4) ### ###
-        ### ====================================================== ###
-        favorable_para_long, favorable_para_short = get_market_condition(symbol)
-        if not favorable_para_long and not favorable_para_short:
-            # Filtro de horario (17:00+ UTC) activado
-            continue # Saltar al siguiente símbolo
-        ##############################################################
-
-        pivot_data = all_pivots.get(symbol)
-        if not pivot_data: continue
-        pivotes = pivot_data.get('levels')
-        if not pivotes or not all(k in pivotes for k in ['R1', 'R2', 'R3', 'S1', 'PP']): continue
-        R1, R2, R3, S1, PP = pivotes['R1'], pivotes['R2'], pivotes['R3'], pivotes['S1'], pivotes['PP']
+def etapa_datos(symbols, all_pivots, cierre_ms, ventanas=None, lotes=None):
+    """
+    Pivotes y ventana M15 de cada símbolo (E/S). Modo paralelo: los símbolos se preparan en un pool
+    de hilos (acotado por el limitador de peso de la API) y se recogen EN ORDEN, así las altas en el
+    almacén de trades siguen serializadas y el resultado es igual al secuencial.
+    'ventanas' (symbol -> DataFrame M15) aporta ventanas ya disponibles, p. ej. las del stream, y 'lotes'
+    sus indicadores (acotan cuántas velas atrás se puede buscar el cruce, ver etapa_cruce).
+    """
+    if ventanas is not None:
+        preparados = [preparar_simbolo(symbol, all_pivots, df=ventanas[symbol]) for symbol in symbols]
+    elif SCAN_WORKERS > 1:
+        with ThreadPoolExecutor(max_workers=SCAN_WORKERS, thread_name_prefix='scan') as pool:
+            preparados = list(pool.map(preparar_simbolo, symbols, itertools.repeat(all_pivots),
+                                       itertools.repeat(None), itertools.repeat(cierre_ms)))
+    else:
+        preparados = [preparar_simbolo(symbol, all_pivots, cierre_ms=cierre_ms) for symbol in symbols]
+    candidatos = []
+    for symbol, p in zip(symbols, preparados):
+        if not p: continue
+        revisar = barras_desde_escaneo(symbol)
+        # Los indicadores incrementales solo guardan FILAS_HISTORIAL filas (la regla necesita la vela y la previa)
+        if lotes is not None: revisar = min(revisar, lotes[symbol]['Close'].shape[1] - 1)
+        candidatos.append({'symbol': symbol, 'preparado': p, 'cierre_ms': cierre_ms, 'revisar': revisar})
+    return candidatos
+
+
+def etapa_cruce(candidatos):
+    """
+    Cruce EMA rápida / lenta (lo exigen LONG y SHORT): solo dos EMAs de los cierres. Se busca en la última
+    vela o, en los símbolos latentes, en todas las velas desde su escaneo anterior ('desfase' = velas
+    desde el cruce más reciente); las reglas se evalúan sobre la vela del cruce.
+    """
+    cierres = apilar_ventanas([c['preparado']['df'] for c in candidatos], columnas=('Close',))['Close']
+    direccion, desfase = ultimo_cruce(ema_lote(cierres, PARAMETROS_DEFECTO['ema_rapida']),
+                                      ema_lote(cierres, PARAMETROS_DEFECTO['ema_lenta']),
+                                      np.array([c['revisar'] for c in candidatos]))
+    for c, d, k in zip(candidatos, direccion, desfase): c['direccion'], c['desfase'] = int(d), int(k)
+    return [c for c in candidatos if c['direccion']]
+
+
+def etapa_zona_pivotes(candidatos):
+    """
+    Precio de cierre en la zona de pivotes del cruce (LONG entre S1 y R1, SHORT entre R1 y R3), en la vela
+    del cruce y, si fue en una vela anterior, también en la última (la entrada se hace al precio actual).
+    """
+    cierre = lambda c, j: float(c['preparado']['df']['Close'].iloc[j])
+    direccion = np.array([c['direccion'] for c in candidatos])
+    R1, R3, S1 = (np.array([c['preparado']['pivotes'][k] for c in candidatos]) for k in ('R1', 'R3', 'S1'))
+    dentro = (en_zona_pivotes(direccion, np.array([cierre(c, -1 - c['desfase']) for c in candidatos]), R1, R3, S1) &
+              en_zona_pivotes(direccion, np.array([cierre(c, -1) for c in candidatos]), R1, R3, S1))
+    return [c for c, ok in zip(candidatos, dentro) if ok]
 
-        try:
-            klines_15m = client.futures_historical_klines(symbol, Client.KLINE_INTERVAL_15MINUTE, "55 hour ago UTC", limit=250)
-            if len(klines_15m) < 201: continue
-
-            df = pd.DataFrame(klines_15m, columns=['ot', 'O', 'H', 'L', 'C', 'V', 'ct', 'qav','nt','tbbav','tbqav','ig'])
-            df.rename(columns={'C': 'Close', 'V': 'Volume', 'H': 'High', 'L': 'Low'}, inplace=True)
-            df[['Close', 'Volume', 'High', 'Low']] = df[['Close', 'Volume', 'High', 'Low']].astype(float)
-            df.dropna(subset=['Close'], inplace=True)
-            if len(df) < 201: continue
-
-            # --- CÁLCULO DE INDICADORES M15 ---
-            df['EMA8'] = df['Close'].ewm(span=8, adjust=False).mean()
-            df['EMA24'] = df['Close'].ewm(span=24, adjust=False).mean()
-            df['EMA50'] = df['Close'].ewm(span=50, adjust=False).mean()
-            df['EMA100'] = df['Close'].ewm(span=100, adjust=False).mean()
-            df['EMA200'] = df['Close'].ewm(span=200, adjust=False).mean()
-            delta = df['Close'].diff(); gain = (delta.where(delta > 0, 0)).rolling(window=14).mean(); loss = (-delta.where(delta < 0, 0)).rolling(window=14).mean()
-            rs = gain / loss
-            df['RSI'] = 100 - (100 / (1 + rs.replace([np.inf, -np.inf], np.nan)))
-            
-            ### AJUSTE 3 (DATO-CRÍTICO): CORRECCIÓN ADVERTENCIA PANDAS ###
-            df['RSI'] = df['RSI'].ffill()
-            
-            df['EMA12'] = df['Close'].ewm(span=12, adjust=False).mean(); df['EMA26'] = df['Close'].ewm(span=26, adjust=False).mean()
-            macd_line = df['EMA12'] - df['EMA26']; macd_signal = macd_line.ewm(span=9, adjust=False).mean()
-            df['MACD_hist'] = macd_line - macd_signal
-            df['BB_middle'] = df['Close'].rolling(window=20).mean(); std_dev = df['Close'].rolling(window=20).std()
-            df['BB_upper'] = df['BB_middle'] + (std_dev * 2); df['BB_lower'] = df['BB_middle'] - (std_dev * 2)
-            df['Volume_MA20'] = df['Volume'].rolling(window=20).mean()
-            df = calculate_adx(df, period=14)
-            df['Efficiency_Ratio'] = df['Close'].rolling(window=EFFICIENCY_RATIO_PERIOD + 1).apply(lambda x: calculate_efficiency_ratio(pd.Series(x), EFFICIENCY_RATIO_PERIOD))
-
-            # --- DATOS DE LA ÚLTIMA VELA ---
-            if len(df) < 2: continue
-            last, prev = df.iloc[-1], df.iloc[-2]
-            required_indicators = ['ADX', 'RSI', 'MACD_hist', 'BB_upper', 'Efficiency_Ratio', 'EMA8', 'EMA24', 'EMA50', 'EMA100', 'EMA200', 'Volume_MA20']
-            if last[required_indicators].isnull().any(): continue
-
-            price_last_closed = last['Close']; bb_upper_actual = last['BB_upper']; adx_actual = last['ADX']
-            rsi_actual = last['RSI']; macd_hist_actual = last['MACD_hist']; ema8_below_24 = last['EMA8'] < last['EMA24']
-            efficiency_ratio_actual = last['Efficiency_Ratio']
-            
-            # Calcular vol_ratio (Punto 2)
-            vol_ratio = last['Volume'] / last['Volume_MA20'] if (last['Volume_MA20'] is not None and last['Volume_MA20'] > 0) else 0
-
-            cruce_alcista = (prev['EMA24'] < prev['EMA50']) and (last['EMA24'] > last['EMA50'])
-            cruce_bajista = (prev['EMA24'] > prev['EMA50']) and (last['EMA24'] < last['EMA50'])
-
-            # --- LÓGICA DE ENTRADA CON FILTROS ACTIVOS Y DATOS OBSERVACIONALES ---
-
-            entry_signal = False
-            entry_type = None
-
-            ### ======================================================= ###
-            ### ### AJUSTE: NUEVOS FILTROS LONG (Puntos 2, 3, 4)      ### ###
-            ### ======================================================= ###
-            if (favorable_para_long and cruce_alcista and 
-                (S1 < price_last_closed < R1) and macd_hist_actual > 0 and
-                (rsi_actual > 50 and rsi_actual < 67) and  # <-- Punto 3: Filtro RSI (67)
-                vol_ratio > 1.0 and                       # <-- Punto 2: Filtro Volumen
-                adx_actual > 25 and price_last_closed < bb_upper_actual):
-                
-                entry_signal = True; entry_type = 'LONG'
-
-            ### ======================================================= ###
-            ### ### AJUSTE: NUEVO FILTRO SHORT (Sugerencia EMA 200)   ### ###
-            ### ======================================================= ###
-            elif (favorable_para_short and cruce_bajista and
-                  (R1 < price_last_closed < R3) and
-                  price_last_closed < last['EMA200']): # <-- ¡NUEVO FILTRO DE CONTEXTO EMA 200!
-                
-                entry_signal = True; entry_type = 'SHORT'
-                # (Mantenemos la lógica de recolección de datos simple para SHORTS)
-
-
-            # Si se detectó una señal válida, obtener datos adicionales y guardar
-            if entry_signal:
-                h1_aligned = get_h1_trend_alignment(symbol, entry_type)
-
-                vol_hora_ant = df['Volume'].iloc[-5:-1].mean()
-                vol_pct_change = ((last['Volume'] - vol_hora_ant) / vol_hora_ant) * 100 if vol_hora_ant > 0 else 0
-                
-                short_zone = None # short_zone se define aquí para que exista siempre
-                if entry_type == 'SHORT':
-                    if price_last_closed > R2: short_zone = "Above R2"
-                    elif price_last_closed > R1: short_zone = "Above R1"
-
-                # Guardar TODOS los datos calculados, independientemente de si se usaron como filtro
-                new_trade_data = {
-                    'status': 'OPEN', 'entry_price': price_last_closed,
-                    'tp1_hit': False, 'tp2_hit': False, 'entry_date': datetime.now(timezone.utc).isoformat(),
-                    'vol_pct_change_entry': round(vol_pct_change, 2),
-                    'ema_100_context': price_last_closed > last['EMA100'],
-                    'ema_200_context': price_last_closed > last['EMA200'],
-                    'vol_ratio_entry': round(vol_ratio, 2),
-                    'rsi_entry': round(rsi_actual, 2),
-                    'macd_hist_entry': round(macd_hist_actual, 6),
-                    'bb_upper_entry': round(bb_upper_actual, 4),
-                    'bb_lower_entry': round(last['BB_lower'], 4) if pd.notna(last['BB_lower']) else None,
-                    'adx_entry': round(adx_actual, 2),
-                    'plus_di_entry': round(last['DI_plus'], 2) if pd.notna(last['DI_plus']) else None,
-                    'minus_di_entry': round(last['DI_minus'], 2) if pd.notna(last['DI_minus']) else None,
-                    'ema_8_below_24_entry': ema8_below_24,
-                    'short_entry_zone': short_zone,
-                    'efficiency_ratio_entry': round(efficiency_ratio_actual, 3),
-                    'h1_trend_aligned_entry': h1_aligned,
-                    'entry_type': entry_type
-                }
-
-                if entry_type == 'LONG':
-                    new_trade_data.update({'tp1_key': 'R1', 'tp2_key': 'R2', 'sl_key': 'S1'})
-                    mensaje = (f"🚀 *Compra {symbol}* | P:{price_last_closed:.4f} RSI:{rsi_actual:.1f} ADX:{adx_actual:.1f} VolR:{vol_ratio:.1f}")
-                    log_msg = f"Nueva COMPRA detectada: {symbol} @ {price_last_closed:.4f}"
-                
-                elif entry_type == 'SHORT':
-                    new_trade_data.update({'tp1_key': 'PP', 'tp2_key': 'S1', 'sl_key': 'R2'})
-                    mensaje = (f"🔻 *Venta {symbol}* | P:{price_last_closed:.4f} RSI:{rsi_actual:.1f} ADX:{adx_actual:.1f} Z:{short_zone}")
-                    log_msg = f"Nueva VENTA detectada: {symbol} @ {price_last_closed:.4f} (Zona: {short_zone})"
-
-                active_trades[symbol] = new_trade_data
-                save_active_trades(active_trades)
-                enviar_telegram(mensaje)
-                logger.info(log_msg) # ### CAMBIO: Usar logger.info
 
+def etapa_indicadores(candidatos, lotes=None):
+    """
+    Set completo de indicadores M15 de los supervivientes en una sola pasada vectorizada (símbolos x barras).
+    'lotes' (symbol -> lote de 1 símbolo) aporta indicadores ya calculados, p. ej. los incrementales del stream.
+    """
+    if lotes is None:
+        m = apilar_ventanas([c['preparado']['df'] for c in candidatos])
+        ind = calcular_indicadores_lote(m['High'], m['Low'], m['Close'], m['Volume'])
+        for i, c in enumerate(candidatos): c['ind'], c['i'] = ind, i
+    else:
+        for c in candidatos: c['ind'], c['i'] = lotes[c['symbol']], 0
+    return [c for c in candidatos if not any(np.isnan(c['ind'][k][c['i'], j]) for k in INDICADORES_REQUERIDOS
+                                             for j in {-1, -1 - c['desfase']})]
+
+
+def etapa_reglas(candidatos):
+    """Umbrales de RSI, MACD, volumen, ADX, Bollinger y EMA de tendencia (reglas_entrada sin el filtro diario)."""
+    for c in candidatos:
+        try:
+            # Vela del cruce (la última salvo en los latentes que lo tuvieron en una vela saltada)
+            j = -1 - c['desfase']
+            last, prev = fila_indicadores(c['ind'], c['i'], j), fila_indicadores(c['ind'], c['i'], j - 1)
+            c['entry_type'] = reglas_entrada(last, prev, c['preparado']['pivotes'], True, True)
+            cierre_ms = c['cierre_ms'] - c['desfase'] * INTERVALO_MONITOREO_SEG * 1000 if c['cierre_ms'] is not None else None
+            registrar_evaluacion(c['symbol'], last, c['entry_type'], cierre_ms)
         except Exception as e:
-             logger.error(f"Error procesando señal para {symbol}: {e}\n{traceback.format_exc()}") # ### CAMBIO: Usar logger.error con traceback
+            logger.error(f"Error aplicando reglas de entrada a {c['symbol']}: {e}")
+            c['entry_type'] = None
+    return [c for c in candidatos if c['entry_type']]
+
+
+def etapa_contexto_diario(candidatos):
+    """Filtro top-down (RSI diario) de los LONG; el cruce alcista excluye el SHORT, así que filtrar al final es equivalente."""
+    return [c for c in candidatos if c['entry_type'] != 'LONG' or
+            get_market_condition(c['symbol'], float(c['ind']['Close'][c['i'], -1]))[0]]
+
+
+def embudo_senales(all_pivots, cierre_ms, ventanas=None, lotes=None):
+    """
+    Embudo de señales común a los modos REST y stream: las mismas etapas alimentan las mismas métricas
+    de descartes y el mismo diario ('senal_evaluada' antes del filtro diario). Ver etapa_datos y
+    etapa_indicadores para 'ventanas' y 'lotes'.
+    """
+    return EmbudoFiltros([('datos', lambda symbols: etapa_datos(symbols, all_pivots, cierre_ms, ventanas, lotes)),
+                          ('cruce', etapa_cruce), ('zona_pivotes', etapa_zona_pivotes),
+                          ('indicadores', lambda candidatos: etapa_indicadores(candidatos, lotes)),
+                          ('reglas', etapa_reglas), ('contexto_diario', etapa_contexto_diario)], metricas)
+
+
+def abrir_senales(candidatos, cierre_ms):
+    """Arma la señal de cada superviviente del embudo y la da de alta en las cuentas. Devuelve cuántas se abrieron."""
+    senales = 0
+    for c in candidatos:
+        symbol = c['symbol']
+        with metricas.cronometro('bot_simbolo_segundos', fase='senal'):
+            resultado = evaluar_entrada(symbol, c['preparado'], c['ind'], c['i'], c['entry_type'])
+        if not resultado: continue
+        new_trade_data, mensaje, log_msg = resultado
+        if not abrir_en_cuentas(symbol, new_trade_data, mensaje, cierre_ms): continue
+        logger.info(log_msg) # ### CAMBIO: Usar logger.info
+        latencias.registrar('senal', cierre_ms, symbol)
+        senales += 1
+    metricas.incrementar('bot_senales_total', senales)
+    return senales
+
+
+def detect_new_signals(all_pivots, cierre_ms=None):
+    """
+    Escanea el universo sobre la vela cerrada en 'cierre_ms' y da de alta las señales en cada cuenta.
+    Solo se saltan los símbolos abiertos en todas las cuentas; la evaluación se hace una vez para todas.
+    """
+    # Filtro de horario (Punto 1): fuera de horario no se escanea el universo
+    if not horario_operativo(datetime.now(timezone.utc).hour):
+        logger.info(f"Filtro de horario: sin nuevas señales después de las {PARAMETROS_DEFECTO['hora_corte_utc']}:00 UTC.")
+        diario_eventos.registrar('ciclo', cierre_ms=cierre_ms, horario_operativo=False)
+        return
+    t0 = time.perf_counter()
+    active_trades = simbolos_abiertos_en_todas()
+    # Solo los símbolos del universo a los que les toca esta vela según su nivel (ver universo.py)
+    symbols_to_check = [s for s in all_pivots.keys() if s not in active_trades and debe_escanear(s, cierre_ms)]
+    metricas.fijar('bot_simbolos_escaneados', len(symbols_to_check))
+
+    # Embudo perezoso: indicadores y consultas de contexto solo para los que pasan los filtros baratos
+    embudo = embudo_senales(all_pivots, cierre_ms)
+    candidatos = embudo.ejecutar(symbols_to_check)
+    logger.info(f"Embudo de señales: {embudo.resumen()}")
+
+    senales = abrir_senales(candidatos, cierre_ms)
+    metricas.fijar('bot_senales_ultimo_ciclo', senales)
+    diario_eventos.registrar('ciclo', cierre_ms=cierre_ms, horario_operativo=True, escaneados=len(symbols_to_check),
+                             senales=senales, segundos=round(time.perf_counter() - t0, 3),
+                             embudo=[{'etapa': nombre, 'entran': entran, 'pasan': pasan, 'segundos': round(segundos, 4)}
+                                     for nombre, entran, pasan, segundos in embudo.ultimo])
 
 # ==============================================================================
 # 6. 🔄 BUCLE PRINCIPAL
 # ==============================================================================
 
+def cargar_pivotes():
+    """Pivotes del día desde la tabla en memoria; solo se recalculan al cambiar la fecha UTC ({} si fallan)."""
+    with pivotes_lock:
+        pivots_ok = verificar_y_actualizar_pivotes()
+        if not pivots_ok:
+            logger.warning("Fallo en la actualización de Pivotes. Reintentando en el próximo ciclo...") # ### CAMBIO: Usar logger.warning
+            return {}
+        return tabla_diaria['pivots']
+
+
 def iniciar_monitoreo():
+    """
+    Modo REST: un ciclo por vela M15, RETARDO_CIERRE_SEG después de su cierre según la
+    hora del servidor. Primero se chequean los trades abiertos y después se buscan señales
+    sobre la vela recién cerrada. Un ciclo que se alarga no desplaza a los siguientes:
+    se salta a la última vela cerrada (ver PlanificadorVelas).
+    """
     logger.info("--- INICIANDO MONITOREO ---") # ### CAMBIO: Usar logger.info
+    reloj_servidor.sincronizar()
+    planificador = PlanificadorVelas(INTERVALO_MONITOREO_SEG * 1000, RETARDO_CIERRE_SEG, reloj_servidor)
+    iniciar_monitor_salidas(actualizar_precios=True)
     while True:
+        saltados = planificador.ciclos_saltados
+        cierre_ms = planificador.esperar_siguiente()
+        metricas.incrementar('bot_ciclos_saltados_total', planificador.ciclos_saltados - saltados)
         tiempo_inicio = time.time()
-        logger.info(f"--- Iniciando nuevo ciclo de monitoreo ({datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC')}) ---") # ### CAMBIO: Usar logger.info
+        cierre_str = datetime.fromtimestamp(cierre_ms / 1000, timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC')
+        logger.info(f"--- Iniciando ciclo de monitoreo (cierre de vela {cierre_str}) ---") # ### CAMBIO: Usar logger.info
 
-        pivots_ok = verificar_y_actualizar_pivotes()
-
-        if not pivots_ok:
-            logger.warning("Fallo en la actualización de Pivotes. Reintentando en el próximo ciclo...") # ### CAMBIO: Usar logger.warning
-            all_pivots = {}
-        else:
-            try:
-                if os.path.exists(PIVOTS_FILE) and os.path.getsize(PIVOTS_FILE) > 0:
-                    with open(PIVOTS_FILE, 'r') as f:
-                        try: all_pivots = json.load(f)
-                        except json.JSONDecodeError:
-                             logger.warning(f"Error al decodificar {PIVOTS_FILE}. Usando pivotes vacíos.") # ### CAMBIO: Usar logger.warning
-                             all_pivots = {}
-                else:
-                    logger.warning(f"Archivo {PIVOTS_FILE} no encontrado o vacío después de verificar. Usando pivotes vacíos.") # ### CAMBIO: Usar logger.warning
-                    all_pivots = {}
-            except Exception as e:
-                 logger.error(f"Error cargando pivotes: {e}. Usando pivotes vacíos.") # ### CAMBIO: Usar logger.error
-                 all_pivots = {}
+        with metricas.cronometro('bot_etapa_segundos', etapa='universo'):
+            refrescar_universo()
+        with metricas.cronometro('bot_etapa_segundos', etapa='pivotes'):
+            all_pivots = cargar_pivotes()
 
         if all_pivots:
-            logger.info("Buscando señales y chequeando trades activos...") # ### CAMBIO: Usar logger.info
+            logger.info("Chequeando trades activos y buscando señales...") # ### CAMBIO: Usar logger.info
             try:
-                check_active_trades(all_pivots)
-                detect_new_signals(all_pivots)
+                with trades_lock, metricas.cronometro('bot_etapa_segundos', etapa='check_active_trades'):
+                    check_active_trades(all_pivots, cierre_ms=cierre_ms)
+                with metricas.cronometro('bot_etapa_segundos', etapa='detect_new_signals'):
+                    detect_new_signals(all_pivots, cierre_ms=cierre_ms)
                 logger.info("Búsqueda/Chequeo completado.") # ### CAMBIO: Usar logger.info
             except Exception as e:
                  logger.error(f"Error durante búsqueda/chequeo: {e}\n{traceback.format_exc()}") # ### CAMBIO: Usar logger.error con traceback
         else:
             logger.warning("No hay pivotes cargados para buscar señales.") # ### CAMBIO: Usar logger.warning
 
-
         duracion = time.time() - tiempo_inicio
-        tiempo_espera = INTERVALO_MONITOREO_SEG - duracion
-
+        metricas.observar('bot_ciclo_segundos', duracion)
+        metricas.volcar_json(METRICAS_JSON_FILE)
         logger.info(f"Ciclo completado en {duracion:.1f} segundos.") # ### CAMBIO: Usar logger.info
-        if tiempo_espera > 0:
-            logger.info(f"Esperando {int(tiempo_espera)} segundos hasta el próximo ciclo...") # ### CAMBIO: Usar logger.info
-            time.sleep(max(0, tiempo_espera))
-        else:
+        if duracion > INTERVALO_MONITOREO_SEG:
             logger.warning("El ciclo tardó más de 15 minutos.") # ### CAMBIO: Usar logger.warning
 
+
+def _velas_cerradas_rest(symbol, desde_ms, hasta_ms=None):
+    """Velas M15 cerradas (array DTYPE_VELA) desde el almacén local, completando por REST lo que falte."""
+    kline_store.sincronizar(client, symbol, Client.KLINE_INTERVAL_15MINUTE, desde_ms, hasta_ms)
+    velas = kline_store.leer_velas(symbol, Client.KLINE_INTERVAL_15MINUTE, desde_ms, hasta_ms)
+    return velas[velas['close_time'] < int(time.time() * 1000)]
+
+
+def iniciar_monitoreo_stream():
+    """
+    Modo streaming: se suscribe a los klines M15 de todos los símbolos de SYMBOLS_FILE
+    (y de los que tienen un trade abierto) y evalúa cada símbolo en cuanto cierra su vela
+    (x: true), en lugar de esperar al siguiente ciclo de polling. Con la primera vela
+    cerrada de cada periodo se re-escanea el universo si toca (suscribiendo las altas y
+    dando de baja las salidas), se actualizan pivotes y se chequean los trades activos.
+    Los indicadores se mantienen incrementalmente (O(1) por vela) y se vuelcan a
+    INDICADORES_SNAPSHOT_FILE para continuar sin recalentar tras un reinicio.
+    """
+    logger.info("--- INICIANDO MONITOREO (STREAM) ---")
+    symbols = simbolos_stream()
+    estado = {'pivots': cargar_pivotes(), 'ultima_barra': None}
+    ciclo_lock = threading.Lock()
+    estados_ind = cargar_snapshot(INDICADORES_SNAPSHOT_FILE)
+    estados_lock = threading.Lock()
+    if estados_ind: logger.info(f"Estado de indicadores restaurado para {len(estados_ind)} símbolos.")
+    ejecutor = ThreadPoolExecutor(max_workers=max(1, SCAN_WORKERS), thread_name_prefix='stream')
+
+    def procesar_cierre(symbol, ventana):
+        try:
+            kline_store.guardar_klines(symbol, Client.KLINE_INTERVAL_15MINUTE, [ventana.iloc[-1].tolist()])
+            open_time = int(ventana['open_time'].iloc[-1])
+            cierre_ms = open_time + INTERVALO_MONITOREO_SEG * 1000
+            with ciclo_lock:
+                if estado['ultima_barra'] != open_time:
+                    estado['ultima_barra'] = open_time
+                    with estados_lock: guardar_snapshot(estados_ind, INDICADORES_SNAPSHOT_FILE)
+                    metricas.volcar_json(METRICAS_JSON_FILE)
+                    with metricas.cronometro('bot_etapa_segundos', etapa='universo'):
+                        if refrescar_universo() is not None: actualizar_suscripciones()
+                    with metricas.cronometro('bot_etapa_segundos', etapa='pivotes'):
+                        estado['pivots'] = cargar_pivotes()
+                    if estado['pivots']:
+                        with trades_lock, metricas.cronometro('bot_etapa_segundos', etapa='check_active_trades'):
+                            check_active_trades(estado['pivots'], actualizar_precios=False, cierre_ms=cierre_ms)
+            all_pivots = estado['pivots']
+            if not all_pivots: return
+            with estados_lock:
+                estado_ind = estados_ind.setdefault(symbol, EstadoIndicadoresM15())
+                estado_ind.actualizar_velas(ventana.itertuples(index=False, name=None))
+                ind = estado_ind.como_lote()
+            if not horario_operativo(datetime.now(timezone.utc).hour): return
+            if all(c.trade_store.esta_abierto(symbol) for c in cuentas) or not debe_escanear(symbol, cierre_ms): return
+            # El mismo embudo que detect_new_signals, con la ventana del stream y los indicadores incrementales
+            embudo = embudo_senales(all_pivots, cierre_ms, ventanas={symbol: ventana}, lotes={symbol: ind})
+            abrir_senales(embudo.ejecutar([symbol]), cierre_ms)
+        except Exception as e:
+            logger.error(f"Error procesando cierre de vela para {symbol}: {e}\n{traceback.format_exc()}")
+
+    stream = StreamKlines(symbols, on_cierre=lambda symbol, ventana: ejecutor.submit(procesar_cierre, symbol, ventana),
+                          interval=Client.KLINE_INTERVAL_15MINUTE, url_base=BINANCE_WS_URL,
+                          backfill=_velas_cerradas_rest, on_actualizacion=instantanea_precios.registrar_vela)
+
+    # Precarga de la ventana de cada símbolo (desde el almacén; por REST solo la cola que falte)
+    def precargar(symbol):
+        inicio_ms = int((datetime.now(timezone.utc) - pd.Timedelta(hours=VENTANA_M15_HORAS)).timestamp() * 1000)
+        try: return _velas_cerradas_rest(symbol, inicio_ms)
+        except Exception as e:
+            logger.warning(f"Error precargando velas de {symbol}: {e}")
+            return []
+    paso_ms = 15 * 60 * 1000
+    def preparar_estado(symbol, velas):
+        with estados_lock:
+            # El snapshot solo sirve si enlaza con las velas disponibles; si no, se recalienta desde la ventana
+            estado_ind = estados_ind.get(symbol)
+            if estado_ind is None or estado_ind.ultimo_open_time is None or \
+               (len(velas) and estado_ind.ultimo_open_time < velas[0][0] - paso_ms):
+                estado_ind = estados_ind[symbol] = EstadoIndicadoresM15()
+            estado_ind.actualizar_velas(velas)
+
+    def actualizar_suscripciones():
+        """Tras re-escanear el universo: precarga y suscribe las altas y da de baja las salidas (sin trade abierto)."""
+        deseados = simbolos_stream()
+        # La ventana de las altas se precarga antes de suscribirlas: así la primera vela del stream enlaza con ella.
+        # La carga en el stream la hace actualizar_simbolos en el hilo del bucle (este es un hilo del ejecutor)
+        historial = {symbol: precargar(symbol) for symbol in deseados if symbol not in stream.symbols}
+        for symbol, velas in historial.items(): preparar_estado(symbol, velas)
+        altas, bajas = stream.actualizar_simbolos(deseados, historial)
+        with estados_lock:
+            for symbol in bajas: estados_ind.pop(symbol, None)
+        if altas or bajas: logger.info(f"Stream: +{len(altas)} / -{len(bajas)} símbolos tras re-escanear el universo.")
+
+    for symbol, velas in zip(symbols, ejecutor.map(precargar, symbols)):
+        stream.cargar_historial(symbol, velas)
+        preparar_estado(symbol, velas)
+    logger.info(f"Ventanas M15 precargadas para {len(symbols)} símbolos. Conectando al stream...")
+    # Las actualizaciones intravela del stream ya alimentan la instantánea de precios
+    iniciar_monitor_salidas(actualizar_precios=False)
+
+    try:
+        asyncio.run(stream.ejecutar())
+    finally:
+        ejecutor.shutdown(wait=True)
+        guardar_snapshot(estados_ind, INDICADORES_SNAPSHOT_FILE)
+
 if __name__ == '__main__':
+    if METRICAS_PUERTO:
+        try: ServidorMetricas(metricas, puerto=int(METRICAS_PUERTO)).iniciar()
+        except (OSError, ValueError) as e: logger.warning(f"No se pudo iniciar el servidor de métricas: {e}")
     try:
-        iniciar_monitoreo()
+        if MODO_INGESTA == 'stream': iniciar_monitoreo_stream()
+        else: iniciar_monitoreo()
     except KeyboardInterrupt:
         logger.info("Monitoreo detenido por el usuario (Ctrl+C).") # ### CAMBIO: Usar logger.info
     except Exception as e:
         logger.critical(f"ERROR FATAL en el bucle principal: {e}\n{traceback.format_exc()}") # ### CAMBIO: Usar logger.critical con traceback
         enviar_telegram(f"💥 BOT DETENIDO: Error fatal - {e}")
+    finally:
+        # Entrega lo encolado; lo que no salga queda en TELEGRAM_PENDIENTES_FILE para el próximo arranque
+        for despachador in {id(c.despachador): c.despachador for c in cuentas}.values(): despachador.detener()
+        diario_eventos.cerrar()
@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+"""
+Despachador de notificaciones de Telegram en segundo plano.
+
+enviar() solo encola el mensaje: el escaneo no espera a la API de Telegram.
+Un hilo propio agrupa los mensajes que llegan casi a la vez (las alertas de
+TP/SL/entrada de un mismo ciclo salen en un único mensaje), los envía con una
+sesión HTTP persistente (keep-alive), respeta el 'retry_after' de los 429 y
+reintenta los fallos de red con espera creciente. Lo que no se pudo entregar
+se guarda en TELEGRAM_PENDIENTES_FILE y el propio hilo lo vuelve a intentar
+pasado un tiempo (que se duplica mientras sigan fallando), además de al arrancar.
+
+La URL base es configurable (TELEGRAM_API_URL) para probar contra un servidor
+HTTP local (verificar_despachador: python notificaciones.py).
+"""
+import json
+import os
+import queue
+import tempfile
+import threading
+import time
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_API_URL = 'https://api.telegram.org'
+TELEGRAM_PENDIENTES_FILE = 'telegram_pendientes.json'
+MAX_CARACTERES_MENSAJE = 4096  # Límite de Telegram por mensaje
+SEPARADOR_MENSAJES = "\n\n"
+REINTENTO_PENDIENTES_MAX_SEG = 900  # Tope de la espera entre reintentos de los pendientes guardados
+
+
+def agrupar_mensajes(mensajes, max_caracteres=MAX_CARACTERES_MENSAJE):
+    """Une mensajes consecutivos en bloques de como mucho 'max_caracteres' (un mensaje largo se corta)."""
+    bloques, actual = [], ""
+    for mensaje in mensajes:
+        while len(mensaje) > max_caracteres:
+            if actual: bloques.append(actual); actual = ""
+            bloques.append(mensaje[:max_caracteres]); mensaje = mensaje[max_caracteres:]
+        if not mensaje: continue
+        if actual and len(actual) + len(SEPARADOR_MENSAJES) + len(mensaje) > max_caracteres:
+            bloques.append(actual); actual = ""
+        actual = f"{actual}{SEPARADOR_MENSAJES}{mensaje}" if actual else mensaje
+    if actual: bloques.append(actual)
+    return bloques
+
+
+class DespachadorTelegram:
+    """Cola acotada de mensajes + hilo de envío con agrupado, reintentos y persistencia de pendientes."""
+
+    def __init__(self, token, chat_id, url_base=TELEGRAM_API_URL, archivo_pendientes=TELEGRAM_PENDIENTES_FILE,
+                 max_cola=1000, ventana_agrupado=2.0, intervalo_min=1.0, max_intentos=5, timeout=10, metricas=None,
+                 reintento_pendientes=60.0):
+        self.token, self.chat_id = token, chat_id
+        self.url = f"{url_base.rstrip('/')}/bot{token}/sendMessage"
+        self.archivo_pendientes = archivo_pendientes
+        self.ventana_agrupado = ventana_agrupado  # Segundos que se esperan más mensajes antes de enviar
+        self.intervalo_min = intervalo_min        # Pausa mínima entre envíos al mismo chat
+        self.max_intentos, self.timeout = max_intentos, timeout
+        self.reintento_pendientes = reintento_pendientes  # Espera inicial antes de reintentar los pendientes guardados
+        self._espera_pendientes = reintento_pendientes
+        self._proximo_reintento = time.monotonic() + reintento_pendientes
+        self._cola = queue.Queue(maxsize=max_cola)
+        self._lock = threading.Lock()
+        self._hilo = None
+        self._parar = threading.Event()
+        self._en_curso = []  # Mensajes sacados de la cola y aún no entregados
+        self._ultimo_envio = 0.0
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self.session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self.enviados = self.fallidos = 0
+        self.metricas = metricas  # RegistroMetricas opcional (duración de envíos, resultados, tamaño de la cola)
+
+    @property
+    def configurado(self):
+        return bool(self.token and self.chat_id)
+
+    # --------------------------------------------------------------------------
+    # API pública
+    # --------------------------------------------------------------------------
+
+    def iniciar(self):
+        """Arranca el hilo de envío (una sola vez) reencolando antes los pendientes guardados."""
+        with self._lock:
+            if self._hilo is not None or not self.configurado: return
+            for mensaje in self._cargar_pendientes(): self._encolar(mensaje)
+            self._parar.clear()
+            self._hilo = threading.Thread(target=self._bucle, name='telegram', daemon=True)
+            self._hilo.start()
+
+    def enviar(self, mensaje):
+        """Encola el mensaje y retorna de inmediato (sin token/chat no hace nada)."""
+        if not self.configurado or not mensaje: return
+        if self._hilo is None: self.iniciar()
+        self._encolar(mensaje)
+
+    def vaciar(self, timeout=30):
+        """Espera (como mucho 'timeout' s) a que la cola y el envío en curso terminen. Devuelve True si quedó vacía."""
+        limite = time.monotonic() + timeout
+        while time.monotonic() < limite:
+            with self._lock:
+                if self._cola.empty() and not self._en_curso: return True
+            time.sleep(0.05)
+        return False
+
+    def detener(self, timeout=10):
+        """Intenta entregar lo encolado y guarda en disco lo que quede pendiente."""
+        if self._hilo is None: return
+        self.vaciar(timeout)
+        self._parar.set()
+        self._hilo.join(timeout=self.timeout + 1)
+        # Si el hilo terminó, él mismo guardó lo que tenía en curso
+        en_curso = self._hilo.is_alive()
+        self._hilo = None
+        with self._lock:
+            pendientes = (list(self._en_curso) if en_curso else []) + self._sacar_todo()
+            self._en_curso = []
+        self._guardar_pendientes(pendientes)
+        self.session.close()
+
+    # --------------------------------------------------------------------------
+    # Cola y persistencia
+    # --------------------------------------------------------------------------
+
+    def _contar(self, resultado):
+        if self.metricas: self.metricas.incrementar('telegram_mensajes_total', resultado=resultado)
+
+    def _encolar(self, mensaje):
+        try: self._cola.put_nowait(mensaje)
+        except queue.Full:
+            # Cola llena (Telegram caído mucho tiempo): se descarta el más antiguo, no el nuevo
+            try: descartado = self._cola.get_nowait()
+            except queue.Empty: descartado = None
+            if descartado is not None: logger.warning(f"Cola de Telegram llena: descartado '{descartado[:60]}'")
+            self._cola.put_nowait(mensaje)
+        if self.metricas: self.metricas.fijar('telegram_cola', self._cola.qsize())
+
+    def _sacar_todo(self):
+        mensajes = []
+        while True:
+            try: mensajes.append(self._cola.get_nowait())
+            except queue.Empty: return mensajes
+
+    def _cargar_pendientes(self):
+        if not self.archivo_pendientes or not os.path.exists(self.archivo_pendientes): return []
+        try:
+            with open(self.archivo_pendientes, 'r') as f: pendientes = json.load(f)
+            os.remove(self.archivo_pendientes)
+        except (json.JSONDecodeError, OSError) as e:
+            logger.warning(f"No se pudieron leer los mensajes pendientes de {self.archivo_pendientes}: {e}")
+            return []
+        if pendientes: logger.info(f"Reenviando {len(pendientes)} mensajes de Telegram pendientes.")
+        return pendientes
+
+    def _guardar_pendientes(self, mensajes):
+        if not self.archivo_pendientes or not mensajes: return
+        try:
+            previos = []
+            if os.path.exists(self.archivo_pendientes):
+                with open(self.archivo_pendientes, 'r') as f: previos = json.load(f)
+            temp_file = self.archivo_pendientes + ".tmp"
+            with open(temp_file, 'w') as f: json.dump(previos + mensajes, f, indent=1, ensure_ascii=False)
+            os.replace(temp_file, self.archivo_pendientes)
+            logger.warning(f"{len(mensajes)} mensajes de Telegram guardados en {self.archivo_pendientes}")
+        except (json.JSONDecodeError, OSError) as e:
+            logger.error(f"Error guardando mensajes pendientes de Telegram: {e}")
+
+    # --------------------------------------------------------------------------
+    # Hilo de envío
+    # --------------------------------------------------------------------------
+
+    def _reintentar_pendientes(self):
+        """Reencola los mensajes guardados en disco cuando vence la espera (ver _bucle)."""
+        if time.monotonic() < self._proximo_reintento: return
+        self._proximo_reintento = time.monotonic() + self._espera_pendientes
+        for mensaje in self._cargar_pendientes(): self._encolar(mensaje)
+
+    def _bucle(self):
+        while not self._parar.is_set():
+            self._reintentar_pendientes()
+            try: primero = self._cola.get(timeout=0.5)
+            except queue.Empty: continue
+            with self._lock: self._en_curso = [primero]
+            # Agrupado: se recogen los mensajes que lleguen durante la ventana
+            limite = time.monotonic() + self.ventana_agrupado
+            while True:
+                restante = limite - time.monotonic()
+                if restante <= 0: break
+                try: mensaje = self._cola.get(timeout=restante)
+                except queue.Empty: break
+                with self._lock: self._en_curso.append(mensaje)
+            for bloque in agrupar_mensajes(list(self._en_curso)):
+                # Al detenerse ya no se reintenta: lo no entregado queda en disco
+                if not self._entregar(bloque, intentos=1 if self._parar.is_set() else None):
+                    self.fallidos += 1
+                    self._guardar_pendientes([bloque])
+                    # Telegram sigue fallando: los pendientes esperan el doble antes del siguiente intento
+                    self._espera_pendientes = min(self._espera_pendientes * 2, REINTENTO_PENDIENTES_MAX_SEG)
+                    self._proximo_reintento = time.monotonic() + self._espera_pendientes
+                else: self._espera_pendientes = self.reintento_pendientes
+            with self._lock: self._en_curso = []
+
+    def _entregar(self, texto, intentos=None):
+        """POST sendMessage con reintentos. Devuelve True si Telegram lo aceptó (o lo rechazó sin remedio)."""
+        payload = {'chat_id': self.chat_id, 'text': texto, 'parse_mode': 'Markdown'}
+        intentos = intentos or self.max_intentos
+        espera = 1.0
+        for intento in range(1, intentos + 1):
+            pausa = self.intervalo_min - (time.monotonic() - self._ultimo_envio)
+            if pausa > 0: time.sleep(pausa)
+            try:
+                t0 = time.perf_counter()
+                try: respuesta = self.session.post(self.url, data=payload, timeout=self.timeout)
+                finally:
+                    if self.metricas: self.metricas.observar('telegram_envio_segundos', time.perf_counter() - t0)
+                self._ultimo_envio = time.monotonic()
+                if respuesta.status_code == 200:
+                    self.enviados += 1
+                    self._contar('enviado')
+                    if self.metricas: self.metricas.fijar('telegram_cola', self._cola.qsize())
+                    return True
+                self._contar(str(respuesta.status_code))
+                if respuesta.status_code == 429:
+                    # Límite de Telegram: esperar lo que indique 'retry_after'
+                    try: espera_429 = float(respuesta.json().get('parameters', {}).get('retry_after', espera))
+                    except ValueError: espera_429 = espera
+                    logger.warning(f"Telegram 429: reintentando en {espera_429:g}s")
+                    if self._parar.wait(espera_429): return False
+                    continue
+                if respuesta.status_code == 400 and 'parse_mode' in payload:
+                    # Markdown inválido (p. ej. un '_' suelto): se reenvía como texto plano
+                    payload.pop('parse_mode')
+                    continue
+                if 400 <= respuesta.status_code < 500:
+                    logger.error(f"Telegram rechazó el mensaje ({respuesta.status_code}): {respuesta.text[:200]}")
+                    return True
+                logger.warning(f"Error de Telegram {respuesta.status_code} (intento {intento}/{intentos})")
+            except requests.RequestException as e:
+                self._contar('error_red')
+                logger.warning(f"Error al enviar mensaje a Telegram (intento {intento}/{intentos}): {e}")
+            if intento < intentos and self._parar.wait(espera): return False
+            espera = min(espera * 2, 60)
+        return False
+
+
+# ==============================================================================
+# VERIFICACIÓN CONTRA UN SERVIDOR HTTP LOCAL
+# ==============================================================================
+
+def verificar_despachador(timeout=15):
+    """
+    DespachadorTelegram contra un servidor HTTP local que imita sendMessage: espera del 'retry_after'
+    de un 429, reenvío como texto plano tras un 400 de Markdown, reintento en caliente de los mensajes
+    guardados en disco y descarte del más antiguo con la cola llena.
+    """
+    respuestas, recibidos = [], []
+
+    class Manejador(BaseHTTPRequestHandler):
+        def do_POST(self):
+            datos = parse_qs(self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8'))
+            recibidos.append({k: v[0] for k, v in datos.items()})
+            estado, cuerpo = respuestas.pop(0) if respuestas else (200, {'ok': True})
+            self.send_response(estado)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps(cuerpo).encode('utf-8'))
+
+        def log_message(self, *args): pass
+
+    def esperar(condicion, que):
+        limite = time.monotonic() + timeout
+        while not condicion():
+            if time.monotonic() > limite: raise AssertionError(f"Tiempo agotado esperando {que}")
+            time.sleep(0.02)
+
+    servidor = ThreadingHTTPServer(('127.0.0.1', 0), Manejador)
+    threading.Thread(target=servidor.serve_forever, name='telegram_local', daemon=True).start()
+    with tempfile.TemporaryDirectory() as directorio:
+        pendientes = os.path.join(directorio, 'pendientes.json')
+        despachador = DespachadorTelegram('TOKEN', '1', url_base=f"http://127.0.0.1:{servidor.server_address[1]}",
+                                          archivo_pendientes=pendientes, ventana_agrupado=0, intervalo_min=0,
+                                          max_intentos=2, timeout=2, reintento_pendientes=0.2)
+        try:
+            # 429: se espera 'retry_after' y se reintenta el mismo mensaje
+            respuestas[:] = [(429, {'ok': False, 'parameters': {'retry_after': 0.3}})]
+            t0 = time.monotonic()
+            despachador.enviar('uno')
+            esperar(lambda: despachador.enviados == 1, "el envío tras el 429")
+            if time.monotonic() - t0 < 0.3 or [r['text'] for r in recibidos] != ['uno', 'uno']:
+                raise AssertionError(f"429 mal gestionado: {recibidos}")
+
+            # 400 por Markdown inválido: el reenvío va sin parse_mode
+            respuestas[:] = [(400, {'ok': False, 'description': "Bad Request: can't parse entities"})]
+            despachador.enviar('dos_')
+            esperar(lambda: despachador.enviados == 2, "el reenvío como texto plano")
+            if recibidos[-2].get('parse_mode') != 'Markdown' or 'parse_mode' in recibidos[-1] or recibidos[-1]['text'] != 'dos_':
+                raise AssertionError(f"Reenvío como texto plano incorrecto: {recibidos[-2:]}")
+
+            # Telegram caído: el mensaje va a disco y el hilo lo reintenta sin reiniciar el proceso
+            respuestas[:] = [(500, {'ok': False})] * 2
+            despachador.enviar('tres')
+            esperar(lambda: despachador.fallidos == 1, "el fallo del envío")
+            esperar(lambda: despachador.enviados == 3 and not os.path.exists(pendientes), "el reintento de los pendientes")
+            if recibidos[-1]['text'] != 'tres': raise AssertionError(f"Pendiente no reenviado: {recibidos[-1]}")
+        finally:
+            despachador.detener(timeout=2)
+            servidor.shutdown()
+            servidor.server_close()
+
+    # Cola llena: se descarta el mensaje más antiguo, no el nuevo (sin hilo de envío)
+    lleno = DespachadorTelegram('TOKEN', '1', archivo_pendientes='', max_cola=2)
+    for mensaje in ('a', 'b', 'c'): lleno._encolar(mensaje)
+    if lleno._sacar_todo() != ['b', 'c']: raise AssertionError("Con la cola llena no se descartó el más antiguo")
+    return len(recibidos)
+
+
+if __name__ == '__main__':
+    print(f"Despachador de Telegram contra servidor local OK ({verificar_despachador()} peticiones)")
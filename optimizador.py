@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+"""
+Barrido de parámetros y walk-forward de la estrategia sobre el almacén de velas M15.
+
+Evalúa rejillas de los umbrales de estrategia.PARAMETROS_DEFECTO (banda RSI,
+ADX mínimo, vol_ratio mínimo, hora de corte, RSI diario máximo y spans de las
+EMAs) con las mismas reglas que backtest.py:
+
+- Las velas de todos los símbolos se cargan una sola vez en memoria compartida
+  (multiprocessing.shared_memory); cada proceso las lee sin copiarlas y las
+  tareas solo envían índices de símbolos.
+- Cada tarea toma un lote de símbolos y recorre TODAS las combinaciones: los
+  indicadores, las EMAs extra, el contexto diario y las salidas de cada
+  entrada candidata se calculan una vez y se reutilizan entre combinaciones.
+- Los umbrales solo se aplican sobre las velas candidatas (cruce + zona),
+  que son muy pocas, así que cada combinación cuesta casi nada.
+
+Los trades se asignan a cada ventana del walk-forward por su fecha de entrada.
+
+Uso:
+    python optimizador.py --desde 2024-01-01 --rsi-min 45 50 55 --rsi-max 65 67 70 \\
+        --adx-min 20 25 30 --ema-rapida 12 24 --entrenamiento-dias 90 --prueba-dias 30
+"""
+import argparse
+import itertools
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from kline_store import KlineStore, KLINES_DB_FILE
+from indicadores import apilar_ventanas, calcular_indicadores_lote, ema_lote
+from estrategia import PARAMETROS_DEFECTO, condiciones_entrada, filtrar_entrada, columnas_ema
+from backtest import (SYMBOLS_FILE, PASO_MS, DIA_MS, BARRAS_CALENTAMIENTO, SIMBOLOS_POR_TAREA,
+                      cargar_velas, contexto_diario_base, favorables, simular_salida,
+                      seleccionar_trades, pnl_pct, _fecha_ms)
+
+BARRIDO_RESULTADOS_FILE = 'barrido_resultados.csv'
+BARRIDO_WALKFORWARD_FILE = 'barrido_walkforward.csv'
+
+# Opción de línea de comandos -> clave de PARAMETROS_DEFECTO
+OPCIONES_REJILLA = {
+    'rsi_min': float, 'rsi_max': float, 'adx_min': float, 'vol_ratio_min': float,
+    'hora_corte_utc': int, 'rsi_diario_max': float,
+    'ema_rapida': int, 'ema_lenta': int, 'ema_tendencia': int,
+}
+METRICAS = ('pnl_total', 'pnl_medio', 'factor_beneficio', 'acierto')
+COLUMNAS_DATOS = ('open_time', 'High', 'Low', 'Close', 'Volume')
+
+# Estado de cada proceso del pool (se rellena en _iniciar_proceso)
+_proceso = {}
+
+# ==============================================================================
+# 1. REJILLA
+# ==============================================================================
+
+def generar_combinaciones(rejilla):
+    """Producto cartesiano de la rejilla sobre PARAMETROS_DEFECTO; descarta bandas RSI vacías y EMAs cruzadas."""
+    claves = list(rejilla)
+    combos = []
+    for valores in itertools.product(*(rejilla[k] for k in claves)):
+        params = dict(PARAMETROS_DEFECTO, **dict(zip(claves, valores)))
+        if params['rsi_min'] >= params['rsi_max'] or params['ema_rapida'] >= params['ema_lenta']: continue
+        combos.append(params)
+    return combos
+
+# ==============================================================================
+# 2. MEMORIA COMPARTIDA
+# ==============================================================================
+
+def cargar_en_memoria_compartida(symbols, desde_ms, hasta_ms, db_path=KLINES_DB_FILE):
+    """
+    Lee las velas de todos los símbolos y las copia en un único bloque compartido (columnas x velas).
+    Retorna (SharedMemory, shape, [(symbol, inicio, fin), ...]). El llamador debe hacer close() + unlink().
+    """
+    store = KlineStore(db_path)
+    try:
+        dfs = [(s, cargar_velas(store, s, desde_ms, hasta_ms)) for s in symbols]
+    finally:
+        store.close()
+    dfs = [(s, df) for s, df in dfs if len(df) > BARRAS_CALENTAMIENTO]
+    total = sum(len(df) for _, df in dfs)
+    shape = (len(COLUMNAS_DATOS), max(total, 1))
+    shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)) * 8)
+    datos = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+    tramos, pos = [], 0
+    for symbol, df in dfs:
+        for fila, col in enumerate(COLUMNAS_DATOS):
+            datos[fila, pos:pos + len(df)] = df[col].to_numpy(dtype=np.float64)
+        tramos.append((symbol, pos, pos + len(df)))
+        pos += len(df)
+    return shm, shape, tramos
+
+
+def _iniciar_proceso(nombre_shm, shape, tramos, combos, desde_ms):
+    shm = shared_memory.SharedMemory(name=nombre_shm)
+    _proceso.update({'shm': shm, 'datos': np.ndarray(shape, dtype=np.float64, buffer=shm.buf),
+                     'tramos': tramos, 'combos': combos, 'desde_ms': desde_ms})
+
+# ==============================================================================
+# 3. EVALUACIÓN DE UN LOTE DE SÍMBOLOS PARA TODAS LAS COMBINACIONES
+# ==============================================================================
+
+def evaluar_lote(indices):
+    """
+    Evalúa todas las combinaciones sobre los símbolos 'indices' (posiciones en tramos).
+    Retorna un array (n_trades, 4): combo, entrada_ms, cierre_ms (NaN si abierto), pnl % (NaN si abierto).
+    """
+    datos, tramos, combos, desde_ms = _proceso['datos'], _proceso['tramos'], _proceso['combos'], _proceso['desde_ms']
+    series = [datos[:, tramos[k][1]:tramos[k][2]] for k in indices]
+    m = apilar_ventanas([pd.DataFrame(dict(zip(COLUMNAS_DATOS, s))) for s in series])
+    ind_lote = calcular_indicadores_lote(m['High'], m['Low'], m['Close'], m['Volume'])
+    # EMAs de la rejilla que no calcula el motor por defecto: una vez por lote para todas las combinaciones
+    for span in {int(p[k]) for p in combos for k in ('ema_rapida', 'ema_lenta', 'ema_tendencia')}:
+        if f"EMA{span}" not in ind_lote: ind_lote[f"EMA{span}"] = ema_lote(m['Close'], span)
+
+    # Las combinaciones con las mismas EMAs comparten velas candidatas y salidas
+    grupos = {}
+    for n, params in enumerate(combos): grupos.setdefault(columnas_ema(params), []).append((n, params))
+
+    filas = []
+    for fila, s in enumerate(series):
+        ot, high, low, close = s[0].astype(np.int64), s[1], s[2], s[3]
+        ind = {k: v[fila, -s.shape[1]:] for k, v in ind_lote.items()}
+        ctx = contexto_diario_base(ot, high, low, close)
+        pivotes = ctx['pivotes']
+        validas = (np.arange(len(ot)) >= BARRAS_CALENTAMIENTO) & (ot >= desde_ms)
+
+        for grupo in grupos.values():
+            cond = condiciones_entrada(ind, pivotes['R1'], pivotes['R3'], pivotes['S1'], grupo[0][1])
+            cand = np.flatnonzero((cond['largo'] | cond['corto']) & validas)
+            if not len(cand): continue
+            sub = {k: v[cand] for k, v in cond.items()}
+            salidas = {}  # (vela, tipo) -> (cierre, pnl), compartido por el grupo
+
+            def salida(i, tipo):
+                if (i, tipo) not in salidas:
+                    _, j, close_price, _ = simular_salida(tipo, i, close[i], close, pivotes, high, low)
+                    salidas[(i, tipo)] = (j, pnl_pct(tipo, close[i], close_price) if j is not None else np.nan)
+                return salidas[(i, tipo)]
+
+            for n, params in grupo:
+                fav_l, fav_s = favorables(ctx, params, cand)
+                largo, corto = filtrar_entrada(sub, fav_l, fav_s, params)
+                tipo = {i: 'LONG' if l else 'SHORT' for i, l, c in zip(cand, largo, corto) if l or c}
+                for i in seleccionar_trades(list(tipo), lambda i: salida(i, tipo[i])[0]):
+                    j, pnl = salida(i, tipo[i])
+                    filas.append((n, ot[i] + PASO_MS, ot[j] + PASO_MS if j is not None else np.nan, pnl))
+    return np.array(filas, dtype=np.float64).reshape(-1, 4)
+
+
+def ejecutar_barrido(symbols, combos, desde_ms, hasta_ms, workers=None, db_path=KLINES_DB_FILE):
+    """Evalúa todas las combinaciones en un pool de procesos. Retorna un DataFrame de trades por combinación."""
+    shm, shape, tramos = cargar_en_memoria_compartida(symbols, desde_ms, hasta_ms, db_path)
+    try:
+        lotes = [list(range(i, min(i + SIMBOLOS_POR_TAREA, len(tramos)))) for i in range(0, len(tramos), SIMBOLOS_POR_TAREA)]
+        with ProcessPoolExecutor(max_workers=workers, initializer=_iniciar_proceso,
+                                 initargs=(shm.name, shape, tramos, combos, desde_ms)) as pool:
+            partes = list(pool.map(evaluar_lote, lotes))
+    finally:
+        shm.close(); shm.unlink()
+    filas = np.concatenate(partes) if partes else np.empty((0, 4))
+    df = pd.DataFrame(filas, columns=['combo', 'entrada_ms', 'cierre_ms', 'pnl_pct'])
+    df['combo'] = df['combo'].astype(int)
+    return df
+
+# ==============================================================================
+# 4. MÉTRICAS, RANKING Y WALK-FORWARD
+# ==============================================================================
+
+def metricas(trades, n_combos):
+    """Métricas por combinación sobre los trades cerrados (índice = combo)."""
+    cerrados = trades.dropna(subset=['pnl_pct']).sort_values(['combo', 'cierre_ms'])
+    g = cerrados.groupby('combo')['pnl_pct']
+    ganancias = cerrados['pnl_pct'].clip(lower=0).groupby(cerrados['combo']).sum()
+    perdidas = (-cerrados['pnl_pct'].clip(upper=0)).groupby(cerrados['combo']).sum()
+    equity = g.cumsum()
+    drawdown = (equity.groupby(cerrados['combo']).cummax().clip(lower=0) - equity).groupby(cerrados['combo']).max()
+    res = pd.DataFrame({
+        'trades': g.size(), 'acierto': g.apply(lambda x: (x > 0).mean() * 100),
+        'pnl_total': g.sum(), 'pnl_medio': g.mean(),
+        'factor_beneficio': ganancias / perdidas.replace(0, np.nan), 'max_drawdown': drawdown,
+    }).reindex(range(n_combos))
+    res['trades'] = res['trades'].fillna(0).astype(int)
+    return res
+
+
+def ranking(combos, trades, metrica='pnl_total', min_trades=10):
+    """Tabla de resultados (parámetros + métricas) ordenada por 'metrica'; las combinaciones con pocos trades van al final."""
+    res = pd.concat([pd.DataFrame(combos)[list(OPCIONES_REJILLA)], metricas(trades, len(combos))], axis=1)
+    res['suficiente'] = res['trades'] >= min_trades
+    return res.sort_values(['suficiente', metrica], ascending=[False, False], na_position='last')
+
+
+def walk_forward(combos, trades, desde_ms, hasta_ms, entrenamiento_dias, prueba_dias,
+                 metrica='pnl_total', min_trades=10):
+    """
+    Ventanas deslizantes: se elige la mejor combinación en 'entrenamiento_dias' y se mide
+    en los 'prueba_dias' siguientes. Retorna un DataFrame con una fila por ventana.
+    """
+    filas, inicio = [], desde_ms
+    while inicio + (entrenamiento_dias + prueba_dias) * DIA_MS <= hasta_ms:
+        corte = inicio + entrenamiento_dias * DIA_MS
+        fin = corte + prueba_dias * DIA_MS
+        entreno = ranking(combos, trades[(trades['entrada_ms'] >= inicio) & (trades['entrada_ms'] < corte)], metrica, min_trades)
+        mejor = entreno.index[0]
+        prueba = metricas(trades[(trades['entrada_ms'] >= corte) & (trades['entrada_ms'] < fin)], len(combos)).loc[mejor]
+        fila = {'entreno_desde': pd.Timestamp(inicio, unit='ms', tz='UTC').date(),
+                'prueba_desde': pd.Timestamp(corte, unit='ms', tz='UTC').date(),
+                'prueba_hasta': pd.Timestamp(fin, unit='ms', tz='UTC').date(), 'combo': mejor}
+        fila.update({k: combos[mejor][k] for k in OPCIONES_REJILLA})
+        fila.update({f"entreno_{k}": entreno.loc[mejor, k] for k in ('trades', metrica)})
+        fila.update({f"prueba_{k}": prueba[k] for k in ('trades', 'acierto', 'pnl_total', 'pnl_medio', 'max_drawdown')})
+        fila['prueba_trades'] = int(fila['prueba_trades'])
+        filas.append(fila)
+        inicio += prueba_dias * DIA_MS
+    return pd.DataFrame(filas)
+
+# ==============================================================================
+# 5. LÍNEA DE COMANDOS
+# ==============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Barrido de parámetros y walk-forward de la estrategia.")
+    parser.add_argument('--desde', required=True, help="Fecha inicial UTC (YYYY-MM-DD)")
+    parser.add_argument('--hasta', default=None, help="Fecha final UTC (por defecto, ahora)")
+    parser.add_argument('--simbolos', nargs='*', default=None, help=f"Símbolos (por defecto, los de {SYMBOLS_FILE})")
+    parser.add_argument('--workers', type=int, default=None, help="Procesos (por defecto, uno por CPU)")
+    parser.add_argument('--db', default=KLINES_DB_FILE, help="Almacén SQLite de velas")
+    for clave, tipo in OPCIONES_REJILLA.items():
+        parser.add_argument('--' + clave.replace('_', '-'), dest=clave, type=tipo, nargs='+',
+                            default=[PARAMETROS_DEFECTO[clave]], help=f"Valores a probar (defecto {PARAMETROS_DEFECTO[clave]})")
+    parser.add_argument('--metrica', choices=METRICAS, default='pnl_total', help="Métrica del ranking")
+    parser.add_argument('--min-trades', type=int, default=10, help="Trades mínimos para que una combinación compita")
+    parser.add_argument('--entrenamiento-dias', type=int, default=60)
+    parser.add_argument('--prueba-dias', type=int, default=30)
+    parser.add_argument('--salida', default=BARRIDO_RESULTADOS_FILE)
+    parser.add_argument('--salida-wf', default=BARRIDO_WALKFORWARD_FILE)
+    args = parser.parse_args()
+
+    symbols = args.simbolos
+    if not symbols:
+        with open(SYMBOLS_FILE, 'r') as f: symbols = json.load(f)
+    desde_ms = _fecha_ms(args.desde)
+    hasta_ms = _fecha_ms(args.hasta) if args.hasta else int(time.time() * 1000)
+    combos = generar_combinaciones({k: getattr(args, k) for k in OPCIONES_REJILLA})
+    if not combos:
+        print("❌ La rejilla no genera combinaciones válidas."); return
+
+    print(f"🔎 Evaluando {len(combos)} combinaciones sobre {len(symbols)} símbolos...")
+    t0 = time.time()
+    trades = ejecutar_barrido(symbols, combos, desde_ms, hasta_ms, args.workers, args.db)
+    res = ranking(combos, trades, args.metrica, args.min_trades)
+    res.to_csv(args.salida, index_label='combo')
+    print(f"✅ Barrido completado en {time.time() - t0:.1f}s. Ranking guardado en '{args.salida}'.")
+    print(res.head(10).to_string())
+
+    wf = walk_forward(combos, trades, desde_ms, hasta_ms, args.entrenamiento_dias, args.prueba_dias,
+                      args.metrica, args.min_trades)
+    if wf.empty:
+        print("Periodo demasiado corto para el walk-forward.")
+        return
+    wf.to_csv(args.salida_wf, index=False)
+    print(f"\nWalk-forward ({len(wf)} ventanas) guardado en '{args.salida_wf}':")
+    print(wf.to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
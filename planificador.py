@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+Planificación de ciclos alineada al cierre de las velas del exchange.
+
+En lugar de dormir "15 minutos menos lo que duró el ciclo" (que deriva respecto
+a los límites de vela), PlanificadorVelas despierta unos segundos después de
+cada cierre de vela según la hora del servidor de Binance (RelojServidor).
+Si un ciclo se alarga o se pierde, el siguiente se ejecuta de inmediato para
+el último cierre (sin encadenar los ciclos atrasados) y se vuelve al ritmo.
+
+RegistroLatencias guarda la latencia desde el cierre de vela hasta cada señal
+o alerta (percentiles por tipo de evento).
+"""
+import threading
+import time
+import logging
+from collections import deque
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+RESINCRONIZAR_RELOJ_SEG = 3600  # Cada cuánto se vuelve a medir el desfase con el servidor
+MAX_LATENCIAS_POR_EVENTO = 1000
+
+
+class RelojServidor:
+    """Hora del servidor de Binance estimada como hora local + desfase medido (con corrección del RTT)."""
+
+    def __init__(self, client=None, resincronizar_seg=RESINCRONIZAR_RELOJ_SEG):
+        self.client = client
+        self.resincronizar_seg = resincronizar_seg
+        self.desfase_ms = 0.0
+        self._medido = None  # time.monotonic() de la última medición
+
+    def sincronizar(self):
+        """Mide el desfase con futures_time(). Devuelve el desfase en ms (se mantiene el anterior si falla)."""
+        if self.client is None: return self.desfase_ms
+        try:
+            t0 = time.time() * 1000
+            servidor = self.client.futures_time()['serverTime']
+            t1 = time.time() * 1000
+            self.desfase_ms = float(servidor) - (t0 + t1) / 2
+            self._medido = time.monotonic()
+            if abs(self.desfase_ms) > 1000:
+                logger.warning(f"Reloj local desfasado {self.desfase_ms / 1000:.1f}s respecto al servidor de Binance")
+        except Exception as e:
+            logger.warning(f"No se pudo sincronizar con la hora del servidor: {e}")
+        return self.desfase_ms
+
+    def ahora_ms(self):
+        if self.client is not None and (self._medido is None or time.monotonic() - self._medido > self.resincronizar_seg):
+            self.sincronizar()
+        return int(time.time() * 1000 + self.desfase_ms)
+
+
+class PlanificadorVelas:
+    """Ciclos que empiezan 'retardo_seg' después de cada cierre de vela de 'intervalo_ms' (hora del servidor)."""
+
+    def __init__(self, intervalo_ms, retardo_seg=3.0, reloj=None, dormir=None):
+        self.intervalo_ms = intervalo_ms
+        self.retardo_ms = int(retardo_seg * 1000)
+        self.reloj = reloj or RelojServidor()
+        # time.sleep se resuelve al crear el planificador (la reproducción lo sustituye por un reloj virtual)
+        self._dormir = dormir or time.sleep
+        self.ultimo_cierre = None
+        self.ciclos_saltados = 0
+
+    def ultimo_cierre_ms(self, ahora_ms=None):
+        """Último límite de vela (= open_time de la vela en curso) en la hora del servidor."""
+        ahora_ms = self.reloj.ahora_ms() if ahora_ms is None else ahora_ms
+        return ahora_ms // self.intervalo_ms * self.intervalo_ms
+
+    def esperar_siguiente(self):
+        """
+        Duerme hasta el próximo cierre + retardo y devuelve ese cierre (ms). Si ya pasó un cierre
+        sin ciclo (el anterior se alargó), retorna enseguida con el más reciente y cuenta los saltados.
+        """
+        while True:
+            ahora = self.reloj.ahora_ms()
+            cierre = self.ultimo_cierre_ms(ahora)
+            pendiente = self.ultimo_cierre is None or cierre > self.ultimo_cierre
+            if pendiente and ahora >= cierre + self.retardo_ms:
+                if self.ultimo_cierre is not None:
+                    saltados = (cierre - self.ultimo_cierre) // self.intervalo_ms - 1
+                    if saltados > 0:
+                        self.ciclos_saltados += saltados
+                        logger.warning(f"{saltados} ciclo(s) perdidos: se evalúa directamente la última vela cerrada")
+                self.ultimo_cierre = cierre
+                return cierre
+            # Se re-comprueba tras dormir (el reloj del servidor puede haberse corregido)
+            objetivo = cierre + self.retardo_ms if pendiente else cierre + self.intervalo_ms + self.retardo_ms
+            self._dormir(max(0.0, (objetivo - ahora) / 1000))
+
+
+class RegistroLatencias:
+    """Latencias (segundos) desde el cierre de vela hasta cada evento, con percentiles por tipo."""
+
+    def __init__(self, reloj=None, max_por_evento=MAX_LATENCIAS_POR_EVENTO, metricas=None):
+        self.reloj = reloj or RelojServidor()
+        self.metricas = metricas  # RegistroMetricas opcional: histograma bot_latencia_segundos por evento
+        self.max_por_evento = max_por_evento
+        self._lock = threading.Lock()
+        self._muestras = {}  # evento -> deque de latencias en segundos
+        self._totales = {}   # evento -> nº total de eventos registrados
+
+    def registrar(self, evento, cierre_ms, symbol=None):
+        """Registra la latencia del evento ('senal', 'alerta'...) respecto a la vela que cerró en 'cierre_ms'."""
+        if cierre_ms is None: return None
+        latencia = (self.reloj.ahora_ms() - cierre_ms) / 1000
+        with self._lock:
+            self._muestras.setdefault(evento, deque(maxlen=self.max_por_evento)).append(latencia)
+            self._totales[evento] = self._totales.get(evento, 0) + 1
+        if self.metricas: self.metricas.observar('bot_latencia_segundos', latencia, evento=evento)
+        logger.info(f"Latencia {evento}{f' {symbol}' if symbol else ''}: {latencia:.2f}s desde el cierre de vela")
+        return latencia
+
+    def resumen(self):
+        """evento -> {'n', 'media', 'p50', 'p95', 'max'} de las últimas muestras."""
+        with self._lock:
+            muestras = {evento: np.array(valores) for evento, valores in self._muestras.items()}
+            totales = dict(self._totales)
+        return {evento: {'n': totales[evento], 'media': float(v.mean()), 'p50': float(np.percentile(v, 50)),
+                         'p95': float(np.percentile(v, 95)), 'max': float(v.max())}
+                for evento, v in muestras.items() if len(v)}
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+Instantánea de precios compartida por los consumidores del bot.
+
+En lugar de pedir una vela por cada trade abierto, el ciclo hace UNA llamada
+masiva (futures_symbol_ticker sin símbolo, todos los pares) y guarda el
+último precio de cada símbolo. De los símbolos seguidos (con un trade
+abierto) acumula además el máximo y el mínimo vistos desde el último consumo,
+para juzgar las salidas por el recorrido intravela y no solo por el cierre;
+al abrir el trade los extremos empiezan en el precio de entrada, de modo que
+lo ocurrido antes de la entrada nunca dispara una salida. En modo stream los
+extremos llegan de cada actualización del kline (x=false incluido) sin
+ninguna llamada a la API.
+"""
+import threading
+import time
+import logging
+
+from estrategia import NIVELES_TRADE, evaluar_salida
+
+logger = logging.getLogger(__name__)
+
+
+def _ahora_ms():
+    return int(time.time() * 1000)
+
+
+class InstantaneaPrecios:
+    """Último precio por símbolo y extremos (high/low) de los símbolos seguidos desde el último consumo, segura entre hilos."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._datos = {}  # symbol -> {'price', 'high', 'low', 'ts', 'consumido'}
+        self._velas = {}  # symbol -> [open_ms, high, low] ya vistos de la vela en curso (extremos acumulados del stream)
+        self._seguidos = set()
+
+    def registrar_precio(self, symbol, price, ts_ms=None):
+        self.registrar_vela(symbol, price, price, price, ts_ms)
+
+    def registrar_vela(self, symbol, high, low, close, ts_ms=None, open_ms=None):
+        """
+        Incorpora un tramo de precio (vela o actualización de vela) con sus extremos y su último precio.
+        'ts_ms' es el instante del último precio del tramo; los tramos anteriores al último consumo se ignoran.
+        'open_ms' identifica la vela cuando sus extremos son acumulados (kline del stream): de una misma
+        vela solo cuentan un máximo o un mínimo nuevos, no los ya vistos (quizá antes de un consumo).
+        """
+        ts_ms = ts_ms or _ahora_ms()
+        with self._lock:
+            if open_ms is not None:
+                vista = self._velas.get(symbol)
+                if vista is not None and open_ms < vista[0]: return  # Vela anterior que llega tarde
+                if vista is None or open_ms > vista[0]: self._velas[symbol] = [open_ms, high, low]
+                else:
+                    high, low, vista[1], vista[2] = (high if high > vista[1] else close, low if low < vista[2] else close,
+                                                     max(vista[1], high), min(vista[2], low))
+            dato = self._datos.get(symbol)
+            if dato is None or symbol not in self._seguidos:
+                # Sin trade abierto solo importa el último precio: los extremos empiezan al seguir el símbolo
+                if dato is None: self._datos[symbol] = {'price': close, 'high': close, 'low': close, 'ts': ts_ms, 'consumido': 0}
+                elif ts_ms >= dato['ts']: dato['price'] = dato['high'] = dato['low'] = close; dato['ts'] = ts_ms
+                return
+            if ts_ms < dato['consumido']: return
+            dato['high'] = max(dato['high'], high, close); dato['low'] = min(dato['low'], low, close)
+            if ts_ms >= dato['ts']: dato['price'], dato['ts'] = close, ts_ms
+
+    def seguir(self, symbol, precio=None):
+        """
+        Empieza a acumular los extremos del símbolo (trade recién abierto) desde 'precio' (el de entrada)
+        o, sin él, desde el último precio conocido: lo visto antes no cuenta para las salidas.
+        """
+        with self._lock:
+            self._seguidos.add(symbol)
+            dato = self._datos.get(symbol)
+            if dato is None:
+                if precio is None: return
+                dato = self._datos[symbol] = {'price': precio, 'ts': _ahora_ms()}
+            dato['high'] = dato['low'] = dato['price'] if precio is None else precio
+            dato['consumido'] = dato['ts']
+
+    def sincronizar_seguidos(self, symbols):
+        """Sigue exactamente 'symbols' (los que tienen un trade abierto): los nuevos empiezan en su último precio."""
+        symbols = set(symbols)
+        with self._lock: nuevos, self._seguidos = symbols - self._seguidos, self._seguidos & symbols
+        for symbol in nuevos: self.seguir(symbol)
+
+    def actualizar(self, client):
+        """Una sola petición con el precio de todos los símbolos. Devuelve cuántos se actualizaron."""
+        tickers = client.futures_symbol_ticker()
+        recibido_ms = _ahora_ms()
+        for t in tickers:
+            try: self.registrar_precio(t['symbol'], float(t['price']), int(t.get('time') or recibido_ms))
+            except (KeyError, TypeError, ValueError): continue
+        return len(tickers)
+
+    def obtener(self, symbol):
+        """Copia del dato del símbolo ({'price', 'high', 'low', 'ts', 'consumido'}) o None."""
+        with self._lock:
+            dato = self._datos.get(symbol)
+            return dict(dato) if dato else None
+
+    def consumir(self, symbol):
+        """Como obtener, pero reinicia los extremos al último precio: el siguiente tramo empieza aquí."""
+        with self._lock:
+            dato = self._datos.get(symbol)
+            if not dato: return None
+            copia = dict(dato)
+            dato['high'] = dato['low'] = dato['price']
+            # Mismo reloj que los datos (hora de Binance): con el reloj local adelantado se descartarían los tramos nuevos
+            dato['consumido'] = dato['ts']
+            return copia
+
+
+def verificar_salidas():
+    """
+    Un trade recién abierto no hereda los extremos previos a la entrada: ni los acumulados por el
+    símbolo sin seguir ni los que el stream repite en cada actualización de la misma vela.
+    """
+    pivotes = {'PP': 100., 'R1': 105., 'R2': 108., 'S1': 95., 'S2': 92.}
+    trade = dict(NIVELES_TRADE['LONG'], entry_type='LONG', entry_price=100.)
+
+    def salida(instantanea):
+        dato = instantanea.consumir('BTCUSDT')
+        return evaluar_salida(trade, dato['price'], pivotes, dato['high'], dato['low'])[0]
+
+    # REST: precios entre 90 y 110 antes de la entrada
+    instantanea = InstantaneaPrecios()
+    for i, price in enumerate([110., 90., 100.]): instantanea.registrar_precio('BTCUSDT', price, 1_000 + i)
+    instantanea.seguir('BTCUSDT', 100.)
+    if salida(instantanea) is not None: raise AssertionError("Salida con extremos anteriores a la entrada (REST)")
+
+    # Stream: la vela en curso ya marcó 110 / 90 y sus actualizaciones repiten esos extremos acumulados
+    instantanea, abre = InstantaneaPrecios(), 900_000
+    instantanea.registrar_vela('BTCUSDT', 110., 90., 100., abre + 1_000, abre)
+    instantanea.seguir('BTCUSDT', 100.)
+    instantanea.registrar_vela('BTCUSDT', 110., 90., 100.5, abre + 2_000, abre)
+    if salida(instantanea) is not None: raise AssertionError("Salida con extremos anteriores a la entrada (stream)")
+    instantanea.registrar_vela('BTCUSDT', 110., 90., 101., abre + 3_000, abre)
+    if salida(instantanea) is not None: raise AssertionError("Extremos ya consumidos vuelven en la misma vela")
+    # Un mínimo nuevo de la vela, o los extremos de una vela nueva, sí cuentan
+    instantanea.registrar_vela('BTCUSDT', 110., 89., 97., abre + 4_000, abre)
+    if salida(instantanea) != 'SL': raise AssertionError("No se detecta el SL con un mínimo nuevo de la vela")
+    instantanea.registrar_vela('BTCUSDT', 99., 94., 97., 2 * abre + 1_000, 2 * abre)
+    if salida(instantanea) != 'SL': raise AssertionError("No se detecta el SL en una vela nueva")
+    # Los símbolos que dejan de seguirse no acumulan extremos
+    instantanea.sincronizar_seguidos([])
+    instantanea.registrar_precio('BTCUSDT', 80., 2 * abre + 5_000); instantanea.registrar_precio('BTCUSDT', 100., 2 * abre + 6_000)
+    instantanea.sincronizar_seguidos(['BTCUSDT'])
+    if salida(instantanea) is not None: raise AssertionError("Extremos acumulados sin trade abierto")
+    return 6
+
+
+if __name__ == '__main__':
+    print(f"Salidas sin extremos previos a la entrada OK ({verificar_salidas()} casos)")
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+Logging sin bloqueos y diario de eventos estructurado (JSONL).
+
+- configurar_logging deja en el logger raíz un QueueHandler: el hilo que
+  registra solo encola el LogRecord y un QueueListener (hilo propio) lo
+  formatea y lo escribe con rotación por tamaño o diaria (medianoche UTC).
+- DiarioEventos escribe un evento por línea JSON (señal evaluada, señal
+  disparada, TP1 / TP2 / SL, resumen de ciclo) con los valores de los
+  indicadores, por la misma cola y con la misma rotación. La serialización
+  también se hace en el hilo del listener, fuera del bucle principal.
+- leer_eventos consulta el diario (incluidos los archivos rotados, del más
+  antiguo al actual) filtrando por tipo, símbolo y fechas, sin parsear texto:
+
+    python registro.py --tipo salida --symbol BTCUSDT --desde 2024-05-01
+    python registro.py --resumen
+"""
+import argparse
+import atexit
+import glob
+import json
+import math
+import os
+import queue
+import sys
+import time
+import logging
+from collections import Counter
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+
+import numpy as np
+
+LOG_FILE = 'bot_activity.log'
+EVENTOS_FILE = 'eventos.jsonl'
+ROTACIONES = ('tamano', 'diaria')
+LOG_MAX_MB = 10    # Rotación por tamaño: MB por archivo
+LOG_COPIAS = 5     # Archivos rotados que se conservan (.1 ... .5 o uno por día)
+
+
+def crear_handler_rotativo(archivo, rotacion='tamano', max_mb=LOG_MAX_MB, copias=LOG_COPIAS):
+    """RotatingFileHandler ('tamano') o TimedRotatingFileHandler a medianoche UTC ('diaria')."""
+    if rotacion not in ROTACIONES: raise ValueError(f"Rotación desconocida: {rotacion} (opciones: {', '.join(ROTACIONES)})")
+    if rotacion == 'diaria':
+        return TimedRotatingFileHandler(archivo, when='midnight', utc=True, backupCount=copias, encoding='utf-8')
+    return RotatingFileHandler(archivo, maxBytes=int(max_mb * 1024 * 1024), backupCount=copias, encoding='utf-8')
+
+
+def detener(listener):
+    """Escribe lo que quede en la cola y detiene el listener (sin efecto si ya estaba detenido)."""
+    if listener is not None and listener._thread is not None: listener.stop()
+
+
+def _en_cola(logger, handler):
+    """Conecta 'logger' a 'handler' a través de una cola; devuelve el listener (se detiene al salir)."""
+    cola = queue.SimpleQueue()
+    listener = QueueListener(cola, handler, respect_handler_level=True)
+    logger.addHandler(QueueHandler(cola))
+    listener.start()
+    atexit.register(detener, listener)  # Vacía la cola antes de terminar el proceso
+    return listener
+
+
+def configurar_logging(archivo=LOG_FILE, formatter=None, nivel=logging.INFO, rotacion='tamano',
+                       max_mb=LOG_MAX_MB, copias=LOG_COPIAS, logger=None):
+    """Logging de 'logger' (por defecto el raíz) a 'archivo' sin escribir en disco desde el hilo que registra."""
+    logger = logger or logging.getLogger()
+    logger.setLevel(nivel)
+    handler = crear_handler_rotativo(archivo, rotacion, max_mb, copias)
+    if formatter: handler.setFormatter(formatter)
+    return _en_cola(logger, handler)
+
+
+def _valor_json(valor):
+    """Tipos de NumPy y demás no serializables -> JSON."""
+    if isinstance(valor, np.generic): return valor.item()
+    if isinstance(valor, np.ndarray): return valor.tolist()
+    return str(valor)
+
+
+class FormatoJSONL(logging.Formatter):
+    """Una línea JSON por evento (el dict va en record.evento)."""
+
+    def format(self, record):
+        return json.dumps(record.evento, default=_valor_json, ensure_ascii=False, separators=(',', ':'))
+
+
+def valores_indicadores(fila, nombres, decimales=6):
+    """{nombre: valor redondeado} de una fila de indicadores (NaN -> None, para que el JSON sea estándar)."""
+    valores = {}
+    for nombre in nombres:
+        valor = fila.get(nombre)
+        if isinstance(valor, (bool, np.bool_)): valores[nombre] = bool(valor)
+        elif valor is None or not math.isfinite(valor): valores[nombre] = None
+        else: valores[nombre] = round(float(valor), decimales)
+    return valores
+
+
+class DiarioEventos:
+    """
+    Diario de eventos en JSONL: registrar(tipo, **campos) solo encola; el listener serializa
+    y escribe. Los valores no deben modificarse después de registrarlos (pasar copias).
+    Con path vacío no registra nada.
+    """
+
+    def __init__(self, path=EVENTOS_FILE, rotacion='tamano', max_mb=LOG_MAX_MB, copias=LOG_COPIAS):
+        self.path = path
+        self._listener = None
+        self._logger = logging.getLogger(f"{__name__}.eventos")
+        self._logger.propagate = False  # Los eventos no van a bot_activity.log
+        self._logger.setLevel(logging.INFO)
+        for handler in list(self._logger.handlers): self._logger.removeHandler(handler)
+        if not path: return
+        handler = crear_handler_rotativo(path, rotacion, max_mb, copias)
+        handler.setFormatter(FormatoJSONL())
+        self._listener = _en_cola(self._logger, handler)
+
+    def registrar(self, tipo, **campos):
+        if self._listener is None: return
+        evento = {'ts': datetime.fromtimestamp(time.time(), timezone.utc).isoformat(timespec='milliseconds'), 'tipo': tipo}
+        evento.update(campos)
+        self._logger.info(tipo, extra={'evento': evento})
+
+    def cerrar(self):
+        """Escribe lo encolado y detiene el hilo del listener."""
+        detener(self._listener)
+        self._listener = None
+
+
+def archivos_diario(path=EVENTOS_FILE):
+    """Archivos del diario del más antiguo al actual: path.N ... path.1 (o path.AAAA-MM-DD ...) y path."""
+    def orden(archivo):
+        sufijo = archivo[len(path) + 1:]
+        return (-int(sufijo), '') if sufijo.isdigit() else (0, sufijo)
+    rotados = sorted(glob.glob(glob.escape(path) + '.*'), key=orden)
+    return rotados + ([path] if os.path.exists(path) else [])
+
+
+def leer_eventos(path=EVENTOS_FILE, tipo=None, symbol=None, desde=None, hasta=None):
+    """
+    Eventos (dicts) del diario en orden cronológico. 'tipo' puede ser un nombre o una lista;
+    'desde' / 'hasta' son prefijos ISO del 'ts' (p. ej. '2024-05-01') y el rango es [desde, hasta).
+    """
+    tipos = {tipo} if isinstance(tipo, str) else (set(tipo) if tipo else None)
+    for archivo in archivos_diario(path):
+        with open(archivo, 'r', encoding='utf-8') as f:
+            for linea in f:
+                try: evento = json.loads(linea)
+                except json.JSONDecodeError: continue  # Línea cortada por un cierre brusco
+                if tipos and evento.get('tipo') not in tipos: continue
+                if symbol and evento.get('symbol') != symbol: continue
+                if desde and evento.get('ts', '') < desde: continue
+                if hasta and evento.get('ts', '') >= hasta: continue
+                yield evento
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Consulta el diario de eventos (JSONL) del bot.")
+    parser.add_argument('--eventos', default=EVENTOS_FILE, help="archivo del diario (se leen también los rotados)")
+    parser.add_argument('--tipo', action='append', help="senal_evaluada, senal, salida, ciclo (repetible)")
+    parser.add_argument('--symbol', default=None)
+    parser.add_argument('--desde', default=None, help="prefijo ISO UTC inclusivo, p. ej. 2024-05-01")
+    parser.add_argument('--hasta', default=None, help="prefijo ISO UTC exclusivo")
+    parser.add_argument('--resumen', action='store_true', help="solo el número de eventos por tipo")
+    args = parser.parse_args(argv)
+
+    eventos = leer_eventos(args.eventos, args.tipo, args.symbol, args.desde, args.hasta)
+    if args.resumen:
+        for tipo, n in Counter(e.get('tipo') for e in eventos).most_common(): print(f"{tipo:<16} {n}")
+        return 0
+    for evento in eventos: print(json.dumps(evento, ensure_ascii=False))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
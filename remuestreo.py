@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+Remuestreo de la serie base M15 a marcos superiores (H1, H4, diario).
+
+Las velas de 1h / 4h / 1d de Binance están alineadas a UTC: una vela del marco
+superior agrupa las M15 cuyo open_time cae en [inicio, inicio + paso), con
+inicio múltiplo de paso desde epoch. Así los filtros de marco superior
+(tendencia H1, RSI diario...) salen de las velas que ya están en el almacén
+local, sin pedir otra serie a la API.
+
+La última vela superior suele estar a medias (como la vela abierta de la API):
+se conserva y se marca con completa=False. RemuestreadorIncremental mantiene
+la serie por símbolo y solo reagrupa la última vela superior con las M15 que
+van cerrando.
+"""
+import threading
+import time
+import logging
+
+import numpy as np
+import pandas as pd
+
+from kline_store import INTERVALO_MS, COLUMNAS_OHLCV
+
+logger = logging.getLogger(__name__)
+
+INTERVALO_BASE = '15m'
+MARCOS_SUPERIORES = ('1h', '4h', '1d')
+COLUMNAS_REMUESTREO = COLUMNAS_OHLCV + ['n_velas', 'completa']
+
+
+def remuestrear(df, intervalo, base=INTERVALO_BASE, desde_ms=None, ahora_ms=None):
+    """
+    Velas OHLCV de 'intervalo' a partir de velas 'base' ordenadas (columnas COLUMNAS_OHLCV).
+    Open = primer Open, High / Low = extremos, Close = último Close, Volume = suma.
+    'desde_ms' descarta las velas superiores que empiezan antes (la primera quedaría
+    a medias). 'completa' indica que están todas las velas base y la última ya cerró.
+    """
+    paso, paso_base = INTERVALO_MS[intervalo], INTERVALO_MS[base]
+    if paso % paso_base:
+        raise ValueError(f"{intervalo} no es múltiplo de {base}")
+    if desde_ms is not None:
+        df = df[df['open_time'] >= -(-int(desde_ms) // paso) * paso]
+    if df.empty:
+        return pd.DataFrame(columns=COLUMNAS_REMUESTREO)
+
+    open_time = df['open_time'].to_numpy(dtype=np.int64)
+    grupo = open_time // paso * paso
+    inicio = np.r_[0, np.flatnonzero(np.diff(grupo)) + 1]
+    ultima = np.r_[inicio[1:], len(grupo)] - 1
+    n_velas = ultima - inicio + 1
+    ahora_ms = ahora_ms if ahora_ms is not None else int(time.time() * 1000)
+    close_time = grupo[inicio] + paso - 1
+    return pd.DataFrame({
+        'open_time': grupo[inicio],
+        'Open': df['Open'].to_numpy(dtype=float)[inicio],
+        'High': np.maximum.reduceat(df['High'].to_numpy(dtype=float), inicio),
+        'Low': np.minimum.reduceat(df['Low'].to_numpy(dtype=float), inicio),
+        'Close': df['Close'].to_numpy(dtype=float)[ultima],
+        'Volume': np.add.reduceat(df['Volume'].to_numpy(dtype=float), inicio),
+        'close_time': close_time,
+        'n_velas': n_velas,
+        'completa': (n_velas == paso // paso_base) & (df['close_time'].to_numpy(dtype=np.int64)[ultima] < ahora_ms),
+    })
+
+
+class RemuestreadorIncremental:
+    """
+    Serie de un marco superior por símbolo que se extiende con las velas base nuevas:
+    solo se reagrupa desde el inicio de la última vela superior guardada.
+    """
+
+    def __init__(self, intervalo, base=INTERVALO_BASE, max_velas=1000):
+        self.intervalo, self.base, self.max_velas = intervalo, base, max_velas
+        self._lock = threading.Lock()
+        self._series = {}  # symbol -> DataFrame (COLUMNAS_REMUESTREO)
+
+    def pendiente_desde(self, symbol):
+        """open_time desde el que se necesitan velas base para actualizar el símbolo (None = sin serie)."""
+        with self._lock:
+            serie = self._series.get(symbol)
+            return None if serie is None or serie.empty else int(serie['open_time'].iloc[-1])
+
+    def actualizar(self, symbol, df_base, ahora_ms=None):
+        """
+        Incorpora velas base (desde pendiente_desde; las anteriores se ignoran) y devuelve
+        la serie superior del símbolo. Si el símbolo no tenía serie, 'df_base' es el historial completo.
+        """
+        with self._lock:
+            previa = self._series.get(symbol)
+            desde = None if previa is None or previa.empty else int(previa['open_time'].iloc[-1])
+            if desde is not None: df_base = df_base[df_base['open_time'] >= desde]
+            serie = remuestrear(df_base, self.intervalo, self.base, ahora_ms=ahora_ms)
+            if desde is not None:
+                # La última vela superior guardada se sustituye por su versión reagrupada
+                serie = pd.concat([previa[previa['open_time'] < desde], serie], ignore_index=True) if not serie.empty else previa
+            serie = serie.iloc[-self.max_velas:].reset_index(drop=True)
+            self._series[symbol] = serie
+            return serie
+
+    def descartar(self, symbol):
+        with self._lock:
+            self._series.pop(symbol, None)
+
+
+def verificar_paridad(n_dias=12, semilla=0):
+    """Compara remuestrear y el incremental con DataFrame.resample de pandas (con huecos y vela parcial)."""
+    rng = np.random.default_rng(semilla)
+    paso = INTERVALO_MS[INTERVALO_BASE]
+    n = n_dias * 96
+    open_time = 1_700_000_000_000 // INTERVALO_MS['1d'] * INTERVALO_MS['1d'] + 37 * paso + np.arange(n, dtype=np.int64) * paso
+    open_time = np.delete(open_time, rng.choice(n, 20, replace=False))  # huecos (mantenimiento)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.004, len(open_time))))
+    df = pd.DataFrame({'open_time': open_time, 'Open': close * (1 + rng.normal(0, .001, len(close))),
+                       'High': close * 1.003, 'Low': close * 0.997, 'Close': close,
+                       'Volume': rng.uniform(10, 1000, len(close)), 'close_time': open_time + paso - 1})
+    ahora_ms = int(open_time[-1]) + paso // 2  # la última M15 sigue abierta
+    for intervalo in MARCOS_SUPERIORES:
+        r = remuestrear(df, intervalo, ahora_ms=ahora_ms)
+        ref = (df.set_index(pd.to_datetime(df['open_time'], unit='ms', utc=True))
+               .resample(pd.Timedelta(milliseconds=INTERVALO_MS[intervalo]), origin='epoch')
+               .agg({'Open': 'first', 'High': 'max', 'Low': 'min', 'Close': 'last', 'Volume': 'sum'}).dropna())
+        assert len(r) == len(ref), intervalo
+        for col in ('Open', 'High', 'Low', 'Close', 'Volume'):
+            assert np.allclose(r[col].to_numpy(dtype=float), ref[col].to_numpy(), rtol=1e-12), (intervalo, col)
+        assert not r['completa'].iloc[-1]
+
+        inc = RemuestreadorIncremental(intervalo)
+        for corte in range(200, len(df) + 1, 37):
+            desde = inc.pendiente_desde('X')
+            base = df.iloc[:corte] if desde is None else df.iloc[:corte][df['open_time'].iloc[:corte] >= desde]
+            serie = inc.actualizar('X', base, ahora_ms=ahora_ms)
+        serie = inc.actualizar('X', df[df['open_time'] >= inc.pendiente_desde('X')], ahora_ms=ahora_ms)
+        pd.testing.assert_frame_equal(serie.astype(float), r.astype(float))
+    print(f"Paridad de remuestreo OK ({', '.join(MARCOS_SUPERIORES)})")
+
+
+if __name__ == '__main__':
+    verificar_paridad()
@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+"""
+Ingesta de klines por websocket (streams combinados de Binance Futures).
+
+Mantiene en memoria las últimas velas CERRADAS de cada símbolo y llama a
+'on_cierre(symbol, ventana)' en cuanto llega una vela con 'x: true'. Si se
+detecta un hueco (reconexión, mensaje perdido) se rellena por REST con la
+función 'backfill' antes de avisar. Con 'on_actualizacion' también se reenvía
+cada actualización intravela (high/low/close). La URL base es configurable
+para poder probarlo contra un servidor websocket local (verificar_stream_local:
+python stream_klines.py).
+
+Cada ventana vive en un AnilloVelas preasignado (ver velas.py): una vela
+nueva no realoca nada y miles de símbolos ocupan una fracción de la memoria
+que ocupaban las tuplas de objetos Python.
+
+actualizar_simbolos cambia los símbolos suscritos en caliente (p. ej. tras un
+re-escaneo del universo): las conexiones se reabren con el nuevo reparto y las
+velas que se pierdan en el cambio se rellenan por REST como en una reconexión.
+"""
+import asyncio
+import json
+import logging
+import time
+
+import websockets
+
+from kline_store import INTERVALO_MS
+from velas import AnilloVelas, como_velas, a_dataframe
+
+logger = logging.getLogger(__name__)
+
+WS_URL_BASE = 'wss://fstream.binance.com'
+MAX_STREAMS_POR_CONEXION = 200  # Límite de Binance Futures por conexión combinada
+RECONEXION_MAX_SEG = 60
+
+
+class StreamKlines:
+    """Streams combinados <symbol>@kline_<interval> con ventana en memoria, reconexión y relleno de huecos."""
+
+    def __init__(self, symbols, on_cierre, interval='15m', max_barras=250,
+                 url_base=WS_URL_BASE, backfill=None, on_actualizacion=None):
+        self.symbols = list(symbols)
+        self.on_cierre = on_cierre
+        self.interval = interval
+        self.paso = INTERVALO_MS[interval]
+        self.url_base = url_base.rstrip('/')
+        # backfill(symbol, desde_ms, hasta_ms) -> velas cerradas (array DTYPE_VELA o filas ot, o, h, l, c, v, ct)
+        self.backfill = backfill
+        # on_actualizacion(symbol, high, low, close, ts_ms, open_ms) en cada mensaje, con la vela cerrada o no
+        # (high / low son los acumulados de la vela 'open_ms')
+        self.on_actualizacion = on_actualizacion
+        self.max_barras = max_barras
+        self.barras = {s: AnilloVelas(max_barras) for s in self.symbols}
+        self._detenido = asyncio.Event()
+        self._loop = None
+        self._reconfigurar = None  # Event que reabre las conexiones con self.symbols (ver actualizar_simbolos)
+
+    # --------------------------------------------------------------------------
+    # Ventana en memoria
+    # --------------------------------------------------------------------------
+
+    def cargar_historial(self, symbol, velas):
+        """Precarga velas cerradas (array DTYPE_VELA o filas ot, o, h, l, c, v, ct) para no esperar a que se llene la ventana."""
+        barras = self.barras.get(symbol)
+        if barras is None: barras = self.barras[symbol] = AnilloVelas(self.max_barras)
+        velas = como_velas(velas)
+        ultimo = barras.ultimo_open_time()
+        if ultimo is not None: velas = velas[velas['open_time'] > ultimo]
+        barras.extender(velas)
+
+    def ventana(self, symbol):
+        """DataFrame OHLCV con las velas cerradas en memoria del símbolo (copia de la vista del anillo)."""
+        barras = self.barras.get(symbol)
+        return a_dataframe(barras.ventana() if barras is not None else como_velas([]))
+
+    def ultimo_open_time(self, symbol):
+        barras = self.barras.get(symbol)
+        return barras.ultimo_open_time() if barras is not None else None
+
+    # --------------------------------------------------------------------------
+    # Procesamiento de mensajes
+    # --------------------------------------------------------------------------
+
+    async def _rellenar(self, symbol, desde_ms, hasta_ms):
+        if not self.backfill or desde_ms > hasta_ms: return
+        loop = asyncio.get_running_loop()
+        try:
+            velas = await loop.run_in_executor(None, self.backfill, symbol, desde_ms, hasta_ms)
+            self.cargar_historial(symbol, velas)
+        except Exception as e:
+            logger.warning(f"Error rellenando hueco de {symbol} por REST: {e}")
+
+    async def procesar_mensaje(self, raw):
+        """Procesa un mensaje del stream combinado. Devuelve el símbolo si se cerró una vela."""
+        mensaje = json.loads(raw)
+        data = mensaje.get('data', mensaje)
+        k = data.get('k') if isinstance(data, dict) else None
+        if not k or k.get('i') != self.interval: return None
+        if self.on_actualizacion:
+            # Instante del último precio: el del evento, o el cierre si la vela ya terminó
+            ts_ms = min(int(data.get('E') or k['T']), int(k['T']))
+            self.on_actualizacion(k['s'], float(k['h']), float(k['l']), float(k['c']), ts_ms, int(k['t']))
+        if not k.get('x'): return None
+
+        symbol = k['s']
+        if symbol not in self.barras: return None  # Dado de baja, a la espera de reabrir las conexiones
+        vela = (int(k['t']), float(k['o']), float(k['h']), float(k['l']), float(k['c']), float(k['v']), int(k['T']))
+        ultimo = self.ultimo_open_time(symbol)
+        if ultimo is not None and vela[0] <= ultimo: return None  # Duplicado
+        if ultimo is not None and vela[0] - ultimo > self.paso:
+            logger.info(f"Hueco en stream de {symbol}: {(vela[0] - ultimo) // self.paso - 1} velas. Rellenando por REST...")
+            await self._rellenar(symbol, ultimo + self.paso, vela[0] - 1)
+
+        self.cargar_historial(symbol, [vela])
+        self.on_cierre(symbol, self.ventana(symbol))
+        return symbol
+
+    async def _rellenar_todos(self, symbols):
+        """Tras (re)conectar: trae por REST las velas cerradas que se perdieron mientras no había conexión."""
+        ahora_ms = int(time.time() * 1000)
+        ultima_cerrada = (ahora_ms // self.paso) * self.paso - self.paso
+        for symbol in symbols:
+            ultimo = self.ultimo_open_time(symbol)
+            if ultimo is None or ultimo >= ultima_cerrada: continue
+            await self._rellenar(symbol, ultimo + self.paso, ultima_cerrada + self.paso - 1)
+            if self.ultimo_open_time(symbol) == ultima_cerrada:
+                self.on_cierre(symbol, self.ventana(symbol))
+
+    # --------------------------------------------------------------------------
+    # Conexiones
+    # --------------------------------------------------------------------------
+
+    def url_para(self, symbols):
+        streams = '/'.join(f"{s.lower()}@kline_{self.interval}" for s in symbols)
+        return f"{self.url_base}/stream?streams={streams}"
+
+    def _en_bucle(self, funcion, *args):
+        """
+        Ejecuta 'funcion' en el hilo del bucle del stream y devuelve su resultado: mientras ejecutar
+        corre, solo ese hilo toca self.barras, self.symbols y los Event de asyncio (no son seguros
+        entre hilos). Sin bucle en marcha, o desde el propio bucle, la llama directamente.
+        """
+        loop = self._loop
+        if loop is None or not loop.is_running(): return funcion(*args)
+        try:
+            if asyncio.get_running_loop() is loop: return funcion(*args)
+        except RuntimeError: pass  # Otro hilo, sin bucle propio
+
+        async def llamar(): return funcion(*args)
+        return asyncio.run_coroutine_threadsafe(llamar(), loop).result()
+
+    def actualizar_simbolos(self, symbols, historial=None):
+        """
+        Sustituye los símbolos suscritos (seguro desde otros hilos: el cambio se aplica en el bucle).
+        'historial' (symbol -> velas cerradas) precarga la ventana de las altas, que si no empiezan
+        vacías; las bajas pierden la suya. Devuelve (altas, bajas).
+        """
+        return self._en_bucle(self._actualizar_simbolos, list(dict.fromkeys(symbols)), historial or {})
+
+    def _actualizar_simbolos(self, symbols, historial):
+        actuales, nuevos = set(self.symbols), set(symbols)
+        altas = [s for s in symbols if s not in actuales]
+        bajas = [s for s in self.symbols if s not in nuevos]
+        if not altas and not bajas: return altas, bajas
+        for symbol in altas: self.cargar_historial(symbol, historial.get(symbol, []))
+        for symbol in bajas: self.barras.pop(symbol, None)
+        self.symbols = symbols
+        if self._reconfigurar is not None: self._reconfigurar.set()
+        return altas, bajas
+
+    async def _conexion(self, symbols, reconexion=False):
+        espera, primera = 1, not reconexion
+        while not self._detenido.is_set():
+            try:
+                async with websockets.connect(self.url_para(symbols), ping_interval=20, ping_timeout=20) as ws:
+                    logger.info(f"Stream conectado ({len(symbols)} símbolos).")
+                    espera = 1
+                    if not primera: await self._rellenar_todos(symbols)
+                    primera = False
+                    async for raw in ws:
+                        try: await self.procesar_mensaje(raw)
+                        except Exception as e: logger.error(f"Error procesando mensaje del stream: {e}")
+                        if self._detenido.is_set(): break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Stream desconectado: {e}. Reconectando en {espera}s...")
+            if self._detenido.is_set(): break
+            primera = False
+            await asyncio.sleep(espera)
+            espera = min(espera * 2, RECONEXION_MAX_SEG)
+
+    async def ejecutar(self):
+        """
+        Abre una conexión por cada bloque de hasta MAX_STREAMS_POR_CONEXION símbolos. Si cambian los
+        símbolos (actualizar_simbolos) se cierran y se reabren con el nuevo reparto, rellenando huecos.
+        """
+        self._loop, self._reconfigurar = asyncio.get_running_loop(), asyncio.Event()
+        reconexion = False
+        while not self._detenido.is_set():
+            self._reconfigurar.clear()
+            bloques = [self.symbols[i:i + MAX_STREAMS_POR_CONEXION]
+                       for i in range(0, len(self.symbols), MAX_STREAMS_POR_CONEXION)]
+            conexiones = [asyncio.create_task(self._conexion(b, reconexion)) for b in bloques]
+            # Cambio de símbolos o detener(): no hay que esperar al siguiente mensaje de cada conexión
+            esperas = [asyncio.create_task(self._reconfigurar.wait()), asyncio.create_task(self._detenido.wait())]
+            await asyncio.wait(conexiones + esperas, return_when=asyncio.FIRST_COMPLETED)
+            for tarea in conexiones + esperas: tarea.cancel()
+            await asyncio.gather(*conexiones, *esperas, return_exceptions=True)
+            if not self._reconfigurar.is_set(): break
+            logger.info(f"Símbolos del stream actualizados ({len(self.symbols)}). Reabriendo conexiones...")
+            reconexion = True
+
+    def detener(self):
+        """Cierra las conexiones y termina ejecutar (seguro desde otros hilos)."""
+        self._en_bucle(self._detenido.set)
+
+
+# ==============================================================================
+# VERIFICACIÓN CONTRA UN SERVIDOR LOCAL
+# ==============================================================================
+
+def _mensaje_kline(symbol, open_ms, close, paso, cerrada=True):
+    k = {'t': open_ms, 'T': open_ms + paso - 1, 's': symbol, 'i': '15m', 'o': str(close), 'h': str(close + 1),
+         'l': str(close - 1), 'c': str(close), 'v': '10', 'x': cerrada}
+    return json.dumps({'stream': f"{symbol.lower()}@kline_15m", 'data': {'e': 'kline', 'E': open_ms + paso - 1, 's': symbol, 'k': k}})
+
+
+def verificar_stream_local(timeout=20):
+    """
+    StreamKlines contra un servidor websocket local (url_base): relleno por REST de un hueco dentro del
+    stream y de lo perdido durante una reconexión, y actualizar_simbolos / detener llamados desde otro hilo.
+    """
+    paso = INTERVALO_MS['15m']
+    base = (int(time.time() * 1000) // paso - 6) * paso   # t0 ... t5, con t5 la última vela cerrada
+    t = [base + i * paso for i in range(6)]
+    rest = {'BTCUSDT': [(ot, 100. + i, 101. + i, 99. + i, 100. + i, 10., ot + paso - 1) for i, ot in enumerate(t)],
+            'ETHUSDT': [(ot, 50., 51., 49., 50., 10., ot + paso - 1) for ot in t[:5]]}
+    rellenos, cierres, rutas = [], [], []
+
+    def backfill(symbol, desde_ms, hasta_ms):
+        rellenos.append((symbol, desde_ms))
+        return [v for v in rest[symbol] if desde_ms <= v[0] <= hasta_ms]
+
+    async def servidor(ws):
+        rutas.append(ws.request.path)
+        if len(rutas) == 1:
+            # Primera conexión: t0, t1 y t3 (hueco en t2) y se cae
+            for i in (0, 1, 3): await ws.send(_mensaje_kline('BTCUSDT', t[i], 100. + i, paso))
+            return
+        if 'ethusdt' in ws.request.path: await ws.send(_mensaje_kline('ETHUSDT', t[5], 50., paso))
+        await ws.wait_closed()  # Abierta hasta que el cliente la cierre
+
+    async def esperar(condicion):
+        limite = time.monotonic() + timeout
+        while not condicion():
+            if time.monotonic() > limite: raise AssertionError("Tiempo agotado esperando al stream")
+            await asyncio.sleep(0.02)
+
+    async def principal():
+        async with websockets.serve(servidor, '127.0.0.1', 0) as server:
+            puerto = next(iter(server.sockets)).getsockname()[1]
+            stream = StreamKlines(['BTCUSDT'], on_cierre=lambda symbol, ventana: cierres.append((symbol, int(ventana['open_time'].iloc[-1]))),
+                                  url_base=f"ws://127.0.0.1:{puerto}/", backfill=backfill)
+            tarea = asyncio.create_task(stream.ejecutar())
+            await esperar(lambda: stream.ultimo_open_time('BTCUSDT') == t[5])  # Tras reconectar se rellena t4 y t5
+            if stream.ventana('BTCUSDT')['open_time'].tolist() != t: raise AssertionError("Ventana con huecos tras rellenar")
+            altas, bajas = await asyncio.to_thread(stream.actualizar_simbolos, ['BTCUSDT', 'ETHUSDT'], {'ETHUSDT': rest['ETHUSDT']})
+            if (altas, bajas) != (['ETHUSDT'], []): raise AssertionError(f"actualizar_simbolos devolvió {altas}, {bajas}")
+            await esperar(lambda: ('ETHUSDT', t[5]) in cierres)
+            await asyncio.to_thread(stream.detener)
+            await asyncio.wait_for(tarea, timeout)
+        if rutas[0] != '/stream?streams=btcusdt@kline_15m' or 'ethusdt@kline_15m' not in rutas[-1]:
+            raise AssertionError(f"Rutas inesperadas: {rutas}")
+        if rellenos[:2] != [('BTCUSDT', t[2]), ('BTCUSDT', t[4])]: raise AssertionError(f"Rellenos inesperados: {rellenos}")
+        if [c for c in cierres if c[0] == 'BTCUSDT'] != [('BTCUSDT', t[i]) for i in (0, 1, 3, 5)]:
+            raise AssertionError(f"Cierres inesperados: {cierres}")
+        return len(rutas)
+
+    return asyncio.run(principal())
+
+
+if __name__ == '__main__':
+    print(f"Stream contra servidor local OK ({verificar_stream_local()} conexiones)")
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+"""
+Almacén transaccional de operaciones (SQLite en modo WAL).
+
+Sustituye a active_trades.json / closed_trades.json: abrir, actualizar o
+cerrar un trade es un INSERT/UPDATE de una fila, en lugar de reescribir los
+archivos completos. El histórico en CSV (y opcionalmente Parquet) se exporta
+de forma incremental: solo se añaden los trades cerrados que aún no se
+exportaron. Los JSON existentes se importan una sola vez.
+
+Cada cierre actualiza también, en la misma transacción, los agregados por día
+y grupo de analitica.py (acierto, esperanza... por símbolo, hora, lado y
+tramos de indicadores), así los informes no recorren el histórico.
+"""
+import csv
+import json
+import os
+import sqlite3
+import threading
+import logging
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from analitica import filas_agregado, COLUMNAS_AGREGADO
+
+logger = logging.getLogger(__name__)
+
+TRADES_DB_FILE = 'trades.db'
+
+
+def _json_default(obj):
+    if isinstance(obj, np.integer): return int(obj)
+    if isinstance(obj, np.floating): return float(obj)
+    if isinstance(obj, np.bool_): return bool(obj)
+    if isinstance(obj, (datetime, pd.Timestamp)): return obj.isoformat()
+    return str(obj)
+
+
+class TradeStore:
+    """Trades abiertos y cerrados en una tabla indexada por símbolo, estado y fecha de cierre."""
+
+    def __init__(self, path=TRADES_DB_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        # 'datos' guarda el trade completo en JSON: los campos observacionales cambian con la estrategia
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS trades (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                symbol TEXT NOT NULL, status TEXT NOT NULL, entry_type TEXT,
+                entry_date TEXT, close_date TEXT, datos TEXT NOT NULL,
+                exportado_csv INTEGER NOT NULL DEFAULT 0, exportado_parquet INTEGER NOT NULL DEFAULT 0,
+                UNIQUE (symbol, entry_date)
+            )""")
+        # Como mucho un trade abierto por símbolo (igual que el antiguo dict de active_trades)
+        self._conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_trades_abierto ON trades(symbol) WHERE status='OPEN'")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_trades_status ON trades(status, symbol)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_trades_close_date ON trades(close_date)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (clave TEXT PRIMARY KEY, valor TEXT)")
+        # Agregados de los trades cerrados por día de cierre y grupo, y los de todo el histórico (ver analitica.py)
+        columnas = ', '.join(f'{c} {"INTEGER" if c in ("n", "ganadoras", "tp", "sl") else "REAL"} NOT NULL' for c in COLUMNAS_AGREGADO)
+        self._conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS agregados (
+                dia TEXT NOT NULL, dimension TEXT NOT NULL, grupo TEXT NOT NULL, {columnas},
+                PRIMARY KEY (dia, dimension, grupo)
+            )""")
+        self._conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS agregados_total (
+                dimension TEXT NOT NULL, grupo TEXT NOT NULL, {columnas}, PRIMARY KEY (dimension, grupo)
+            )""")
+        self._conn.commit()
+        # Bases anteriores a los agregados: se calculan una vez con los cierres existentes
+        if not self._conn.execute("SELECT 1 FROM meta WHERE clave='agregados'").fetchone(): self.reconstruir_agregados()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # --------------------------------------------------------------------------
+    # Trades abiertos
+    # --------------------------------------------------------------------------
+
+    def activos(self):
+        """Trades abiertos como dict symbol -> trade (el formato del antiguo active_trades.json)."""
+        with self._lock:
+            filas = self._conn.execute("SELECT symbol, datos FROM trades WHERE status='OPEN' ORDER BY id").fetchall()
+        return {symbol: json.loads(datos) for symbol, datos in filas}
+
+    def esta_abierto(self, symbol):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM trades WHERE symbol=? AND status='OPEN'", (symbol,)).fetchone() is not None
+
+    def abrir(self, symbol, trade):
+        """Registra un trade nuevo. Devuelve False si el símbolo ya tenía uno abierto."""
+        try:
+            with self._lock, self._conn:
+                self._conn.execute(
+                    "INSERT INTO trades (symbol, status, entry_type, entry_date, datos) VALUES (?,?,?,?,?)",
+                    (symbol, trade.get('status', 'OPEN'), trade.get('entry_type'), trade.get('entry_date'),
+                     json.dumps(trade, default=_json_default)))
+            return True
+        except sqlite3.IntegrityError:
+            return False
+
+    def actualizar(self, symbol, trade):
+        """Reescribe los datos del trade abierto del símbolo (p. ej. tp1_hit)."""
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE trades SET datos=? WHERE symbol=? AND status='OPEN'",
+                               (json.dumps(trade, default=_json_default), symbol))
+
+    def cerrar(self, symbol, trade):
+        """
+        Pasa el trade abierto del símbolo a su estado de cierre ('status' y 'close_date' del propio trade)
+        y suma su resultado a los agregados. Devuelve False si el símbolo no tenía trade abierto.
+        """
+        with self._lock, self._conn:
+            cursor = self._conn.execute("UPDATE trades SET status=?, close_date=?, datos=? WHERE symbol=? AND status='OPEN'",
+                                        (trade['status'], trade.get('close_date'), json.dumps(trade, default=_json_default), symbol))
+            if not cursor.rowcount: return False
+            self._sumar_agregados(filas_agregado(symbol, trade))
+        return True
+
+    # --------------------------------------------------------------------------
+    # Agregados (analitica.py)
+    # --------------------------------------------------------------------------
+
+    def _sumar_agregados(self, filas):
+        """UPSERT de las filas (dia, dimension, grupo, *COLUMNAS_AGREGADO); dentro de la transacción del llamador."""
+        sumas = ', '.join(f'{c} = {c} + excluded.{c}' for c in COLUMNAS_AGREGADO)
+        self._conn.executemany(f"INSERT INTO agregados VALUES ({', '.join('?' * (3 + len(COLUMNAS_AGREGADO)))}) "
+                               f"ON CONFLICT (dia, dimension, grupo) DO UPDATE SET {sumas}", filas)
+        self._conn.executemany(f"INSERT INTO agregados_total VALUES ({', '.join('?' * (2 + len(COLUMNAS_AGREGADO)))}) "
+                               f"ON CONFLICT (dimension, grupo) DO UPDATE SET {sumas}", [fila[1:] for fila in filas])
+
+    def reconstruir_agregados(self):
+        """Recalcula los agregados recorriendo todos los trades cerrados (migración o reparación)."""
+        with self._lock, self._conn:
+            filas = self._conn.execute("SELECT symbol, datos FROM trades WHERE status LIKE 'CLOSED%'").fetchall()
+            self._conn.execute("DELETE FROM agregados")
+            self._conn.execute("DELETE FROM agregados_total")
+            for symbol, datos in filas: self._sumar_agregados(filas_agregado(symbol, json.loads(datos)))
+            self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('agregados', ?)", (datetime.now().isoformat(),))
+        return len(filas)
+
+    def estadisticas(self, desde=None, hasta=None, dimensiones=None):
+        """
+        {(dimension, grupo): (n, ganadoras, tp, sl, suma_pnl, ganancias, perdidas)} de los trades cerrados
+        en [desde, hasta) (días 'AAAA-MM-DD' de close_date). Solo suma filas de agregados: una por día y grupo,
+        o una por grupo sin rango de fechas (agregados_total).
+        """
+        consulta, args = ("FROM agregados WHERE 1=1" if desde or hasta else "FROM agregados_total WHERE 1=1"), []
+        if desde: consulta += " AND dia >= ?"; args.append(desde[:10])
+        if hasta: consulta += " AND dia < ?"; args.append(hasta[:10])
+        if dimensiones:
+            dimensiones = [dimensiones] if isinstance(dimensiones, str) else list(dimensiones)
+            consulta += f" AND dimension IN ({', '.join('?' * len(dimensiones))})"; args += dimensiones
+        with self._lock:
+            filas = self._conn.execute(f"SELECT dimension, grupo, {', '.join(f'SUM({c})' for c in COLUMNAS_AGREGADO)} "
+                                       f"{consulta} GROUP BY dimension, grupo", args).fetchall()
+        return {(dimension, grupo): tuple(valores) for dimension, grupo, *valores in filas}
+
+    # --------------------------------------------------------------------------
+    # Trades cerrados
+    # --------------------------------------------------------------------------
+
+    def cerrados(self, desde=None, hasta=None, symbol=None):
+        """
+        Trades cerrados (lista de dicts, orden de cierre). 'desde' / 'hasta' son prefijos ISO
+        de close_date (p. ej. '2024-05-01'); el rango es [desde, hasta).
+        """
+        consulta, args = "SELECT datos FROM trades WHERE status LIKE 'CLOSED%'", []
+        if desde: consulta += " AND close_date >= ?"; args.append(desde)
+        if hasta: consulta += " AND close_date < ?"; args.append(hasta)
+        if symbol: consulta += " AND symbol = ?"; args.append(symbol)
+        with self._lock:
+            filas = self._conn.execute(consulta + " ORDER BY close_date, id", args).fetchall()
+        return [json.loads(datos) for (datos,) in filas]
+
+    def _pendientes(self, columna):
+        with self._lock:
+            return self._conn.execute(
+                f"SELECT id, datos FROM trades WHERE status LIKE 'CLOSED%' AND {columna}=0 ORDER BY close_date, id").fetchall()
+
+    def _marcar_exportados(self, columna, ids):
+        with self._lock, self._conn:
+            self._conn.executemany(f"UPDATE trades SET {columna}=1 WHERE id=?", [(i,) for i in ids])
+
+    def exportar_csv(self, path):
+        """
+        Añade al CSV los trades cerrados aún no exportados. Si aparecen columnas que el
+        CSV no tiene, se regenera completo (mismo formato que el antiguo historico_trades.csv).
+        Devuelve cuántos trades se escribieron.
+        """
+        pendientes = self._pendientes('exportado_csv')
+        if not pendientes: return 0
+        trades = [json.loads(datos) for _, datos in pendientes]
+        cabecera = None
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, 'r', newline='') as f: cabecera = next(csv.reader(f), None)
+        columnas_nuevas = {k for t in trades for k in t} - set(cabecera or ())
+        if cabecera is None or columnas_nuevas:
+            # CSV nuevo o con columnas nuevas: se reescribe entero una sola vez
+            with self._lock:
+                todos = self._conn.execute(
+                    "SELECT id, datos FROM trades WHERE status LIKE 'CLOSED%' ORDER BY close_date, id").fetchall()
+            temp_file = path + ".tmp"
+            pd.DataFrame([json.loads(datos) for _, datos in todos]).to_csv(temp_file, index=False, mode='w')
+            os.replace(temp_file, path)
+            self._marcar_exportados('exportado_csv', [i for i, _ in todos])
+            return len(todos)
+        with open(path, 'a', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=cabecera)
+            writer.writerows(trades)
+        self._marcar_exportados('exportado_csv', [i for i, _ in pendientes])
+        return len(trades)
+
+    def exportar_parquet(self, directorio):
+        """Escribe los trades cerrados no exportados como una nueva parte Parquet del directorio (requiere pyarrow)."""
+        pendientes = self._pendientes('exportado_parquet')
+        if not pendientes: return 0
+        os.makedirs(directorio, exist_ok=True)
+        df = pd.DataFrame([json.loads(datos) for _, datos in pendientes])
+        df.to_parquet(os.path.join(directorio, f"trades-{pendientes[0][0]:08d}-{pendientes[-1][0]:08d}.parquet"), index=False)
+        self._marcar_exportados('exportado_parquet', [i for i, _ in pendientes])
+        return len(df)
+
+    # --------------------------------------------------------------------------
+    # Migración desde los JSON
+    # --------------------------------------------------------------------------
+
+    def importar_json(self, active_path, closed_path, csv_path=None):
+        """
+        Importa una sola vez active_trades.json y closed_trades.json (los archivos no se modifican).
+        Si 'csv_path' ya existe, los cerrados importados se dan por exportados (ya estaban en ese CSV).
+        """
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM meta WHERE clave='json_importado'").fetchone(): return 0
+        filas = []
+        for path, es_dict in ((closed_path, False), (active_path, True)):
+            if not os.path.exists(path) or os.path.getsize(path) == 0: continue
+            try:
+                with open(path, 'r') as f: contenido = json.load(f)
+            except json.JSONDecodeError:
+                logger.warning(f"No se pudo importar {path}: JSON inválido."); continue
+            items = contenido.items() if es_dict else ((t.get('symbol'), t) for t in contenido)
+            for symbol, t in items:
+                if not symbol: continue
+                filas.append((symbol, t.get('status', 'OPEN'), t.get('entry_type'), t.get('entry_date'),
+                              t.get('close_date'), json.dumps(t, default=_json_default)))
+        with self._lock, self._conn:
+            # Duplicados (mismo símbolo y entry_date) se ignoran, como hacía check_active_trades
+            self._conn.executemany("""INSERT OR IGNORE INTO trades (symbol, status, entry_type, entry_date, close_date, datos)
+                                      VALUES (?,?,?,?,?,?)""", filas)
+            if csv_path and os.path.exists(csv_path):
+                self._conn.execute("UPDATE trades SET exportado_csv=1 WHERE status LIKE 'CLOSED%'")
+            self._conn.execute("INSERT INTO meta VALUES ('json_importado', ?)", (datetime.now().isoformat(),))
+        if any(fila[1].startswith('CLOSED') for fila in filas): self.reconstruir_agregados()
+        if filas: logger.info(f"Importados {len(filas)} trades desde {active_path} / {closed_path}.")
+        return len(filas)
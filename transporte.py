@@ -0,0 +1,399 @@
+# -*- coding: utf-8 -*-
+"""
+Capa de transporte de la API de Binance: directo, grabación y reproducción.
+
+Los scripts (monitor_signals.py, escaneo_inicial.py, analizar_cruces.py) piden
+su cliente a cliente_binance(), que según BINANCE_TRANSPORTE devuelve:
+
+- 'directo'   : el Client de python-binance tal cual.
+- 'grabar'    : el Client envuelto en ClienteGrabador, que guarda cada llamada
+                (método, parámetros, instante y respuesta o error) en archivos
+                JSONL comprimidos por hora en BINANCE_GRABACION_DIR.
+- 'reproducir': ClienteReproductor, que responde sin red a partir de las
+                grabaciones. Las velas se sirven desde un índice por
+                (símbolo, intervalo) como una cinta de mercado: cualquier rango
+                se responde con las velas cerradas grabadas y, para la vela en
+                curso, con la versión grabada más cercana a la hora actual. El
+                resto de llamadas se indexa por método + parámetros y se sirve la
+                respuesta grabada más cercana en el tiempo.
+
+Con RelojVirtual (time.time / time.sleep / datetime.now sustituidos) se
+reproduce un día entero de ciclos de iniciar_monitoreo en segundos: el tiempo
+solo avanza cuando el bot duerme. Así se reproduce offline un incidente
+("¿por qué saltó ADAUSDT a las 14:15?"):
+
+    python transporte.py --grabacion grabaciones --desde 2024-05-01T13:00 --hasta 2024-05-01T15:00 \\
+        --estado copia_del_bot/ --salida reproduccion/
+"""
+import argparse
+import atexit
+import bisect
+import glob
+import gzip
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+import logging
+from datetime import datetime, timezone
+
+import numpy as np
+
+from kline_store import KLINES_DB_FILE
+from trade_store import TRADES_DB_FILE
+
+logger = logging.getLogger(__name__)
+
+MODOS_TRANSPORTE = ('directo', 'grabar', 'reproducir')
+GRABACION_DIR = 'grabaciones'
+METODOS_VELAS = ('futures_klines', 'futures_historical_klines')
+# Archivos de estado del bot que se copian al directorio de la reproducción (ver --estado);
+# los JSON son PIVOTS_FILE y SYMBOLS_FILE de monitor_signals.py
+ARCHIVOS_ESTADO = (KLINES_DB_FILE, TRADES_DB_FILE, 'daily_pivots.json', 'top_100_symbols.json')
+
+
+def _clave_parametros(args, kwargs):
+    parametros = dict(kwargs)
+    if args: parametros['_args'] = list(args)
+    return json.dumps(parametros, sort_keys=True, default=str)
+
+
+def _ms(valor):
+    """Milisegundos de un parámetro de tiempo de la API (entero o fecha en texto)."""
+    if valor is None: return None
+    if isinstance(valor, (int, float)) or str(valor).lstrip('-').isdigit(): return int(valor)
+    from binance.helpers import date_to_milliseconds
+    return date_to_milliseconds(valor)
+
+# ==============================================================================
+# 1. GRABACIÓN
+# ==============================================================================
+
+class ClienteGrabador:
+    """
+    Envuelve un Client y añade cada llamada a '{origen}_{AAAAMMDD_HH}_{pid}.jsonl.gz' (hora UTC)
+    en 'directorio'. Un archivo por proceso: si uno muere a mitad de escritura no afecta a otros.
+    """
+
+    def __init__(self, client, directorio=GRABACION_DIR, origen='bot'):
+        self._client = client
+        self.directorio, self.origen = directorio, origen
+        os.makedirs(directorio, exist_ok=True)
+        self._lock = threading.Lock()
+        self._archivo, self._nombre = None, None
+        atexit.register(self.cerrar)
+
+    def _escribir(self, registro):
+        nombre = os.path.join(self.directorio, f"{self.origen}_{time.strftime('%Y%m%d_%H', time.gmtime(registro['t'] / 1000))}_{os.getpid()}.jsonl.gz")
+        try: linea = json.dumps(registro, separators=(',', ':')) + "\n"
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Respuesta de {registro['metodo']} no serializable, no se graba: {e}")
+            return
+        with self._lock:
+            if nombre != self._nombre:
+                if self._archivo: self._archivo.close()
+                self._archivo, self._nombre = gzip.open(nombre, 'ab', compresslevel=5), nombre
+            self._archivo.write(linea.encode())
+            self._archivo.flush()  # Cada registro queda legible aunque el proceso muera
+
+    def cerrar(self):
+        with self._lock:
+            if self._archivo: self._archivo.close()
+            self._archivo, self._nombre = None, None
+
+    def __getattr__(self, nombre):
+        atributo = getattr(self._client, nombre)
+        if not callable(atributo) or nombre.startswith('_'):
+            return atributo
+
+        def llamada(*args, **kwargs):
+            registro = {'metodo': nombre, 'params': json.loads(_clave_parametros(args, kwargs))}
+            try:
+                resultado = atributo(*args, **kwargs)
+                registro['respuesta'] = resultado
+                return resultado
+            except Exception as e:
+                registro['error'] = {'tipo': type(e).__name__, 'mensaje': str(e)}
+                raise
+            finally:
+                registro['t'] = int(time.time() * 1000)
+                self._escribir(registro)
+        return llamada
+
+
+def leer_grabacion(rutas):
+    """Registros de los archivos (o directorios) de grabación, ordenados por instante."""
+    archivos = []
+    for ruta in ([rutas] if isinstance(rutas, str) else rutas):
+        archivos += sorted(glob.glob(os.path.join(ruta, '*.jsonl.gz'))) if os.path.isdir(ruta) else [ruta]
+    registros = []
+    for archivo in archivos:
+        try:
+            with gzip.open(archivo, 'rt') as f:
+                for linea in f:
+                    if linea.strip(): registros.append(json.loads(linea))
+        except (EOFError, OSError, json.JSONDecodeError) as e:
+            # Último registro truncado (proceso terminado a mitad de escritura)
+            logger.warning(f"Grabación {archivo} incompleta: {e}")
+    registros.sort(key=lambda r: r['t'])
+    return registros
+
+# ==============================================================================
+# 2. REPRODUCCIÓN
+# ==============================================================================
+
+class RespuestaNoGrabada(KeyError):
+    """La reproducción recibió una llamada que no está en la grabación."""
+
+
+class ErrorGrabado(Exception):
+    """Error que devolvió la API durante la grabación, relanzado en la reproducción."""
+
+
+class _CintaVelas:
+    """Velas grabadas de un (símbolo, intervalo): la versión final de cada vela cerrada y las parciales."""
+
+    def __init__(self):
+        self.finales = {}    # open_time -> fila grabada después del cierre de la vela
+        self.parciales = {}  # open_time -> [(t, fila)] grabadas con la vela aún abierta
+        self.open_times = None
+
+    def agregar(self, t, fila):
+        open_time = int(fila[0])
+        if int(fila[6]) < t: self.finales.setdefault(open_time, fila)
+        else: self.parciales.setdefault(open_time, []).append((t, fila))
+
+    def indexar(self):
+        self.open_times = np.array(sorted(set(self.finales) | set(self.parciales)), dtype=np.int64)
+        for versiones in self.parciales.values(): versiones.sort(key=lambda v: v[0])
+
+    def _version(self, open_time, ahora_ms):
+        fila = self.finales.get(open_time)
+        if fila is not None and int(fila[6]) < ahora_ms: return fila
+        versiones = self.parciales.get(open_time)
+        if not versiones: return fila
+        # Vela en curso: la versión grabada más cercana a la hora actual
+        tiempos = [v[0] for v in versiones]
+        i = bisect.bisect_left(tiempos, ahora_ms)
+        if i == len(versiones) or (i > 0 and ahora_ms - tiempos[i - 1] <= tiempos[i] - ahora_ms): i -= 1
+        return versiones[i][1]
+
+    def rango(self, inicio_ms, fin_ms, limite, ahora_ms):
+        fin_ms = min(fin_ms if fin_ms is not None else ahora_ms, ahora_ms)
+        a = 0 if inicio_ms is None else int(np.searchsorted(self.open_times, inicio_ms, 'left'))
+        b = int(np.searchsorted(self.open_times, fin_ms, 'right'))
+        # Sin startTime la API devuelve las últimas 'limite' velas hasta endTime
+        a, b = (a, min(b, a + limite)) if inicio_ms is not None else (max(a, b - limite), b)
+        return [self._version(int(ot), ahora_ms) for ot in self.open_times[a:b]]
+
+
+class ClienteReproductor:
+    """
+    Responde las llamadas del Client desde una grabación, sin red. 'reloj' da la hora de
+    la reproducción (por defecto time.time, que RelojVirtual sustituye).
+    """
+
+    def __init__(self, rutas, reloj=None):
+        self.reloj = reloj
+        self.response = None
+        self.servidas = self.no_grabadas = 0
+        self._cintas = {}      # (symbol, interval) -> _CintaVelas
+        self._respuestas = {}  # (metodo, parámetros) -> ([t], [registro])
+        registros = leer_grabacion(rutas)
+        self.primer_ms = registros[0]['t'] if registros else None
+        self.ultimo_ms = registros[-1]['t'] if registros else None
+        for r in registros:
+            if r['metodo'] in METODOS_VELAS and 'respuesta' in r:
+                p = r['params']
+                cinta = self._cintas.setdefault((p.get('symbol'), p.get('interval')), _CintaVelas())
+                for fila in r['respuesta']: cinta.agregar(r['t'], fila)
+            else:
+                tiempos, lista = self._respuestas.setdefault((r['metodo'], _clave_parametros((), r['params'])), ([], []))
+                tiempos.append(r['t']); lista.append(r)
+        for cinta in self._cintas.values(): cinta.indexar()
+        logger.info(f"Grabación cargada: {len(registros)} llamadas, {len(self._cintas)} series de velas")
+
+    def ahora_ms(self):
+        # time.time se resuelve en cada llamada: RelojVirtual puede instalarse después de cargar la grabación
+        return int((self.reloj or time.time)() * 1000)
+
+    def _velas(self, symbol, interval, inicio, fin, limite):
+        cinta = self._cintas.get((symbol, interval))
+        if cinta is None:
+            self.no_grabadas += 1
+            raise RespuestaNoGrabada(f"Sin velas grabadas de {symbol} {interval}")
+        self.servidas += 1
+        return cinta.rango(_ms(inicio), _ms(fin), int(limite), self.ahora_ms())
+
+    def futures_klines(self, symbol=None, interval=None, startTime=None, endTime=None, limit=500, **kwargs):
+        return self._velas(symbol, interval, startTime, endTime, limit)
+
+    def futures_historical_klines(self, symbol, interval, start_str=None, end_str=None, limit=1000, **kwargs):
+        return self._velas(symbol, interval, start_str, end_str, 10 ** 9)
+
+    def futures_time(self):
+        return {'serverTime': self.ahora_ms()}
+
+    def _respuesta(self, metodo, args, kwargs):
+        entrada = self._respuestas.get((metodo, _clave_parametros(args, kwargs)))
+        if entrada is None:
+            self.no_grabadas += 1
+            raise RespuestaNoGrabada(f"Llamada no grabada: {metodo}({_clave_parametros(args, kwargs)})")
+        # La respuesta grabada más cercana en el tiempo a la hora de la reproducción
+        tiempos, registros = entrada
+        ahora = self.ahora_ms()
+        i = bisect.bisect_left(tiempos, ahora)
+        if i == len(tiempos) or (i > 0 and ahora - tiempos[i - 1] <= tiempos[i] - ahora): i -= 1
+        registro = registros[i]
+        self.servidas += 1
+        if 'error' in registro:
+            raise ErrorGrabado(f"{registro['error']['tipo']}: {registro['error']['mensaje']}")
+        return registro['respuesta']
+
+    def __getattr__(self, nombre):
+        if nombre.startswith('_'): raise AttributeError(nombre)
+        return lambda *args, **kwargs: self._respuesta(nombre, args, kwargs)
+
+
+_reproductores = {}
+
+
+def cliente_binance(api_key=None, api_secret=None, requests_params=None, modo='directo',
+                    directorio=GRABACION_DIR, origen='bot'):
+    """Client de python-binance según el modo de transporte ('directo', 'grabar' o 'reproducir')."""
+    if modo not in MODOS_TRANSPORTE:
+        raise ValueError(f"Modo de transporte desconocido: {modo} (válidos: {', '.join(MODOS_TRANSPORTE)})")
+    if modo == 'reproducir':
+        # Una sola carga de la grabación por proceso y directorio
+        if directorio not in _reproductores: _reproductores[directorio] = ClienteReproductor(directorio)
+        return _reproductores[directorio]
+    import binance.client
+    client = binance.client.Client(api_key, api_secret, requests_params)
+    if modo == 'grabar':
+        logger.info(f"Grabando las respuestas de la API en {directorio}/")
+        return ClienteGrabador(client, directorio, origen)
+    return client
+
+# ==============================================================================
+# 3. RELOJ VIRTUAL Y REPRODUCCIÓN DEL MONITOREO
+# ==============================================================================
+
+class FinReproduccion(BaseException):
+    """El reloj virtual llegó al final: como KeyboardInterrupt, no lo captura un 'except Exception'."""
+
+
+class RelojVirtual:
+    """
+    Sustituye time.time / time.time_ns / time.sleep (y datetime.now en los módulos indicados):
+    el tiempo solo avanza al dormir, así que los ciclos se encadenan a velocidad de CPU.
+    """
+
+    def __init__(self, inicio_s, fin_s=None):
+        self.ahora, self.fin = float(inicio_s), fin_s
+        self._originales = []
+
+    def time(self):
+        return self.ahora
+
+    def time_ns(self):
+        return int(self.ahora * 1e9)
+
+    def sleep(self, segundos):
+        if self.fin is not None and self.ahora + max(0.0, segundos) > self.fin: raise FinReproduccion()
+        self.ahora += max(0.0, segundos)
+
+    def instalar(self, *modulos):
+        reloj = self
+
+        class DatetimeVirtual(datetime):
+            @classmethod
+            def now(cls, tz=None): return datetime.fromtimestamp(reloj.ahora, tz)
+
+            @classmethod
+            def utcnow(cls): return datetime.fromtimestamp(reloj.ahora, timezone.utc).replace(tzinfo=None)
+
+        for objeto, nombre, valor in [(time, 'time', self.time), (time, 'time_ns', self.time_ns), (time, 'sleep', self.sleep)] + \
+                [(m, 'datetime', DatetimeVirtual) for m in modulos if getattr(m, 'datetime', None) is datetime]:
+            self._originales.append((objeto, nombre, getattr(objeto, nombre)))
+            setattr(objeto, nombre, valor)
+        return self
+
+    def desinstalar(self):
+        for objeto, nombre, valor in reversed(self._originales): setattr(objeto, nombre, valor)
+        self._originales = []
+
+
+def _fecha_ms(texto):
+    dt = datetime.fromisoformat(texto)
+    if dt.tzinfo is None: dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1000)
+
+
+def reproducir_monitoreo(grabacion, salida, desde_ms=None, hasta_ms=None, estado=None):
+    """
+    Ejecuta iniciar_monitoreo de monitor_signals.py en 'salida' contra la grabación, con
+    el reloj virtual de desde_ms a hasta_ms (por defecto, todo lo grabado). 'estado' es un
+    directorio con una copia de los archivos del bot (ARCHIVOS_ESTADO) al inicio del periodo.
+    Devuelve un resumen con los trades abiertos y cerrados en la reproducción.
+    """
+    grabacion, salida = os.path.abspath(grabacion), os.path.abspath(salida)
+    os.makedirs(salida, exist_ok=True)
+    if estado:
+        for nombre in ARCHIVOS_ESTADO:
+            if os.path.exists(os.path.join(estado, nombre)): shutil.copy2(os.path.join(estado, nombre), salida)
+    # La misma instancia que usará monitor_signals (este archivo puede ejecutarse como __main__)
+    from transporte import cliente_binance as cliente_compartido
+    reproductor = cliente_compartido(modo='reproducir', directorio=grabacion)
+    if reproductor.primer_ms is None: raise ValueError(f"No hay grabaciones en {grabacion}")
+    desde_ms = desde_ms or reproductor.primer_ms
+    hasta_ms = hasta_ms or reproductor.ultimo_ms
+
+    # Sin monitor rápido de salidas: su hilo no sigue el reloj virtual (solo se reproducen los ciclos)
+    os.environ.update(BINANCE_TRANSPORTE='reproducir', BINANCE_GRABACION_DIR=grabacion, TELEGRAM_BOT_TOKEN='',
+                      METRICAS_PUERTO='', SALIDAS_INTERVALO_SEG='0')
+    directorio_previo = os.getcwd()
+    os.chdir(salida)
+    reloj = RelojVirtual(desde_ms / 1000, hasta_ms / 1000).instalar()
+    t0 = time.perf_counter()
+    try:
+        import monitor_signals
+        reloj.instalar(monitor_signals)
+        from limitador_api import LimitadorPeso
+        # El peso de la API se midió al grabar: en la reproducción no se limita
+        monitor_signals.client.limitador = LimitadorPeso(10 ** 9)
+        try: monitor_signals.iniciar_monitoreo()
+        except FinReproduccion: pass
+        trades = monitor_signals.trade_store.cerrados() + \
+            [dict(trade, symbol=symbol) for symbol, trade in monitor_signals.trade_store.activos().items()]
+    finally:
+        reloj.desinstalar()
+        os.chdir(directorio_previo)
+    return {'desde': desde_ms, 'hasta': hasta_ms, 'segundos': time.perf_counter() - t0,
+            'servidas': reproductor.servidas, 'no_grabadas': reproductor.no_grabadas, 'trades': trades}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reproduce offline los ciclos de monitoreo a partir de una grabación de la API.")
+    parser.add_argument('--grabacion', default=GRABACION_DIR, help="directorio con los .jsonl.gz grabados")
+    parser.add_argument('--desde', default=None, help="inicio (ISO, UTC); por defecto la primera llamada grabada")
+    parser.add_argument('--hasta', default=None, help="fin (ISO, UTC); por defecto la última llamada grabada")
+    parser.add_argument('--estado', default=None, help="directorio con la copia de los archivos del bot al inicio")
+    parser.add_argument('--salida', default='reproduccion', help="directorio de trabajo de la reproducción")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    r = reproducir_monitoreo(args.grabacion, args.salida, _fecha_ms(args.desde) if args.desde else None,
+                             _fecha_ms(args.hasta) if args.hasta else None, args.estado)
+    desde, hasta = (datetime.fromtimestamp(r[k] / 1000, timezone.utc).strftime('%Y-%m-%d %H:%M') for k in ('desde', 'hasta'))
+    print(f"\n✅ Reproducción {desde} -> {hasta} UTC en {r['segundos']:.1f}s "
+          f"({r['servidas']} respuestas servidas, {r['no_grabadas']} llamadas sin grabar)")
+    for t in sorted(r['trades'], key=lambda t: t.get('entry_date') or ''):
+        print(f"  {t.get('entry_date', '')[:16]} {t.get('symbol', ''):<14} {t.get('entry_type', ''):<5} "
+              f"{t.get('status', ''):<10} entrada {t.get('entry_price')}")
+    print(f"Log de la reproducción: {os.path.join(args.salida, 'bot_activity.log')}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
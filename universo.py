@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Universo de símbolos ordenado por liquidez y volatilidad, con niveles de escaneo.
+
+A partir de las estadísticas de 24 h de futures_ticker (una sola petición) se
+descartan los pares poco líquidos (volumen en USDT por debajo del mínimo) y los
+que quedan se puntúan combinando el percentil de volumen y el de volatilidad
+(rango máximo-mínimo de 24 h relativo al precio). Los mejores forman el nivel
+'activo' (se escanean en cada vela); el resto, el nivel 'latente', se escanea
+una vela de cada CADENCIA_LATENTE, escalonado por símbolo para repartir la
+carga entre velas. Al escanear un latente se buscan cruces en todas las velas
+desde su escaneo anterior (barras_a_revisar), así que no se pierde ninguno.
+Cada re-escaneo informa de altas, bajas y cambios de nivel.
+
+UNIVERSO_FILE guarda el detalle por símbolo; SYMBOLS_FILE sigue siendo la lista
+ordenada que leen monitor_signals.py, backtest.py y optimizador.py.
+"""
+import json
+import os
+import time
+import zlib
+import logging
+from datetime import datetime, timezone
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+UNIVERSO_FILE = 'universo.json'
+SYMBOLS_FILE = 'top_100_symbols.json'
+MAX_SIMBOLOS = 200
+MIN_VOLUMEN_USDT = 10_000_000   # Volumen de 24 h mínimo para entrar al universo
+PESO_VOLUMEN = 0.7              # Peso del percentil de volumen en la puntuación (el resto, volatilidad)
+SIMBOLOS_ACTIVOS = 60           # Los mejor puntuados se escanean en cada vela
+CADENCIA_LATENTE = 4            # Los demás, una vela de cada 4 (una vez por hora en M15)
+NIVELES = ('activo', 'latente')
+
+
+def _percentil(valores):
+    """Percentil (0-1) de cada valor dentro del vector (empates: orden de aparición)."""
+    if len(valores) < 2: return np.ones(len(valores))
+    return np.argsort(np.argsort(valores, kind='stable'), kind='stable') / (len(valores) - 1)
+
+
+def clasificar(tickers, max_simbolos=MAX_SIMBOLOS, min_volumen=MIN_VOLUMEN_USDT,
+               n_activos=SIMBOLOS_ACTIVOS, peso_volumen=PESO_VOLUMEN):
+    """
+    symbol -> {'nivel', 'puntuacion', 'volumen_usdt', 'volatilidad', 'posicion'} de los
+    'max_simbolos' perpetuos USDT mejor puntuados, en orden de puntuación.
+    """
+    candidatos = []
+    for t in tickers:
+        symbol = t.get('symbol', '')
+        # Solo perpetuos contra USDT (los trimestrales llevan '_AAMMDD')
+        if not symbol.endswith('USDT') or '_' in symbol: continue
+        try:
+            volumen, ultimo = float(t['quoteVolume']), float(t['lastPrice'])
+            rango = (float(t['highPrice']) - float(t['lowPrice'])) / ultimo if ultimo > 0 else 0.0
+        except (KeyError, TypeError, ValueError): continue
+        if volumen >= min_volumen and ultimo > 0: candidatos.append((symbol, volumen, rango))
+    if not candidatos: return {}
+    volumen = np.array([c[1] for c in candidatos]); volatilidad = np.array([c[2] for c in candidatos])
+    puntuacion = peso_volumen * _percentil(volumen) + (1 - peso_volumen) * _percentil(volatilidad)
+    orden = np.argsort(-puntuacion, kind='stable')[:max_simbolos]
+    return {candidatos[i][0]: {'nivel': NIVELES[0] if posicion < n_activos else NIVELES[1],
+                               'puntuacion': round(float(puntuacion[i]), 4),
+                               'volumen_usdt': round(float(volumen[i]), 2),
+                               'volatilidad': round(float(volatilidad[i]), 4), 'posicion': posicion + 1}
+            for posicion, i in enumerate(orden)}
+
+
+def diferencias(previo, nuevo):
+    """Altas, bajas y cambios de nivel entre dos universos (dicts symbol -> info)."""
+    previo = previo or {}
+    return {'altas': [s for s in nuevo if s not in previo],
+            'bajas': [s for s in previo if s not in nuevo],
+            'cambios_nivel': [(s, previo[s]['nivel'], info['nivel']) for s, info in nuevo.items()
+                              if s in previo and previo[s]['nivel'] != info['nivel']]}
+
+
+def resumen_diferencias(dif):
+    partes = []
+    if dif['altas']: partes.append(f"+{len(dif['altas'])} ({', '.join(dif['altas'][:10])}{'...' if len(dif['altas']) > 10 else ''})")
+    if dif['bajas']: partes.append(f"-{len(dif['bajas'])} ({', '.join(dif['bajas'][:10])}{'...' if len(dif['bajas']) > 10 else ''})")
+    if dif['cambios_nivel']: partes.append(f"{len(dif['cambios_nivel'])} cambios de nivel")
+    return " | ".join(partes) if partes else "sin cambios"
+
+
+def cargar(path=UNIVERSO_FILE):
+    """{'fecha': ISO, 'simbolos': {symbol: info}} o None si no existe o no se puede leer."""
+    if not os.path.exists(path): return None
+    try:
+        with open(path, 'r') as f: universo = json.load(f)
+        return universo if universo.get('simbolos') else None
+    except (json.JSONDecodeError, OSError, AttributeError) as e:
+        logger.warning(f"No se pudo leer el universo de {path}: {e}")
+        return None
+
+
+def guardar(simbolos, path=UNIVERSO_FILE, symbols_file=SYMBOLS_FILE):
+    """Escribe el universo y la lista ordenada de símbolos (escritura atómica). Devuelve el universo guardado."""
+    universo = {'fecha': datetime.now(timezone.utc).isoformat(), 'simbolos': simbolos}
+    for destino, contenido in ((path, universo), (symbols_file, list(simbolos))):
+        temp_file = destino + ".tmp"
+        with open(temp_file, 'w') as f: json.dump(contenido, f, indent=1)
+        os.replace(temp_file, destino)
+    return universo
+
+
+def antiguedad_horas(universo):
+    if not universo or not universo.get('fecha'): return float('inf')
+    try: fecha = datetime.fromisoformat(universo['fecha'])
+    except ValueError: return float('inf')
+    return (datetime.now(timezone.utc) - fecha).total_seconds() / 3600
+
+
+def escanear(client, previo=None, path=UNIVERSO_FILE, symbols_file=SYMBOLS_FILE, **opciones):
+    """
+    Re-escanea el universo con una sola llamada a futures_ticker, lo guarda y devuelve
+    (universo, diferencias con 'previo'). Si no queda ningún símbolo no se sobrescribe nada.
+    """
+    t0 = time.perf_counter()
+    simbolos = clasificar(client.futures_ticker(), **opciones)
+    if not simbolos: raise ValueError("Ningún par USDT supera el filtro de liquidez")
+    dif = diferencias((previo or {}).get('simbolos'), simbolos)
+    universo = guardar(simbolos, path, symbols_file)
+    niveles = {n: sum(1 for i in simbolos.values() if i['nivel'] == n) for n in NIVELES}
+    logger.info(f"Universo: {len(simbolos)} símbolos ({', '.join(f'{v} {k}' for k, v in niveles.items())}) "
+                f"en {time.perf_counter() - t0:.1f}s. Cambios: {resumen_diferencias(dif)}")
+    return universo, dif
+
+
+def toca_escanear(symbol, info, cierre_ms, paso_ms, cadencia=CADENCIA_LATENTE):
+    """
+    Si el símbolo se escanea en la vela que cerró en 'cierre_ms'. Activos (o sin datos de
+    universo): siempre. Latentes: una vela de cada 'cadencia', con una fase fija por símbolo.
+    """
+    if info is None or info.get('nivel') != 'latente' or cadencia <= 1 or cierre_ms is None: return True
+    return (cierre_ms // paso_ms + zlib.crc32(symbol.encode())) % cadencia == 0
+
+
+def barras_a_revisar(info, cadencia=CADENCIA_LATENTE):
+    """Velas cerradas desde el escaneo anterior del símbolo: 1 los activos; 'cadencia' los latentes."""
+    if info is None or info.get('nivel') != 'latente' or cadencia <= 1: return 1
+    return cadencia
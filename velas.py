@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Velas en arrays estructurados de NumPy (sin DataFrames intermedios).
+
+- decodificar_klines convierte la respuesta cruda de la API (listas de 12
+  campos, precios como texto) directamente en un array estructurado int64 /
+  float64 con solo las 7 columnas que usa el bot; las otras 5 ni se leen.
+  El parseo recorre cada columna en C (map + fromiter), sin tuplas por vela.
+- AnilloVelas guarda las últimas N velas de un símbolo en un búfer
+  preasignado: añadir una vela no realoca nada y la ventana es una vista
+  contigua del búfer (sin copias), en ~56 bytes por vela frente a los ~300
+  de una tupla de objetos Python.
+"""
+from collections import deque
+from operator import itemgetter
+
+import numpy as np
+import pandas as pd
+
+# Columnas OHLCV del bot (kline_store.COLUMNAS_OHLCV sale de aquí)
+DTYPE_VELA = np.dtype([('open_time', 'i8'), ('Open', 'f8'), ('High', 'f8'), ('Low', 'f8'),
+                       ('Close', 'f8'), ('Volume', 'f8'), ('close_time', 'i8')])
+# Columna de la respuesta de la API de cada campo (las 5 restantes se ignoran)
+_CAMPOS_API = [(nombre, posicion, int if DTYPE_VELA[nombre].kind == 'i' else float)
+               for posicion, nombre in enumerate(DTYPE_VELA.names)]
+
+
+def decodificar_klines(klines, out=None):
+    """
+    Klines crudas de la API (o filas ot, o, h, l, c, v, ct) -> array estructurado DTYPE_VELA.
+    Con 'out' (array DTYPE_VELA de tamaño suficiente) se escribe en él y se devuelve la vista usada.
+    """
+    n = len(klines)
+    out = np.empty(n, dtype=DTYPE_VELA) if out is None else out[:n]
+    for nombre, posicion, convertir in _CAMPOS_API:
+        out[nombre] = np.fromiter(map(convertir, map(itemgetter(posicion), klines)), DTYPE_VELA[nombre], n)
+    return out
+
+
+def como_velas(velas):
+    """Array DTYPE_VELA a partir de un array ya estructurado o de filas (ot, o, h, l, c, v, ct, ...)."""
+    if isinstance(velas, np.ndarray) and velas.dtype == DTYPE_VELA: return velas
+    return decodificar_klines(velas if isinstance(velas, (list, tuple)) else list(velas))
+
+
+def a_dataframe(velas):
+    """DataFrame OHLCV (columnas COLUMNAS_OHLCV) de un array DTYPE_VELA, con columnas propias (no comparte memoria)."""
+    return pd.DataFrame({c: velas[c].copy() for c in DTYPE_VELA.names}, copy=False)
+
+
+class AnilloVelas:
+    """
+    Últimas 'capacidad' velas de un símbolo en un búfer preasignado de 2 x capacidad.
+    Cada vela se escribe en la posición p y en p + capacidad, así la ventana en orden
+    cronológico es siempre un slice contiguo del búfer (vista sin copia).
+    """
+
+    def __init__(self, capacidad):
+        self.capacidad = capacidad
+        self._buf = np.zeros(2 * capacidad, dtype=DTYPE_VELA)
+        self._pos = 0  # Próxima posición de escritura (0..capacidad-1)
+        self._n = 0
+
+    def __len__(self):
+        return self._n
+
+    def extender(self, velas):
+        """Añade velas (array DTYPE_VELA o filas) al final; si no caben se conservan las más recientes."""
+        velas = como_velas(velas)[-self.capacidad:]
+        k = len(velas)
+        if not k: return
+        idx = (self._pos + np.arange(k)) % self.capacidad
+        self._buf[idx] = velas
+        self._buf[idx + self.capacidad] = velas
+        self._pos = (self._pos + k) % self.capacidad
+        self._n = min(self._n + k, self.capacidad)
+
+    def ventana(self):
+        """Vista (sin copia) de las velas guardadas en orden cronológico. Deja de ser válida al añadir más."""
+        fin = self._pos + self.capacidad if self._n == self.capacidad else self._pos
+        return self._buf[fin - self._n:fin]
+
+    def ultimo_open_time(self):
+        # Con _pos = 0, _buf[-1] es la copia de la última posición
+        return int(self._buf['open_time'][self._pos - 1]) if self._n else None
+
+
+def verificar_paridad(n_velas=3000, capacidad=250, semilla=0):
+    """Compara decodificar_klines con el parseo fila a fila y AnilloVelas con un deque(maxlen)."""
+    rng = np.random.default_rng(semilla)
+    precios = rng.uniform(0.0001, 70000, (n_velas, 5))
+    klines = [[1_700_000_000_000 + i * 900_000, *(f"{p:.8g}" for p in fila), 1_700_000_000_000 + i * 900_000 + 899_999,
+               "0", 100, "0", "0", "0"] for i, fila in enumerate(precios)]
+    esperado = [(int(k[0]), float(k[1]), float(k[2]), float(k[3]), float(k[4]), float(k[5]), int(k[6])) for k in klines]
+    decodificado = decodificar_klines(klines)
+    if decodificado.tolist() != esperado: raise AssertionError("decodificar_klines difiere del parseo fila a fila")
+
+    anillo, referencia, i = AnilloVelas(capacidad), deque(maxlen=capacidad), 0
+    while i < n_velas:
+        k = int(rng.choice([1, 1, 1, 3, capacidad // 2, capacidad + 7]))
+        anillo.extender(decodificado[i:i + k]); referencia.extend(esperado[i:i + k]); i += k
+        if anillo.ventana().tolist() != list(referencia): raise AssertionError(f"AnilloVelas difiere tras {i} velas")
+        if anillo.ultimo_open_time() != referencia[-1][0]: raise AssertionError("ultimo_open_time incorrecto")
+    return n_velas
+
+
+if __name__ == '__main__':
+    print(f"Paridad decodificador y anillo de velas OK ({verificar_paridad()} velas)")